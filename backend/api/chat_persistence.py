@@ -0,0 +1,187 @@
+"""
+Persistence of chat messages sent over the WebSocket.
+
+With the default 'sync' mode, ChatConsumer saves every message before it is
+broadcast, so the room waits for an INSERT (through the database thread pool)
+per message. The 'write_behind' mode broadcasts a message right away, with a
+client_id (generated by the client, or by the server) identifying it, and
+hands it to an in-process buffer that saves the buffered messages with one
+bulk_create every BATCH_SIZE messages or FLUSH_INTERVAL seconds:
+
+    CHAT_MESSAGE_PERSISTENCE = {
+        'MODE': 'write_behind',
+        'BATCH_SIZE': 100,
+        'FLUSH_INTERVAL': 0.05,  # seconds
+    }
+
+Delivery to the database is at least once: a failed flush keeps its messages
+for the next one, and the messages still buffered when the process exits are
+saved by an atexit handler. client_id is unique per sender, so saving a
+message twice (or a message resent by the client to the same conversation)
+is ignored. A client_id the sender already used in another conversation is
+replaced, the message is saved under a new one. The stored created_at is the
+time of the flush, at most FLUSH_INTERVAL after the broadcast one.
+"""
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import uuid
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.dispatch import receiver
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'MODE': 'sync',
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 0.05,
+}
+
+
+def get_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'CHAT_MESSAGE_PERSISTENCE', {})}
+
+
+def is_write_behind():
+    return get_config()['MODE'] == 'write_behind'
+
+
+def get_conversation(message):
+    """The conversation of a message: a message resent by its sender has the same client_id and conversation"""
+    return message.group_id, message.recipient_id
+
+
+def resolve_client_ids(messages):
+    """
+    Drop the messages that were resent (already saved, or twice in `messages`),
+    and give a new client_id to those whose sender used theirs in another
+    conversation. One query, on the (sender, client_id) constraint.
+    """
+    saved = {
+        (sender_id, client_id): (group_id, recipient_id)
+        for sender_id, client_id, group_id, recipient_id in Message.objects.filter(
+            sender_id__in={message.sender_id for message in messages},
+            client_id__in={message.client_id for message in messages}
+        ).values_list('sender_id', 'client_id', 'group_id', 'recipient_id')
+    }
+    
+    resolved = []
+    for message in messages:
+        conversation = saved.get((message.sender_id, message.client_id))
+        if conversation == get_conversation(message):
+            continue
+        if conversation is not None:
+            message.client_id = uuid.uuid4()
+        saved[(message.sender_id, message.client_id)] = get_conversation(message)
+        resolved.append(message)
+    return resolved
+
+
+class MessageWriteBuffer:
+    """Buffers unsaved Message instances and saves them in batches"""
+
+    def __init__(self, batch_size=100, flush_interval=0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_task = None
+        self.saved = 0
+
+    async def add(self, message):
+        """Buffer a message, flushing when the batch is full or after the flush interval"""
+        with self._lock:
+            self.pending.append(message)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            # The messages are kept, try again later
+            logger.error(f"Chat message flush failed, retrying: {str(e)}")
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def flush(self):
+        return await database_sync_to_async(self.flush_sync)()
+
+    def flush_sync(self):
+        """Save the buffered messages. Returns the number of messages written."""
+        with self._lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+
+        try:
+            messages = resolve_client_ids(batch)
+            with transaction.atomic():
+                Message.objects.bulk_create(messages, ignore_conflicts=True)
+        except IntegrityError:
+            # A message refers to a row deleted meanwhile (e.g. its group),
+            # save the others one by one
+            for message in messages:
+                try:
+                    with transaction.atomic():
+                        Message.objects.bulk_create([message], ignore_conflicts=True)
+                except IntegrityError as e:
+                    logger.error(f"Dropping chat message {message.client_id}: {str(e)}")
+        except Exception:
+            with self._lock:
+                self.pending = batch + self.pending
+            raise
+
+        self.saved += len(messages)
+        return len(messages)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_message_buffer():
+    """Get the message buffer of this process, created lazily (and again after a fork)"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None or _buffer.pid != os.getpid():
+            config = get_config()
+            _buffer = MessageWriteBuffer(
+                batch_size=config['BATCH_SIZE'],
+                flush_interval=config['FLUSH_INTERVAL'],
+            )
+        return _buffer
+
+
+@atexit.register
+def flush_on_exit():
+    """Save the messages still buffered when the process exits"""
+    buffer = _buffer
+    if buffer is None or buffer.pid != os.getpid() or not buffer.pending:
+        return
+    try:
+        saved = buffer.flush_sync()
+        logger.info(f"Saved {saved} buffered chat message(s) on exit")
+    except Exception as e:
+        logger.error(f"Could not save {len(buffer.pending)} buffered chat message(s) on exit: {str(e)}")
+
+
+@receiver(setting_changed)
+def reset_message_buffer(setting, **kwargs):
+    """Rebuild the buffer when the settings change (e.g. in tests)"""
+    global _buffer
+    if setting == 'CHAT_MESSAGE_PERSISTENCE':
+        with _buffer_lock:
+            _buffer = None
@@ -1,14 +1,38 @@
+import asyncio
 import json
+import uuid
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .chat_persistence import get_conversation, get_message_buffer, is_write_behind
+from .metrics import chat_metrics
 from .models import Message, MessageGroup
-from .serializers import MessageSerializer
+from .presence import get_config as get_presence_config, get_presence_engine
+from .serializers import GroupMessageSerializer
+from .typing_indicator import allow_typing_start, get_config as get_typing_config
 
 User = get_user_model()
 
+
+def get_user_group_name(user_id):
+    """Channel layer group of all the chat connections of a user, for control messages"""
+    return f'chat_user_{user_id}'
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Chat WebSocket. The user and their membership of the group are resolved
+    once at connect and kept on the connection, so saving a message is a
+    single INSERT. When a membership ends, api.signals sends a
+    membership.revoked control message to the user's connections.
+    Connections to a group that send heartbeats keep the user's presence
+    (see api.presence).
+    """
+
     async def connect(self):
         url_kwargs = self.scope['url_route']['kwargs']
         self.room_name = url_kwargs.get('room_name')
@@ -20,34 +44,75 @@ class ChatConsumer(AsyncWebsocketConsumer):
         else:
             await self.close()
             return
+
+        # The user is loaded by JWTAuthMiddleware
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=4001)
+            return
+
+        # Server-side typing state of the user in this room
+        self.typing = False
+        self.typing_expiry = None
+        # Whether this connection keeps the user's presence in the group, from its first heartbeat
+        self.present = False
+
+        # Recipients and groups (the user is a member of) checked by this connection
+        self.known_recipients = {}
+        self.known_groups = set()
+        if self.group_id:
+            self.group_id = int(self.group_id)
+            if not await self.is_member(self.group_id):
+                await self.close(code=4003)
+                return
+            self.known_groups.add(self.group_id)
+
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
+        await self.channel_layer.group_add(
+            get_user_group_name(self.user.id),
+            self.channel_name
+        )
         await self.accept()
 
     async def disconnect(self, close_code):
+        # Connections rejected in connect never joined the groups
+        if not hasattr(self, 'known_groups'):
+            return
+        if self.typing:
+            await self.stop_typing()
+        if self.present:
+            if await sync_to_async(get_presence_engine().leave, thread_sensitive=False)(
+                self.group_id, self.user.id, self.channel_name
+            ):
+                await self.send_presence(False)
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        await self.channel_layer.group_discard(
+            get_user_group_name(self.user.id),
+            self.channel_name
+        )
 
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
             # Handle typing indicator messages
             if data.get('type') == 'typing':
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'message': {
-                            'type': 'typing',
-                            'typing': data.get('typing', False),
-                            'user_id': self.scope["user"].id
-                        }
-                    }
-                )
+                await self.handle_typing(bool(data.get('typing', False)))
+                return
+
+            # Presence: clients send heartbeats and can ask who is online
+            if data.get('type') == 'heartbeat':
+                if self.group_id:
+                    await self.heartbeat()
+                return
+            if data.get('type') == 'presence':
+                if self.group_id:
+                    await self.send_online()
                 return
 
             # Get message content from different possible keys
@@ -58,13 +123,37 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 print(f"Invalid message content: {data}")
                 return
                 
-            group_id = data.get('group_id')
+            group_id = data.get('group_id') or self.group_id
             recipient_id = data.get('recipient_id')  # Optional, for DMs
+            client_id = self.get_client_id(data.get('client_id'))
+
+            references = await self.check_references(recipient_id, group_id)
+            if references is None:
+                print(f"Invalid message references: {data}")
+                return
+            recipient, group_id = references
 
-            # Save message to DB using authenticated user as sender
-            msg_obj = await self.save_message(recipient_id, group_id, message_content)
-            serialized = await sync_to_async(lambda obj: MessageSerializer(obj).data)(msg_obj)
+            msg_obj = Message(
+                sender=self.user,
+                recipient=recipient,
+                group_id=group_id,
+                content=message_content.strip(),  # Ensure no leading/trailing whitespace
+                client_id=client_id,
+                created_at=timezone.now(),
+            )
+            if is_write_behind():
+                # Broadcast right away, the message is saved with the next batch
+                await get_message_buffer().add(msg_obj)
+            else:
+                # Save message to DB using authenticated user as sender
+                msg_obj = await self.save_message(msg_obj)
+            serialized = GroupMessageSerializer(msg_obj).data
 
+            # Clients clear the typing indicator of the sender on a message
+            self.clear_typing()
+
+            await chat_metrics.aincr('message', 'received')
+            await chat_metrics.aincr('message', 'broadcast')
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
@@ -80,19 +169,152 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def chat_message(self, event):
         await self.send(text_data=json.dumps(event['message']))
 
-    @database_sync_to_async
-    def save_message(self, recipient_id, group_id, content):
-        if not content:
-            raise ValueError("Message content cannot be empty")
-            
-        user_obj = self.scope["user"]
-        sender = User.objects.get(pk=user_obj.pk)
-        recipient = User.objects.get(id=recipient_id) if recipient_id else None
-        group = MessageGroup.objects.get(id=group_id) if group_id else None
-        
-        return Message.objects.create(
-            sender=sender, 
-            recipient=recipient, 
-            group=group, 
-            content=content.strip()  # Ensure no leading/trailing whitespace
+    async def handle_typing(self, typing):
+        """Broadcast typing state changes only, rate limited per user and room"""
+        await chat_metrics.aincr('typing', 'received')
+        if typing and self.typing:
+            # Still typing, keep the state alive
+            self.schedule_typing_expiry()
+        elif typing and await allow_typing_start(self.room_group_name, self.user.id):
+            self.typing = True
+            self.schedule_typing_expiry()
+            await self.send_typing(True)
+            return
+        elif not typing and self.typing:
+            await self.stop_typing()
+            return
+        await chat_metrics.aincr('typing', 'suppressed')
+
+    async def send_typing(self, typing):
+        await chat_metrics.aincr('typing', 'broadcast')
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'chat_message',
+                'message': {
+                    'type': 'typing',
+                    'typing': typing,
+                    'user_id': self.user.id
+                }
+            }
+        )
+
+    def schedule_typing_expiry(self):
+        if self.typing_expiry is not None:
+            self.typing_expiry.cancel()
+        self.typing_expiry = asyncio.ensure_future(self.expire_typing())
+
+    async def expire_typing(self):
+        await asyncio.sleep(get_typing_config()['EXPIRY'])
+        self.typing_expiry = None
+        await chat_metrics.aincr('typing', 'expired')
+        await self.stop_typing()
+
+    def clear_typing(self):
+        """End the typing state without broadcasting it"""
+        self.typing = False
+        if self.typing_expiry is not None:
+            self.typing_expiry.cancel()
+            self.typing_expiry = None
+
+    async def stop_typing(self):
+        self.clear_typing()
+        await self.send_typing(False)
+
+    async def heartbeat(self):
+        """Record that the user is online, telling the room if they weren't"""
+        self.present = True
+        came_online = await sync_to_async(get_presence_engine().heartbeat, thread_sensitive=False)(
+            self.group_id, self.user.id, self.channel_name
+        )
+        if came_online:
+            await self.send_presence(True)
+
+    async def send_presence(self, online):
+        await chat_metrics.aincr('presence', 'broadcast')
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'chat_message',
+                'message': {
+                    'type': 'presence',
+                    'user_id': self.user.id,
+                    'online': online
+                }
+            }
         )
+
+    async def send_online(self):
+        """Send the members online in the group to this connection only"""
+        user_ids = await sync_to_async(get_presence_engine().get_online, thread_sensitive=False)(self.group_id)
+        await self.send(text_data=json.dumps({
+            'type': 'presence.online',
+            'user_ids': user_ids,
+            'heartbeat_interval': get_presence_config()['HEARTBEAT_INTERVAL'],
+        }))
+
+    async def membership_revoked(self, event):
+        """Control message: the user is no longer a member of a group"""
+        group_id = event['group_id']
+        self.known_groups.discard(group_id)
+        if self.group_id == group_id:
+            await self.close(code=4003)
+
+    def get_client_id(self, value):
+        """Use the client's message id if it's a valid UUID, so a resent message is saved once"""
+        try:
+            return uuid.UUID(str(value))
+        except ValueError:
+            return uuid.uuid4()
+
+    @database_sync_to_async
+    def is_member(self, group_id):
+        return MessageGroup.objects.filter(id=group_id, members=self.user).exists()
+
+    @database_sync_to_async
+    def save_message(self, message):
+        """Save a message, or get the saved one if the client resent it"""
+        try:
+            with transaction.atomic():
+                message.save()
+        except IntegrityError:
+            saved = Message.objects.select_related('sender', 'recipient').filter(
+                sender=message.sender,
+                client_id=message.client_id
+            ).first()
+            if saved is None:
+                raise
+            if get_conversation(saved) == get_conversation(message):
+                return saved
+            # The client reused one of its ids in another conversation, this is a new message
+            message.client_id = uuid.uuid4()
+            with transaction.atomic():
+                message.save()
+        return message
+
+    async def check_references(self, recipient_id, group_id):
+        """
+        Get (recipient, group id) of a message, or None if the recipient doesn't
+        exist or the user is not a member of the group. Each id is looked up only
+        once per connection.
+        """
+        try:
+            recipient_id = int(recipient_id) if recipient_id else None
+            group_id = int(group_id) if group_id else None
+        except (TypeError, ValueError):
+            return None
+        if (recipient_id and recipient_id not in self.known_recipients) or (group_id and group_id not in self.known_groups):
+            await self.load_references(recipient_id, group_id)
+
+        recipient = self.known_recipients.get(recipient_id) if recipient_id else None
+        if (recipient_id and recipient is None) or (group_id and group_id not in self.known_groups):
+            return None
+        return recipient, group_id
+
+    @database_sync_to_async
+    def load_references(self, recipient_id, group_id):
+        if recipient_id and recipient_id not in self.known_recipients:
+            self.known_recipients[recipient_id] = User.objects.filter(id=recipient_id).first()
+        if group_id and group_id not in self.known_groups:
+            if MessageGroup.objects.filter(id=group_id, members=self.user).exists():
+                self.known_groups.add(group_id)
@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.metrics import chat_metrics
+
+
+class Command(BaseCommand):
+    help = 'Shows how many chat events were received, broadcast, suppressed and expired'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Output the metrics as JSON')
+        parser.add_argument('--reset', action='store_true', help='Reset all metrics after showing them')
+    
+    def handle(self, *args, **options):
+        stats = chat_metrics.snapshot()
+        
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        elif not stats:
+            self.stdout.write('No chat metrics recorded yet')
+        else:
+            self.stdout.write(
+                f"{'event':<10} {'received':>10} {'broadcast':>10} {'suppressed':>10} {'expired':>8} {'saved':>7}"
+            )
+            for name, values in stats.items():
+                # Share of the received events that did not reach the channel layer
+                saved = values['suppressed'] / values['received'] if values['received'] else 0
+                self.stdout.write(
+                    f"{name:<10} {values['received']:>10} {values['broadcast']:>10} "
+                    f"{values['suppressed']:>10} {values['expired']:>8} {saved:>7.1%}"
+                )
+        
+        if options['reset']:
+            chat_metrics.reset()
+            self.stdout.write(self.style.SUCCESS('Chat metrics reset'))
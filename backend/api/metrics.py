@@ -0,0 +1,16 @@
+"""
+Chat metrics, read with manage.py chat_stats.
+
+The consumers count events with `await chat_metrics.aincr(...)`, so the
+periodic flush to the shared cache runs in a worker thread instead of
+blocking the event loop.
+"""
+from communities.utils.metrics import MetricsRegistry
+
+# Counters per chat event kind ('typing', 'message', 'presence')
+chat_metrics = MetricsRegistry('chat', fields=(
+    'received',  # Events received from clients
+    'broadcast',  # group_send calls made to the channel layer
+    'suppressed',  # Events not broadcast (coalesced or rate limited)
+    'expired',  # Typing states ended by the server
+))
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_messagegroup_message'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['group', 'created_at', 'id'], name='api_message_group_i_1b0ea8_idx'),
+        ),
+    ]
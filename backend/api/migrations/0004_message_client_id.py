@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_message_group_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='client_id',
+            field=models.UUIDField(blank=True, editable=False, help_text="Id given to a chat message by its sender before it's saved, for deduplication", null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('sender', 'client_id'), name='unique_message_sender_client_id'),
+        ),
+    ]
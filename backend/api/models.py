@@ -41,6 +41,7 @@ class Message(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
+    client_id = models.UUIDField(null=True, blank=True, editable=False, help_text="Id given to a chat message by its sender before it's saved, for deduplication")
 
     def __str__(self):
         if self.group:
@@ -48,4 +49,12 @@ class Message(models.Model):
         return f"{self.sender} -> {self.recipient}: {self.content[:20]}"
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Group histories are paged on (created_at, id) within a group
+            models.Index(fields=['group', 'created_at', 'id']),
+        ]
+        constraints = [
+            # Client ids are chosen by the client, so they are only unique per sender
+            models.UniqueConstraint(fields=['sender', 'client_id'], name='unique_message_sender_client_id'),
+        ]
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""
+Presence of users in chat groups.
+
+Each group has a sorted set of the members seen online, scored by the time of
+their last heartbeat. ChatConsumer records a heartbeat whenever the client
+sends {"type": "heartbeat"}; users whose last heartbeat is older than TIMEOUT
+are offline. A user can be connected more than once (e.g. in two tabs), so
+the connections of each user are kept too, and the user only goes offline
+when the last one closes. Stale entries are not expired by a background task
+but removed lazily, by the next read. Joining or leaving is broadcast to the
+room as
+{"type": "presence", "user_id": ..., "online": ...}, and {"type": "presence"}
+gets the connection the current list ("presence.online"):
+
+    CHAT_PRESENCE = {
+        'ENGINE': 'redis',  # or 'memory'; defaults to 'redis' with the Redis channel layer
+        'TIMEOUT': 60,  # seconds
+        'HEARTBEAT_INTERVAL': 20,  # seconds, told to clients
+    }
+
+With Redis, a heartbeat is a ZADD and the online members are a
+ZREMRANGEBYSCORE + ZRANGE, O(log n) plus the size of the result. The memory
+engine keeps the sets in process memory, for a single process and for tests
+with the in-memory channel layer.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+DEFAULT_CONFIG = {
+    'ENGINE': None,
+    'TIMEOUT': 60,
+    'HEARTBEAT_INTERVAL': 20,
+}
+
+
+def get_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'CHAT_PRESENCE', {})}
+
+
+class RedisPresenceEngine:
+    """
+    Records presence in a Redis sorted set of users per group, and a sorted set
+    of the user's connections per group and user, both scored by the last heartbeat
+    """
+
+    key_prefix = 'chat_presence'
+
+    # Remove a connection, and the user from the group once no live connection is left
+    LEAVE_SCRIPT = """
+        redis.call('ZREM', KEYS[1], ARGV[1])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+        if redis.call('ZCARD', KEYS[1]) > 0 then
+            return 0
+        end
+        return redis.call('ZREM', KEYS[2], ARGV[3])
+    """
+
+    def __init__(self, timeout, connection=None):
+        self.timeout = timeout
+        self._connection = connection
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            from django_redis import get_redis_connection
+            self._connection = get_redis_connection('default')
+        return self._connection
+
+    def get_key(self, group_id):
+        return f"{self.key_prefix}:{group_id}"
+
+    def get_connections_key(self, group_id, user_id):
+        return f"{self.key_prefix}:{group_id}:{user_id}"
+
+    def heartbeat(self, group_id, user_id, connection_id, now=None):
+        """Record a heartbeat of a connection. Returns True if the user was not online before."""
+        now = now or time.time()
+        key = self.get_key(group_id)
+        connections_key = self.get_connections_key(group_id, user_id)
+        pipeline = self.connection.pipeline()
+        pipeline.zscore(key, user_id)
+        pipeline.zadd(key, {user_id: now})
+        pipeline.zadd(connections_key, {connection_id: now})
+        # The sets of a quiet group go away on their own
+        pipeline.expire(key, int(self.timeout * 2))
+        pipeline.expire(connections_key, int(self.timeout * 2))
+        last_seen = pipeline.execute()[0]
+        return last_seen is None or float(last_seen) < now - self.timeout
+
+    def leave(self, group_id, user_id, connection_id, now=None):
+        """Remove a connection. Returns True if it was the user's last one (the user went offline)."""
+        now = now or time.time()
+        return bool(self.connection.eval(
+            self.LEAVE_SCRIPT, 2,
+            self.get_connections_key(group_id, user_id), self.get_key(group_id),
+            connection_id, now - self.timeout, user_id
+        ))
+
+    def get_online(self, group_id, now=None):
+        """Get the ids of the users online in a group, most recently seen first"""
+        now = now or time.time()
+        key = self.get_key(group_id)
+        pipeline = self.connection.pipeline()
+        pipeline.zremrangebyscore(key, '-inf', now - self.timeout)
+        pipeline.zrevrange(key, 0, -1)
+        return [int(user_id) for user_id in pipeline.execute()[1]]
+
+
+class MemoryPresenceEngine:
+    """Records presence in process memory (one process only, e.g. tests)"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        # {group_id: {user_id: {connection_id: last heartbeat}}}
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def _drop_stale(self, connections, now):
+        for connection_id in [connection_id for connection_id, seen in connections.items() if seen < now - self.timeout]:
+            del connections[connection_id]
+
+    def heartbeat(self, group_id, user_id, connection_id, now=None):
+        now = now or time.time()
+        with self._lock:
+            connections = self._groups.setdefault(group_id, {}).setdefault(user_id, {})
+            self._drop_stale(connections, now)
+            came_online = not connections
+            connections[connection_id] = now
+        return came_online
+
+    def leave(self, group_id, user_id, connection_id, now=None):
+        now = now or time.time()
+        with self._lock:
+            members = self._groups.get(group_id, {})
+            connections = members.get(user_id)
+            if connections is None:
+                return False
+            connections.pop(connection_id, None)
+            self._drop_stale(connections, now)
+            if connections:
+                return False
+            del members[user_id]
+            return True
+
+    def get_online(self, group_id, now=None):
+        now = now or time.time()
+        with self._lock:
+            members = self._groups.get(group_id, {})
+            for user_id in list(members):
+                self._drop_stale(members[user_id], now)
+                if not members[user_id]:
+                    del members[user_id]
+            return sorted(members, key=lambda user_id: max(members[user_id].values()), reverse=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_presence_engine():
+    """Get the configured presence engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            config = get_config()
+            name = config['ENGINE']
+            if name is None:
+                backend = settings.CHANNEL_LAYERS.get('default', {}).get('BACKEND', '')
+                name = 'redis' if 'redis' in backend.lower() else 'memory'
+            if name == 'redis':
+                _engine = RedisPresenceEngine(config['TIMEOUT'])
+            elif name == 'memory':
+                _engine = MemoryPresenceEngine(config['TIMEOUT'])
+            else:
+                raise ValueError(f"Unknown presence engine: {name}")
+        return _engine
+
+
+@receiver(setting_changed)
+def reset_presence_engine(setting, **kwargs):
+    """Rebuild the engine when the settings change (e.g. in tests)"""
+    global _engine
+    if setting in ('CHAT_PRESENCE', 'CHANNEL_LAYERS'):
+        with _engine_lock:
+            _engine = None
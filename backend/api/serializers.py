@@ -44,4 +44,13 @@ class MessageSerializer(serializers.ModelSerializer):
     group = MessageGroupSerializer(read_only=True)
     class Meta:
         model = Message
-        fields = ["id", "sender", "recipient", "group_id", "group", "content", "created_at", "read"]
\ No newline at end of file
+        fields = ["id", "sender", "recipient", "group_id", "group", "content", "created_at", "read"]
+
+class GroupMessageSerializer(serializers.ModelSerializer):
+    """Slim message for group histories: the group is given by id, not nested with its members"""
+    sender = UserShortSerializer(read_only=True)
+    recipient = UserShortSerializer(read_only=True)
+    group_id = serializers.IntegerField(read_only=True)
+    class Meta:
+        model = Message
+        fields = ["id", "client_id", "sender", "recipient", "group_id", "content", "created_at", "read"]
\ No newline at end of file
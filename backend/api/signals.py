@@ -0,0 +1,65 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
+
+from .consumers import get_user_group_name
+from .models import MessageGroup
+
+logger = logging.getLogger(__name__)
+
+
+def notify_membership_revoked(memberships):
+    """
+    Tell the chat connections of the given (user id, group id) pairs that the
+    membership ended, once the transaction commits, so they stop trusting the
+    membership they checked at connect.
+    """
+    memberships = list(memberships)
+    if not memberships:
+        return
+    
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        for user_id, group_id in memberships:
+            try:
+                async_to_sync(channel_layer.group_send)(
+                    get_user_group_name(user_id),
+                    {'type': 'membership.revoked', 'group_id': group_id}
+                )
+            except Exception as e:
+                logger.error(f"Could not revoke chat membership of user {user_id} in group {group_id}: {str(e)}")
+    
+    transaction.on_commit(send)
+
+
+@receiver(m2m_changed, sender=MessageGroup.members.through)
+def revoke_removed_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """Revoke the memberships removed from a group (or, reversed, from a user)"""
+    if action == 'post_remove':
+        pks = pk_set or ()
+    elif action == 'pre_clear':
+        # The rows are still there to tell who is removed
+        related = instance.message_groups if reverse else instance.members
+        pks = list(related.values_list('pk', flat=True))
+    else:
+        return
+    
+    if reverse:
+        notify_membership_revoked((instance.pk, group_id) for group_id in pks)
+    else:
+        notify_membership_revoked((user_id, instance.pk) for user_id in pks)
+
+
+@receiver(pre_delete, sender=MessageGroup)
+def revoke_deleted_group_members(sender, instance, **kwargs):
+    """Revoke all the memberships of a deleted group"""
+    notify_membership_revoked(
+        (user_id, instance.pk)
+        for user_id in instance.members.values_list('pk', flat=True)
+    )
@@ -1,3 +1,539 @@
-from django.test import TestCase
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from .chat_persistence import flush_on_exit, get_message_buffer
+from .consumers import ChatConsumer
+from .metrics import chat_metrics
+from .models import Message, MessageGroup
+from .presence import MemoryPresenceEngine, get_presence_engine
+
+
+User = get_user_model()
+
+
+class GroupMessagesTests(TestCase):
+    """Tests for the paged group message history"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='chatter@example.com',
+            username='chatter',
+            first_name='Chat',
+            last_name='Ter',
+            password='password123'
+        )
+        self.other = User.objects.create_user(
+            email='other@example.com',
+            username='other',
+            first_name='Oth',
+            last_name='Er',
+            password='password123'
+        )
+        self.group = MessageGroup.objects.create(name='Study group')
+        self.group.members.add(self.user, self.other)
+        self.messages = [
+            Message.objects.create(sender=self.user if i % 2 else self.other, group=self.group, content=f'Message {i}')
+            for i in range(7)
+        ]
+        self.client.force_authenticate(user=self.user)
+    
+    def get_page(self, **params):
+        response = self.client.get(reverse('group-messages'), {'group': self.group.id, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+    
+    def test_latest_page_is_oldest_first(self):
+        page = self.get_page(limit=3)
+        
+        self.assertEqual([message['content'] for message in page['results']], ['Message 4', 'Message 5', 'Message 6'])
+        self.assertTrue(page['has_more'])
+        # Slim shape: the group is referenced by id only
+        self.assertEqual(page['results'][0]['group_id'], self.group.id)
+        self.assertNotIn('group', page['results'][0])
+    
+    def test_before_and_after_cursors(self):
+        page = self.get_page(limit=3, before=self.messages[4].id)
+        self.assertEqual([message['id'] for message in page['results']], [m.id for m in self.messages[1:4]])
+        self.assertTrue(page['has_more'])
+        
+        page = self.get_page(limit=3, before=self.messages[1].id)
+        self.assertEqual([message['id'] for message in page['results']], [self.messages[0].id])
+        self.assertFalse(page['has_more'])
+        
+        page = self.get_page(limit=3, after=self.messages[2].id)
+        self.assertEqual([message['id'] for message in page['results']], [m.id for m in self.messages[3:6]])
+        self.assertTrue(page['has_more'])
+        
+        page = self.get_page(after=self.messages[6].id)
+        self.assertEqual(page['results'], [])
+        self.assertFalse(page['has_more'])
+    
+    def test_page_size_is_capped(self):
+        from .views import GROUP_MESSAGES_MAX_PAGE_SIZE
+        Message.objects.bulk_create([
+            Message(sender=self.user, group=self.group, content='Bulk')
+            for _ in range(GROUP_MESSAGES_MAX_PAGE_SIZE)
+        ])
+        
+        page = self.get_page(limit=GROUP_MESSAGES_MAX_PAGE_SIZE * 10)
+        self.assertEqual(len(page['results']), GROUP_MESSAGES_MAX_PAGE_SIZE)
+    
+    def test_no_per_message_queries(self):
+        # The group, the membership check and the page with its senders and recipients
+        for limit in (2, 7):
+            with self.assertNumQueries(3):
+                self.get_page(limit=limit)
+    
+    def test_invalid_requests(self):
+        url = reverse('group-messages')
+        self.assertEqual(self.client.get(url, {'group': self.group.id, 'before': 999999}).status_code, 400)
+        self.assertEqual(
+            self.client.get(url, {'group': self.group.id, 'before': 1, 'after': 1}).status_code,
+            400
+        )
+        
+        outsider = User.objects.create_user(
+            email='outsider@example.com', username='outsider',
+            first_name='Out', last_name='Sider', password='password123'
+        )
+        self.client.force_authenticate(user=outsider)
+        self.assertEqual(self.client.get(url, {'group': self.group.id}).status_code, 403)
+    
+    def test_cursor_pagination_walks_both_ways(self):
+        from django.utils import timezone
+        # Ties on created_at are broken by id, newest first
+        Message.objects.filter(id__in=[m.id for m in self.messages[2:5]]).update(created_at=timezone.now())
+        expected = list(Message.objects.filter(group=self.group).order_by('-created_at', '-id').values_list('id', flat=True))
+        
+        pages = [self.get_page(pagination='cursor', page_size=3)]
+        self.assertIsNone(pages[0]['previous'])
+        while pages[-1]['next']:
+            response = self.client.get(pages[-1]['next'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+        self.assertEqual([message['id'] for page in pages for message in page['results']], expected)
+        
+        response = self.client.get(pages[-1]['previous'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], pages[-2]['results'])
+        
+        url = reverse('group-messages')
+        self.assertEqual(self.client.get(url, {'group': self.group.id, 'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+@override_settings(CHAT_MESSAGE_PERSISTENCE={'MODE': 'write_behind', 'BATCH_SIZE': 3, 'FLUSH_INTERVAL': 60})
+class ChatWriteBehindTests(TestCase):
+    """Tests for the write-behind persistence of WebSocket chat messages"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='writer@example.com',
+            username='writer',
+            first_name='Wri',
+            last_name='Ter',
+            password='password123'
+        )
+        self.group = MessageGroup.objects.create(name='Fast chat')
+        self.group.members.add(self.user)
+    
+    def build_message(self, content, client_id=None):
+        return Message(sender=self.user, group=self.group, content=content, client_id=client_id or uuid.uuid4())
+    
+    def test_buffer_saves_full_batches(self):
+        buffer = get_message_buffer()
+        
+        async def add(count):
+            for i in range(count):
+                await buffer.add(self.build_message(f'Message {i}'))
+        
+        async_to_sync(add)(2)
+        self.assertEqual(Message.objects.count(), 0)
+        async_to_sync(add)(1)
+        self.assertEqual(Message.objects.count(), 3)
+        self.assertEqual(buffer.pending, [])
+    
+    def test_flush_is_idempotent_and_retried(self):
+        buffer = get_message_buffer()
+        client_id = uuid.uuid4()
+        buffer.pending = [self.build_message('Once', client_id), self.build_message('Again', client_id)]
+        buffer.flush_sync()
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['Once'])
+        
+        # A failed flush keeps its messages for the next one
+        buffer.pending = [self.build_message('Later')]
+        with mock.patch.object(Message.objects, 'bulk_create', side_effect=OperationalError('gone')):
+            with self.assertRaises(OperationalError):
+                buffer.flush_sync()
+        self.assertEqual(len(buffer.pending), 1)
+        buffer.flush_sync()
+        self.assertTrue(Message.objects.filter(content='Later').exists())
+        
+        # Resending a saved message is ignored
+        buffer.pending = [self.build_message('Once', client_id)]
+        flush_on_exit()
+        self.assertEqual(Message.objects.filter(client_id=client_id).count(), 1)
+    
+    def chat(self, *messages):
+        """Send messages through a ChatConsumer, returning the broadcasts"""
+        async def run():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/messages/{self.group.id}/')
+            communicator.scope['user'] = self.user
+            communicator.scope['url_route'] = {'kwargs': {'group_id': self.group.id}}
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            
+            received = []
+            for message in messages:
+                await communicator.send_json_to(message)
+                received.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return received
+        
+        return async_to_sync(run)()
+    
+    def test_consumer_broadcasts_before_saving(self):
+        client_id = str(uuid.uuid4())
+        
+        message, = self.chat({'content': 'Hello', 'group_id': self.group.id, 'client_id': client_id})
+        
+        self.assertEqual(message['client_id'], client_id)
+        self.assertEqual(message['sender']['id'], self.user.id)
+        self.assertEqual(message['group_id'], self.group.id)
+        self.assertIsNone(message['id'])
+        self.assertFalse(Message.objects.exists())
+        
+        get_message_buffer().flush_sync()
+        self.assertEqual(Message.objects.get().client_id, uuid.UUID(client_id))
+    
+    @override_settings(CHAT_MESSAGE_PERSISTENCE={'MODE': 'sync'})
+    def test_sync_mode_saves_a_resent_message_once(self):
+        client_id = str(uuid.uuid4())
+        
+        first, resent = self.chat(*[{'content': 'Hello', 'group_id': self.group.id, 'client_id': client_id}] * 2)
+        
+        self.assertIsNotNone(first['id'])
+        self.assertEqual(first['id'], resent['id'])
+        self.assertEqual(Message.objects.count(), 1)
+    
+    def create_other_messages(self, client_id):
+        """Save a message of another user, and one of this user in another group, under client_id"""
+        other = User.objects.create_user(
+            email='other-writer@example.com',
+            username='other-writer',
+            first_name='Oth',
+            last_name='Er',
+            password='password123'
+        )
+        private = MessageGroup.objects.create(name='Private chat')
+        private.members.add(self.user, other)
+        Message.objects.create(sender=other, group=private, content='Secret', client_id=client_id)
+        Message.objects.create(sender=self.user, group=private, content='Mine', client_id=client_id)
+    
+    @override_settings(CHAT_MESSAGE_PERSISTENCE={'MODE': 'sync'})
+    def test_sync_mode_does_not_replay_messages_of_other_conversations(self):
+        client_id = uuid.uuid4()
+        self.create_other_messages(client_id)
+        
+        message, = self.chat({'content': 'Hello', 'group_id': self.group.id, 'client_id': str(client_id)})
+        
+        self.assertEqual(message['content'], 'Hello')
+        self.assertEqual(message['sender']['id'], self.user.id)
+        self.assertEqual(message['group_id'], self.group.id)
+        saved = Message.objects.get(id=message['id'])
+        self.assertEqual((saved.content, saved.group_id), ('Hello', self.group.id))
+        self.assertNotEqual(saved.client_id, client_id)
+    
+    def test_flush_keeps_messages_reusing_client_ids_of_other_conversations(self):
+        client_id = uuid.uuid4()
+        self.create_other_messages(client_id)
+        
+        buffer = get_message_buffer()
+        buffer.pending = [self.build_message('Hello', client_id)]
+        self.assertEqual(buffer.flush_sync(), 1)
+        
+        saved = Message.objects.get(group=self.group)
+        self.assertEqual(saved.content, 'Hello')
+        self.assertNotEqual(saved.client_id, client_id)
+        self.assertEqual(Message.objects.filter(client_id=client_id).count(), 2)
+
+
+@override_settings(CHAT_MESSAGE_PERSISTENCE={'MODE': 'sync'})
+class ChatConsumerMembershipTests(TestCase):
+    """Tests for the connection-scoped identity and membership of ChatConsumer"""
+    
+    def setUp(self):
+        self.member = User.objects.create_user(
+            email='member@example.com',
+            username='member',
+            first_name='Mem',
+            last_name='Ber',
+            password='password123'
+        )
+        self.outsider = User.objects.create_user(
+            email='outsider@example.com',
+            username='outsider',
+            first_name='Out',
+            last_name='Sider',
+            password='password123'
+        )
+        self.group = MessageGroup.objects.create(name='Members only')
+        self.group.members.add(self.member)
+    
+    def get_communicator(self, user):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/messages/{self.group.id}/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'group_id': str(self.group.id)}}
+        return communicator
+    
+    def test_non_members_are_rejected_at_connect(self):
+        async def connect(user):
+            connected, code = await self.get_communicator(user).connect()
+            return connected, code
+        
+        self.assertEqual(async_to_sync(connect)(self.outsider), (False, 4003))
+        self.assertEqual(async_to_sync(connect)(AnonymousUser()), (False, 4001))
+    
+    def test_message_is_a_single_insert(self):
+        async def chat():
+            communicator = self.get_communicator(self.member)
+            await communicator.connect()
+            await communicator.send_json_to({'content': 'First', 'group_id': self.group.id})
+            await communicator.receive_json_from()
+            
+            # The connection belongs to the test thread
+            queries = CaptureQueriesContext(connection)
+            await database_sync_to_async(queries.__enter__)()
+            await communicator.send_json_to({'content': 'Second', 'group_id': self.group.id})
+            message = await communicator.receive_json_from()
+            await database_sync_to_async(queries.__exit__)(None, None, None)
+            await communicator.disconnect()
+            return message, queries
+        
+        message, queries = async_to_sync(chat)()
+        
+        self.assertEqual(message['content'], 'Second')
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('INSERT'))
+    
+    def test_removed_member_is_disconnected(self):
+        def remove_member():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.group.members.remove(self.member)
+        
+        async def chat():
+            communicator = self.get_communicator(self.member)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            
+            await database_sync_to_async(remove_member)()
+            return await communicator.receive_output()
+        
+        self.assertEqual(async_to_sync(chat)(), {'type': 'websocket.close', 'code': 4003})
+
+
+@override_settings(CHAT_TYPING_INDICATOR={'INTERVAL': 60, 'EXPIRY': 60})
+class ChatTypingTests(TestCase):
+    """Tests for the coalescing and rate limiting of typing indicators"""
+    
+    def setUp(self):
+        cache.clear()
+        chat_metrics.reset()
+        self.user = User.objects.create_user(
+            email='typist@example.com',
+            username='typist',
+            first_name='Ty',
+            last_name='Pist',
+            password='password123'
+        )
+        self.group = MessageGroup.objects.create(name='Typing room')
+        self.group.members.add(self.user)
+    
+    def type(self, events, wait=0.1):
+        """Send typing events and get the broadcasts received until none arrive for `wait` seconds"""
+        async def run():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/messages/{self.group.id}/')
+            communicator.scope['user'] = self.user
+            communicator.scope['url_route'] = {'kwargs': {'group_id': self.group.id}}
+            await communicator.connect()
+            for typing in events:
+                await communicator.send_json_to({'type': 'typing', 'typing': typing})
+            
+            received = []
+            while not await communicator.receive_nothing(timeout=wait):
+                received.append((await communicator.receive_json_from())['typing'])
+            await communicator.disconnect()
+            return received
+        
+        return async_to_sync(run)()
+    
+    def test_only_state_changes_are_broadcast(self):
+        self.assertEqual(self.type([True] * 20 + [False, False]), [True, False])
+        
+        # Starting again within the interval is suppressed
+        self.assertEqual(self.type([True, False]), [])
+        
+        stats = chat_metrics.snapshot()['typing']
+        self.assertEqual(stats['received'], 24)
+        self.assertEqual(stats['broadcast'], 2)
+        self.assertEqual(stats['suppressed'], 22)
+    
+    @override_settings(CHAT_TYPING_INDICATOR={'INTERVAL': 60, 'EXPIRY': 0.05})
+    def test_typing_state_expires(self):
+        self.assertEqual(self.type([True], wait=0.3), [True, False])
+        self.assertEqual(chat_metrics.snapshot()['typing']['expired'], 1)
+
+
+@override_settings(CHAT_PRESENCE={'ENGINE': 'memory', 'TIMEOUT': 60, 'HEARTBEAT_INTERVAL': 20})
+class ChatPresenceTests(TestCase):
+    """Tests for the presence of users in chat groups"""
+    
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            email='alice@example.com',
+            username='alice',
+            first_name='Ali',
+            last_name='Ce',
+            password='password123'
+        )
+        self.bob = User.objects.create_user(
+            email='bob@example.com',
+            username='bob',
+            first_name='Bo',
+            last_name='B',
+            password='password123'
+        )
+        self.outsider = User.objects.create_user(
+            email='lurker@example.com',
+            username='lurker',
+            first_name='Lur',
+            last_name='Ker',
+            password='password123'
+        )
+        self.group = MessageGroup.objects.create(name='Presence room')
+        self.group.members.add(self.alice, self.bob)
+    
+    def get_communicator(self, user):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/messages/{self.group.id}/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'group_id': str(self.group.id)}}
+        return communicator
+    
+    def test_stale_users_expire_on_read(self):
+        engine = MemoryPresenceEngine(timeout=60)
+        self.assertTrue(engine.heartbeat(1, 10, 'a', now=1000))
+        self.assertFalse(engine.heartbeat(1, 10, 'a', now=1030))
+        self.assertTrue(engine.heartbeat(1, 20, 'b', now=1040))
+        
+        self.assertEqual(engine.get_online(1, now=1050), [20, 10])
+        self.assertEqual(engine.get_online(1, now=1095), [20])
+        # Back after the timeout counts as coming online again
+        self.assertTrue(engine.heartbeat(1, 10, 'a', now=1100))
+        self.assertTrue(engine.leave(1, 10, 'a', now=1100))
+        self.assertFalse(engine.leave(1, 10, 'a', now=1100))
+    
+    def test_users_stay_online_until_their_last_connection_leaves(self):
+        engine = MemoryPresenceEngine(timeout=60)
+        self.assertTrue(engine.heartbeat(1, 10, 'tab-1', now=1000))
+        self.assertFalse(engine.heartbeat(1, 10, 'tab-2', now=1010))
+        
+        self.assertFalse(engine.leave(1, 10, 'tab-1', now=1020))
+        self.assertEqual(engine.get_online(1, now=1030), [10])
+        self.assertTrue(engine.leave(1, 10, 'tab-2', now=1030))
+        self.assertEqual(engine.get_online(1, now=1030), [])
+        
+        # A connection that went away without leaving doesn't keep the user online
+        engine.heartbeat(1, 10, 'crashed', now=1100)
+        engine.heartbeat(1, 10, 'tab-3', now=1150)
+        self.assertTrue(engine.leave(1, 10, 'tab-3', now=1200))
+    
+    def test_joining_and_leaving_is_broadcast(self):
+        async def chat():
+            alice = self.get_communicator(self.alice)
+            await alice.connect()
+            await alice.send_json_to({'type': 'heartbeat'})
+            joined = [await alice.receive_json_from()]
+            
+            bob = self.get_communicator(self.bob)
+            await bob.connect()
+            await bob.send_json_to({'type': 'heartbeat'})
+            joined.append(await alice.receive_json_from())
+            await bob.receive_json_from()
+            # Later heartbeats are not broadcast
+            await bob.send_json_to({'type': 'heartbeat'})
+            await bob.send_json_to({'type': 'presence'})
+            snapshot = await bob.receive_json_from()
+            
+            await bob.disconnect()
+            left = await alice.receive_json_from()
+            await alice.disconnect()
+            return joined, snapshot, left
+        
+        joined, snapshot, left = async_to_sync(chat)()
+        
+        self.assertEqual(joined, [
+            {'type': 'presence', 'user_id': self.alice.id, 'online': True},
+            {'type': 'presence', 'user_id': self.bob.id, 'online': True},
+        ])
+        self.assertEqual(snapshot, {
+            'type': 'presence.online',
+            'user_ids': [self.bob.id, self.alice.id],
+            'heartbeat_interval': 20,
+        })
+        self.assertEqual(left, {'type': 'presence', 'user_id': self.bob.id, 'online': False})
+    
+    def test_closing_one_of_two_connections_keeps_the_user_online(self):
+        async def chat():
+            bob = self.get_communicator(self.bob)
+            await bob.connect()
+            await bob.send_json_to({'type': 'heartbeat'})
+            await bob.receive_json_from()
+            
+            tabs = [self.get_communicator(self.alice), self.get_communicator(self.alice)]
+            for tab in tabs:
+                await tab.connect()
+                await tab.send_json_to({'type': 'heartbeat'})
+            received = [await bob.receive_json_from()]
+            self.assertTrue(await bob.receive_nothing(timeout=0.1))
+            
+            await tabs[0].disconnect()
+            self.assertTrue(await bob.receive_nothing(timeout=0.1))
+            await tabs[1].send_json_to({'type': 'heartbeat'})
+            self.assertTrue(await bob.receive_nothing(timeout=0.1))
+            
+            await tabs[1].disconnect()
+            received.append(await bob.receive_json_from())
+            await bob.disconnect()
+            return received
+        
+        self.assertEqual(async_to_sync(chat)(), [
+            {'type': 'presence', 'user_id': self.alice.id, 'online': True},
+            {'type': 'presence', 'user_id': self.alice.id, 'online': False},
+        ])
+    
+    def test_online_endpoint_is_for_members(self):
+        get_presence_engine().heartbeat(self.group.id, self.bob.id, 'connection')
+        
+        client = APIClient()
+        url = reverse('message-group-online', args=[self.group.id])
+        client.force_authenticate(user=self.alice)
+        response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'user_ids': [self.bob.id], 'count': 1})
+        
+        client.force_authenticate(user=self.outsider)
+        self.assertEqual(client.get(url).status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,37 @@
+"""
+Server-side coalescing of chat typing indicators.
+
+Clients send a typing event on (debounced) keystrokes. Only state changes are
+broadcast to the room: a "typing" event while the user is already typing just
+pushes back the expiry of the state, and a user can start typing at most once
+per INTERVAL seconds in a room (across all their connections, through the
+shared cache). A typing state that is not refreshed for EXPIRY seconds ends on
+the server, so a client that disappears mid-sentence doesn't stay "typing":
+
+    CHAT_TYPING_INDICATOR = {
+        'INTERVAL': 3,  # seconds
+        'EXPIRY': 6,  # seconds
+    }
+
+The events received, broadcast (channel layer fan-outs), suppressed and
+expired are counted in api.metrics.chat_metrics.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULT_CONFIG = {
+    'INTERVAL': 3,
+    'EXPIRY': 6,
+}
+
+def get_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'CHAT_TYPING_INDICATOR', {})}
+
+
+async def allow_typing_start(room_group_name, user_id):
+    """Whether the user may start typing in the room, at most once per interval"""
+    return await cache.aadd(
+        f'chat_typing:{room_group_name}:{user_id}',
+        1,
+        timeout=get_config()['INTERVAL']
+    )
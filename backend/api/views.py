@@ -24,10 +24,14 @@ from users.utils import (
     generate_password_reset_token, send_password_reset_email
 )
 
+from communities.utils.pagination import KeysetPagination
+
 from .models import Testimonial, Message, MessageGroup
+from .presence import get_presence_engine
 from .serializers import (
     TestimonialSerializer,
     MessageSerializer,
+    GroupMessageSerializer,
     MessageGroupSerializer,
     UserShortSerializer
 )
@@ -219,8 +223,21 @@ class MessageGroupViewSet(viewsets.ModelViewSet):
         except User.DoesNotExist:
             return Response({"detail": "User not found."}, status=404)
 
+    @action(detail=True, methods=["get"], permission_classes=[IsAuthenticated])
+    def online(self, request, pk=None):
+        """The ids of the members online in the group (see api.presence)"""
+        group = self.get_object()
+        user_ids = get_presence_engine().get_online(group.id)
+        return Response({"user_ids": user_ids, "count": len(user_ids)})
+
+class MessageKeysetPagination(KeysetPagination):
+    """Keyset pagination of a group's messages, newest first, on the (group, created_at, id) index"""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+
 class MessageViewSet(viewsets.ModelViewSet):
-    queryset = Message.objects.all()
+    # The list is served by group_messages (api/urls.py), the viewset has the
+    # detail routes. Users only see the messages of their groups and DMs.
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
 
@@ -296,11 +313,23 @@ def start_dm(request):
     serializer = MessageGroupSerializer(group)
     return Response(serializer.data)
 
+# Page size of the group message history; clients can ask for fewer or more, up to the max
+GROUP_MESSAGES_PAGE_SIZE = 50
+GROUP_MESSAGES_MAX_PAGE_SIZE = 100
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def group_messages(request):
-    print("AUTH HEADER:", request.META.get("HTTP_AUTHORIZATION"))
-    print("COOKIES:", request.COOKIES)
+    """
+    Get a page of a group's message history, oldest message first.
+    Without a cursor this is the latest page. ?before=<message id> pages back
+    through the older messages, ?after=<message id> fetches the newer ones
+    (e.g. after a reconnect), and ?limit= sets the page size.
+
+    With ?pagination=cursor the messages are paged newest first with opaque
+    cursors instead: {next, previous, results}, following the links (see
+    MessageKeysetPagination).
+    """
     group_id = request.GET.get('group')
     if not group_id:
         return Response({'detail': 'Missing group query parameter.'}, status=400)
@@ -315,9 +344,51 @@ def group_messages(request):
         return Response({'detail': 'Group not found.'}, status=404)
     if not group.members.filter(id=request.user.id).exists():
         return Response({'detail': 'You are not a member of this group.'}, status=403)
-    messages = Message.objects.filter(group=group).order_by('created_at')
-    serializer = MessageSerializer(messages, many=True)
-    return Response(serializer.data)
+    
+    try:
+        limit = int(request.GET.get('limit', GROUP_MESSAGES_PAGE_SIZE))
+    except ValueError:
+        return Response({'detail': 'Invalid limit.'}, status=400)
+    limit = max(1, min(limit, GROUP_MESSAGES_MAX_PAGE_SIZE))
+    
+    before = request.GET.get('before')
+    after = request.GET.get('after')
+    if before and after:
+        return Response({'detail': 'Use either before or after, not both.'}, status=400)
+    
+    messages = Message.objects.filter(group=group).select_related('sender', 'recipient')
+    
+    paginator = MessageKeysetPagination()
+    if request.GET.get('pagination') == 'cursor' or paginator.cursor_query_param in request.GET:
+        page = paginator.paginate_queryset(messages, request)
+        return paginator.get_paginated_response(GroupMessageSerializer(page, many=True).data)
+    
+    # Seek past the cursor message on the (group, created_at, id) index
+    if before or after:
+        try:
+            cursor = messages.values('created_at', 'id').get(id=int(before or after))
+        except (ValueError, Message.DoesNotExist):
+            return Response({'detail': 'Invalid cursor.'}, status=400)
+        lookup = 'lt' if before else 'gt'
+        messages = messages.filter(
+            Q(**{f'created_at__{lookup}': cursor['created_at']}) |
+            Q(created_at=cursor['created_at'], **{f'id__{lookup}': cursor['id']})
+        )
+    
+    # Fetch one extra message to find out whether there are more
+    if after:
+        page = list(messages.order_by('created_at', 'id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+    else:
+        page = list(messages.order_by('-created_at', '-id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit][::-1]
+    
+    return Response({
+        'results': GroupMessageSerializer(page, many=True).data,
+        'has_more': has_more,
+    })
 
 #########################################################################################
 
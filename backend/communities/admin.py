@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Community, Membership, Post, Comment, CommunityInvitation
+from .models import Community, Membership, Post, Comment, CommunityInvitation, PostWaitlistEntry
 
 class MembershipInline(admin.TabularInline):
     model = Membership
@@ -79,3 +79,10 @@ class CommunityInvitationAdmin(admin.ModelAdmin):
     search_fields = ('invitee_email', 'community__name', 'inviter__username')
     raw_id_fields = ('community', 'inviter')
     readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(PostWaitlistEntry)
+class PostWaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('post', 'user', 'created_at')
+    search_fields = ('post__title', 'user__username')
+    raw_id_fields = ('post', 'user')
+    readonly_fields = ('created_at',)
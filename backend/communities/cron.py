@@ -0,0 +1,27 @@
+from django_cron import CronJobBase, Schedule
+from .signals import update_all_cache_counts
+from .utils.counters import flush_upvote_counters
+
+class ReconcileCacheCountersCronJob(CronJobBase):
+    RUN_EVERY_MINS = 24 * 60  # every day
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'communities.reconcile_cache_counters'
+
+    def do(self):
+        # Counters are maintained with deltas by the signals; recount them
+        # periodically to correct any drift (e.g. from bulk operations that skip signals)
+        update_all_cache_counts()
+        print("Reconciled community, post and comment cache counters.")
+
+
+class FlushUpvoteCountersCronJob(CronJobBase):
+    RUN_EVERY_MINS = 1  # every minute
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'communities.flush_upvote_counters'
+
+    def do(self):
+        # Only does work with the write-behind (redis) upvote counter engine
+        count = flush_upvote_counters()
+        print(f"Flushed upvote counters of {count} rows.")
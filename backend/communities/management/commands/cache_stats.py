@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from communities.utils.cache import cache_metrics, get_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Shows hit/miss, compute time and payload size metrics of the cached functions'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Output the metrics as JSON')
+        parser.add_argument('--reset', action='store_true', help='Reset all metrics after showing them')
+    
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        
+        if options['json']:
+            self.stdout.write(json.dumps(stats, indent=2))
+        elif not stats:
+            self.stdout.write('No cache metrics recorded yet')
+        else:
+            self.stdout.write(
+                f"{'function':<60} {'hits':>8} {'misses':>8} {'hit rate':>9} "
+                f"{'stale':>7} {'avg ms':>9} {'avg bytes':>10} {'oversized':>9}"
+            )
+            for label, values in stats.items():
+                self.stdout.write(
+                    f"{label:<60} {values['hits']:>8} {values['misses']:>8} {values['hit_rate']:>9.1%} "
+                    f"{values['stale_hits']:>7} {values['avg_compute_ms']:>9.3f} {values['avg_bytes']:>10} "
+                    f"{values['oversized']:>9}"
+                )
+        
+        if options['reset']:
+            cache_metrics.reset()
+            self.stdout.write(self.style.SUCCESS('Cache metrics reset'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from communities.utils.counters import flush_upvote_counters, get_upvote_counter_engine
+
+
+class Command(BaseCommand):
+    help = 'Flushes the upvote deltas recorded by the write-behind counter engine to the database'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per UPDATE statement')
+        parser.add_argument('--loop', action='store_true', help='Keep flushing until interrupted')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between flushes with --loop')
+    
+    def handle(self, *args, **options):
+        if not get_upvote_counter_engine().write_behind:
+            self.stdout.write('The upvote counter engine writes to the database directly, nothing to flush')
+            return
+        
+        while True:
+            count = flush_upvote_counters(batch_size=options['batch_size'])
+            if count or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Flushed upvote counters of {count} rows'))
+            
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
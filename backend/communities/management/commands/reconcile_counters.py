@@ -0,0 +1,240 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from communities.services.counter_service import CounterService
+from communities.utils.counters import flush_upvote_counters
+
+
+def init_worker():
+    """Set up Django in a pool process without reusing the parent's database connections"""
+    django.setup()
+    connections.close_all()
+
+
+def reconcile_chunk(counter_index, start, end, fix):
+    """Find (and fix) the drifted rows of one primary key range, in a pool process"""
+    counter = CounterService.COUNTERS[counter_index]
+    try:
+        return CounterService.find_drift(counter, start, end, fix=fix)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconciles the cache counter fields in parallel, checkpointing progress so an '
+        'interrupted run can be resumed, and reports the rows whose counters drifted'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            action='append',
+            choices=CounterService.COUNTER_NAMES,
+            help='Only reconcile these counters (can be repeated)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help='Number of worker processes (1 runs in this process)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CounterService.CHUNK_SIZE,
+            help='Number of primary keys handled by each task'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the drift, without fixing the counters'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default='reconcile_counters.checkpoint.json',
+            help='File recording the finished chunks; an existing checkpoint is resumed'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing checkpoint and start over'
+        )
+        parser.add_argument(
+            '--report',
+            help='Write the drift report to this JSON file'
+        )
+        parser.add_argument(
+            '--max-rows',
+            type=int,
+            default=1000,
+            help='Maximum number of drifted rows listed per counter in the report (largest drift first)'
+        )
+    
+    def handle(self, *args, **options):
+        self.max_rows = options['max_rows']
+        counters = CounterService.get_counters(options['only'])
+        fix = not options['dry_run']
+        
+        state = self.load_checkpoint(options, counters, fix)
+        
+        if fix:
+            # Apply the pending upvote deltas first; the ones recorded during the run
+            # are left out of the recount (see CounterService.split_by_pending)
+            flush_upvote_counters()
+        
+        tasks = [
+            (CounterService.COUNTERS.index(counter), start, end)
+            for counter in counters
+            for start, end in state['counters'][CounterService.get_label(counter)]['pending']
+        ]
+        total = sum(len(entry['chunks']) for entry in state['counters'].values())
+        if len(tasks) < total:
+            self.stdout.write(f'Resuming from {options["checkpoint"]}: {total - len(tasks)}/{total} chunks done')
+        
+        self.run_tasks(tasks, options['workers'], fix, state, options['checkpoint'])
+        
+        report = self.build_report(state)
+        self.print_report(report, fix)
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Drift report written to {options["report"]}')
+        
+        # The run is complete, the next one starts from scratch
+        if os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        
+        self.stdout.write(self.style.SUCCESS('Cache counters reconciled successfully!'))
+    
+    def load_checkpoint(self, options, counters, fix):
+        """Load the checkpoint of an interrupted run, or plan the chunks of a new one"""
+        path = options['checkpoint']
+        params = {
+            'counters': [CounterService.get_label(counter) for counter in counters],
+            'chunk_size': options['chunk_size'],
+            'fix': fix,
+        }
+        
+        if os.path.exists(path) and not options['restart']:
+            with open(path) as f:
+                state = json.load(f)
+            if state['params'] != params:
+                raise CommandError(
+                    f'{path} was written by a run with different options; '
+                    'use the same options or --restart'
+                )
+            return state
+        
+        state = {'params': params, 'counters': {}}
+        for counter in counters:
+            chunks = CounterService.get_chunks(counter, chunk_size=options['chunk_size'])
+            state['counters'][CounterService.get_label(counter)] = {
+                'rows': counter.model.objects.count(),
+                'chunks': chunks,
+                'pending': chunks,
+                'drift': self.empty_drift(),
+            }
+        self.save_checkpoint(path, state)
+        return state
+    
+    def save_checkpoint(self, path, state):
+        # Write to a temporary file first so an interruption never leaves a truncated checkpoint
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    
+    def run_tasks(self, tasks, workers, fix, state, checkpoint):
+        if workers <= 1:
+            for task in tasks:
+                self.record_chunk(state, task, reconcile_chunk(*task, fix), checkpoint)
+            return
+        
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            futures = {
+                executor.submit(reconcile_chunk, *task, fix): task
+                for task in tasks
+            }
+            for future in as_completed(futures):
+                self.record_chunk(state, futures[future], future.result(), checkpoint)
+    
+    def record_chunk(self, state, task, drifted, checkpoint):
+        """Add the drifted rows of a finished chunk to the state and checkpoint it"""
+        counter_index, start, end = task
+        label = CounterService.get_label(CounterService.COUNTERS[counter_index])
+        entry = state['counters'][label]
+        entry['pending'] = [chunk for chunk in entry['pending'] if list(chunk) != [start, end]]
+        
+        drift = entry['drift']
+        for pk, stored, actual in drifted:
+            if stored is None:
+                # Not computed yet rather than drifted
+                drift['uninitialized'] += 1
+                continue
+            difference = stored - actual
+            drift['rows'] += 1
+            drift['over'] += difference > 0
+            drift['under'] += difference < 0
+            drift['net'] += difference
+            drift['absolute'] += abs(difference)
+            drift['max'] = max(drift['max'], abs(difference))
+            drift['samples'].append([pk, stored, actual])
+        drift['samples'] = sorted(
+            drift['samples'],
+            key=lambda row: (-abs(row[1] - row[2]), row[0])
+        )[:self.max_rows]
+        
+        self.save_checkpoint(checkpoint, state)
+        done = len(entry['chunks']) - len(entry['pending'])
+        self.stdout.write(f'  {label}: chunk {done}/{len(entry["chunks"])}, {drift["rows"]} drifted')
+    
+    def empty_drift(self):
+        return {'rows': 0, 'uninitialized': 0, 'over': 0, 'under': 0, 'net': 0, 'absolute': 0, 'max': 0, 'samples': []}
+    
+    def build_report(self, state):
+        """Group the drift of each counter by model"""
+        report = {}
+        for label, entry in state['counters'].items():
+            model, field = label.split('.', 1)
+            drift = entry['drift']
+            report.setdefault(model, {})[field] = {
+                'rows_checked': entry['rows'],
+                'rows_drifted': drift['rows'],
+                'rows_uninitialized': drift['uninitialized'],
+                'drift_rate': round(drift['rows'] / entry['rows'], 6) if entry['rows'] else 0.0,
+                'over_counted': drift['over'],
+                'under_counted': drift['under'],
+                'net_drift': drift['net'],
+                'absolute_drift': drift['absolute'],
+                'max_drift': drift['max'],
+                'rows': [
+                    {'id': pk, 'cached': stored, 'actual': actual, 'difference': stored - actual}
+                    for pk, stored, actual in drift['samples']
+                ],
+            }
+        return report
+    
+    def print_report(self, report, fix):
+        verb = 'fixed' if fix else 'found'
+        for model, fields in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(model))
+            for field, drift in fields.items():
+                style = self.style.WARNING if drift['rows_drifted'] else self.style.SUCCESS
+                self.stdout.write(style(
+                    f"  {field}: {drift['rows_drifted']}/{drift['rows_checked']} rows {verb} "
+                    f"({drift['drift_rate']:.4%}), net {drift['net_drift']:+d}, "
+                    f"absolute {drift['absolute_drift']}, max {drift['max_drift']}, "
+                    f"{drift['rows_uninitialized']} not computed yet"
+                ))
+                for row in drift['rows'][:5]:
+                    self.stdout.write(
+                        f"    id={row['id']} cached={row['cached']} actual={row['actual']} ({row['difference']:+d})"
+                    )
@@ -1,69 +1,73 @@
-from django.core.management.base import BaseCommand
-from communities.models import Community, Post, Comment, Membership
-from django.db.models import Count
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from communities.services.counter_service import CounterService
+from communities.signals import update_all_cache_counts
 
 
 class Command(BaseCommand):
     help = 'Updates all cache counter fields in the communities app'
 
-    def handle(self, *args, **options):
-        self.stdout.write(self.style.SUCCESS('Updating community member counts...'))
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            action='append',
+            choices=CounterService.COUNTER_NAMES,
+            help='Only update these counters (can be repeated)'
+        )
+        parser.add_argument(
+            '--since',
+            help='Only update rows created, or with members/comments changed, since this date or datetime (ISO 8601)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many counters are wrong without updating them'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CounterService.CHUNK_SIZE,
+            help='Number of primary keys covered by each UPDATE statement'
+        )
+    
+    def parse_since(self, value):
+        if not value:
+            return None
         
-        # Update community member counts
-        communities = Community.objects.all()
-        count = 0
-        for community in communities:
-            member_count = Membership.objects.filter(
-                community=community,
-                status='approved'
-            ).count()
-            
-            Community.objects.filter(id=community.id).update(
-                member_count_cache=member_count
-            )
-            count += 1
-            
-            if count % 100 == 0:
-                self.stdout.write(f'  Updated {count} communities')
-                
-        self.stdout.write(self.style.SUCCESS(f'Updated {count} community member counts'))
-        
-        self.stdout.write(self.style.SUCCESS('Updating post counters...'))
+        since = parse_datetime(value)
+        if since is None:
+            date = parse_date(value)
+            if date is None:
+                raise CommandError(f'Invalid --since value: {value}')
+            since = timezone.datetime.combine(date, timezone.datetime.min.time())
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+    
+    def report_progress(self, counter, end, max_id, changed):
+        label = CounterService.get_label(counter)
+        self.stdout.write(f'  {label}: up to id {end} of {max_id}, {changed} changed')
+    
+    def handle(self, *args, **options):
+        since = self.parse_since(options['since'])
+        dry_run = options['dry_run']
         
-        # Update post counters
-        posts = Post.objects.all()
-        count = 0
-        for post in posts:
-            comment_count = Comment.objects.filter(post=post).count()
-            upvote_count = post.upvotes.count()
-            
-            Post.objects.filter(id=post.id).update(
-                comment_count_cache=comment_count,
-                upvote_count_cache=upvote_count
-            )
-            count += 1
-            
-            if count % 100 == 0:
-                self.stdout.write(f'  Updated {count} posts')
-                
-        self.stdout.write(self.style.SUCCESS(f'Updated {count} post counters'))
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Dry run, no counters will be changed'))
+        self.stdout.write(self.style.SUCCESS('Updating cache counters...'))
         
-        self.stdout.write(self.style.SUCCESS('Updating comment upvote counts...'))
+        results = update_all_cache_counts(
+            only=options['only'],
+            since=since,
+            dry_run=dry_run,
+            chunk_size=options['chunk_size'],
+            progress=self.report_progress
+        )
         
-        # Update comment upvote counts
-        comments = Comment.objects.all()
-        count = 0
-        for comment in comments:
-            upvote_count = comment.upvotes.count()
-            
-            Comment.objects.filter(id=comment.id).update(
-                upvote_count_cache=upvote_count
-            )
-            count += 1
-            
-            if count % 100 == 0:
-                self.stdout.write(f'  Updated {count} comments')
-                
-        self.stdout.write(self.style.SUCCESS(f'Updated {count} comment upvote counts'))
+        verb = 'Would update' if dry_run else 'Updated'
+        for label, changed in results.items():
+            self.stdout.write(self.style.SUCCESS(f'{verb} {changed} {label} counters'))
         
-        self.stdout.write(self.style.SUCCESS('All cache counters updated successfully!')) 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('All cache counters updated successfully!'))
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counter_caches(apps, schema_editor):
+    """
+    Recount every counter. Until now a 0 meant "unknown" and the count
+    properties recounted it, so the stored zeros can't be trusted.
+    """
+    Community = apps.get_model('communities', 'Community')
+    Membership = apps.get_model('communities', 'Membership')
+    Post = apps.get_model('communities', 'Post')
+    Comment = apps.get_model('communities', 'Comment')
+
+    def count_of(counted, fk):
+        counts = counted.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(
+            count=Count('pk')
+        ).values('count')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    Community.objects.update(member_count_cache=count_of(
+        Membership.objects.filter(status='approved'), 'community'
+    ))
+    Post.objects.update(
+        comment_count_cache=count_of(Comment.objects.all(), 'post'),
+        upvote_count_cache=count_of(Post.upvotes.through.objects.all(), 'post'),
+    )
+    Comment.objects.update(upvote_count_cache=count_of(Comment.upvotes.through.objects.all(), 'comment'))
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0003_post_event_participant_limit_post_event_participants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='upvote_count_cache',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Cached upvote count for performance (null until computed)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='community',
+            name='member_count_cache',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Cached member count for performance (null until computed)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='comment_count_cache',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Cached comment count for performance (null until computed)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='upvote_count_cache',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Cached upvote count for performance (null until computed)', null=True),
+        ),
+        migrations.RunPython(backfill_counter_caches, migrations.RunPython.noop),
+    ]
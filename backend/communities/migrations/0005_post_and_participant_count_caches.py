@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:55
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(counted, fk):
+    counts = counted.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def backfill_counter_caches(apps, schema_editor):
+    Community = apps.get_model('communities', 'Community')
+    Post = apps.get_model('communities', 'Post')
+
+    Community.objects.update(post_count_cache=count_of(Post.objects.all(), 'community'))
+    Post.objects.update(participant_count_cache=count_of(Post.event_participants.through.objects.all(), 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0004_nullable_counter_caches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='post_count_cache',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Cached post count for performance (null until computed)', null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='participant_count_cache',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Cached event participant count for performance (null until computed)', null=True),
+        ),
+        migrations.RunPython(backfill_counter_caches, migrations.RunPython.noop),
+    ]
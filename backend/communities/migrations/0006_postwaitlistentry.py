@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0005_post_and_participant_count_caches'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+    
+    operations = [
+        migrations.CreateModel(
+            name='PostWaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='communities.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_waitlist_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Post Waitlist Entry',
+                'verbose_name_plural': 'Post Waitlist Entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['post', 'id'], name='communities_post_id_119e90_idx')],
+                'unique_together': {('post', 'user')},
+            },
+        ),
+    ]
@@ -5,6 +5,7 @@ from .community import Community, Membership
 from .post import Post
 from .comment import Comment
 from .invitation import CommunityInvitation
+from .waitlist import PostWaitlistEntry
 
 # Export all models so they can be imported directly from communities.models
 __all__ = [
@@ -13,4 +14,5 @@ __all__ = [
     'Post',
     'Comment',
     'CommunityInvitation',
+    'PostWaitlistEntry',
 ] 
\ No newline at end of file
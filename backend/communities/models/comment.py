@@ -19,7 +19,7 @@ class Comment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     # Performance cache fields
-    upvote_count_cache = models.PositiveIntegerField(default=0, editable=False, help_text="Cached upvote count for performance")
+    upvote_count_cache = models.PositiveIntegerField(default=0, null=True, editable=False, help_text="Cached upvote count for performance (null until computed)")
     
     class Meta:
         ordering = ['created_at']
@@ -36,7 +36,12 @@ class Comment(models.Model):
     
     @property
     def upvote_count(self):
-        return self.upvote_count_cache if self.upvote_count_cache > 0 else self.upvotes.count()
+        if self.upvote_count_cache is not None:
+            # Add the upvotes not flushed yet by a write-behind counter engine
+            from ..utils.counters import get_upvote_counter_engine
+            pending = get_upvote_counter_engine().get_pending(Comment, 'upvote_count_cache', [self.pk])
+            return self.upvote_count_cache + pending.get(self.pk, 0)
+        return self.upvotes.count()
     
     @property
     def is_reply(self):
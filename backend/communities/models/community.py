@@ -47,7 +47,8 @@ class Community(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     # Performance cache fields
-    member_count_cache = models.PositiveIntegerField(default=0, editable=False, help_text="Cached member count for performance")
+    member_count_cache = models.PositiveIntegerField(default=0, null=True, editable=False, help_text="Cached member count for performance (null until computed)")
+    post_count_cache = models.PositiveIntegerField(default=0, null=True, editable=False, help_text="Cached post count for performance (null until computed)")
     
     class Meta:
         verbose_name = "Community"
@@ -75,7 +76,12 @@ class Community(models.Model):
     @property
     def member_count(self):
         """Get the number of members in this community"""
-        return self.member_count_cache if self.member_count_cache > 0 else self.members.count()
+        return self.member_count_cache if self.member_count_cache is not None else self.members.count()
+    
+    @property
+    def post_count(self):
+        """Get the number of posts in this community"""
+        return self.post_count_cache if self.post_count_cache is not None else self.posts.count()
 
 
 class Membership(models.Model):
@@ -40,8 +40,9 @@ class Post(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     # Performance cache fields
-    upvote_count_cache = models.PositiveIntegerField(default=0, editable=False, help_text="Cached upvote count for performance")
-    comment_count_cache = models.PositiveIntegerField(default=0, editable=False, help_text="Cached comment count for performance")
+    upvote_count_cache = models.PositiveIntegerField(default=0, null=True, editable=False, help_text="Cached upvote count for performance (null until computed)")
+    comment_count_cache = models.PositiveIntegerField(default=0, null=True, editable=False, help_text="Cached comment count for performance (null until computed)")
+    participant_count_cache = models.PositiveIntegerField(default=0, null=True, editable=False, help_text="Cached event participant count for performance (null until computed)")
     
     class Meta:
         ordering = ['-is_pinned', '-created_at']
@@ -59,8 +60,18 @@ class Post(models.Model):
     
     @property
     def upvote_count(self):
-        return self.upvote_count_cache if self.upvote_count_cache > 0 else self.upvotes.count()
+        if self.upvote_count_cache is not None:
+            # Add the upvotes not flushed yet by a write-behind counter engine
+            from ..utils.counters import get_upvote_counter_engine
+            pending = get_upvote_counter_engine().get_pending(Post, 'upvote_count_cache', [self.pk])
+            return self.upvote_count_cache + pending.get(self.pk, 0)
+        return self.upvotes.count()
     
     @property
     def comment_count(self):
-        return self.comment_count_cache if self.comment_count_cache > 0 else self.comments.count()
\ No newline at end of file
+        return self.comment_count_cache if self.comment_count_cache is not None else self.comments.count()
+    
+    @property
+    def participant_count(self):
+        """Get the number of participants of an event post"""
+        return self.participant_count_cache if self.participant_count_cache is not None else self.event_participants.count()
\ No newline at end of file
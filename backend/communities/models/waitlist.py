@@ -0,0 +1,24 @@
+from django.db import models
+from django.conf import settings
+from .post import Post
+
+
+class PostWaitlistEntry(models.Model):
+    """Model for a user waiting for a seat at a full event post"""
+    
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='waitlist_entries')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='post_waitlist_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        # Entries are served in id order; (post, id) finds the head and counts positions
+        ordering = ['id']
+        unique_together = ('post', 'user')
+        verbose_name = "Post Waitlist Entry"
+        verbose_name_plural = "Post Waitlist Entries"
+        indexes = [
+            models.Index(fields=['post', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} waiting for {self.post}"
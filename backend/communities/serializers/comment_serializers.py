@@ -29,6 +29,10 @@ class CommentSerializer(serializers.ModelSerializer):
     
     @extend_schema_field(OpenApiTypes.INT)
     def get_upvote_count(self, obj):
+        # Unflushed upvotes preloaded for the whole page by CommentService.get_upvote_deltas, if any
+        upvote_deltas = self.context.get('comment_upvote_deltas')
+        if upvote_deltas is not None and obj.upvote_count_cache is not None:
+            return obj.upvote_count_cache + upvote_deltas.get(obj.id, 0)
         return obj.upvote_count
     
     @extend_schema_field(OpenApiTypes.BOOL)
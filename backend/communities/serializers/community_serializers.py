@@ -49,16 +49,26 @@ class CommunitySerializer(serializers.ModelSerializer):
     
     @extend_schema_field(OpenApiTypes.INT)
     def get_post_count(self, obj):
-        return obj.posts.count()
+        return obj.post_count
+    
+    def _get_membership(self, obj, user):
+        """
+        Get the user's membership for this community as a {'status', 'role'} dict.
+        Uses the page-wide membership map from the context when the view provides one.
+        """
+        membership_map = self.context.get('membership_map')
+        if membership_map is not None:
+            return membership_map.get(obj.id)
+        return Membership.objects.filter(user=user, community=obj).values('status', 'role').first()
     
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_member(self, obj):
         user = self.context.get('request').user
         if user.is_authenticated:
             # Creator is always considered a member
-            if obj.creator and obj.creator.id == user.id:
+            if obj.creator_id == user.id:
                 return True
-            return obj.members.filter(id=user.id).exists()
+            return self._get_membership(obj, user) is not None
         return False
     
     @extend_schema_field(OpenApiTypes.STR)
@@ -66,13 +76,11 @@ class CommunitySerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_authenticated:
             # Creator is always considered approved
-            if obj.creator and obj.creator.id == user.id:
+            if obj.creator_id == user.id:
                 return 'approved'
-            try:
-                membership = Membership.objects.get(user=user, community=obj)
-                return membership.status
-            except Membership.DoesNotExist:
-                pass
+            membership = self._get_membership(obj, user)
+            if membership:
+                return membership['status']
         return None
     
     @extend_schema_field(OpenApiTypes.STR)
@@ -80,13 +88,11 @@ class CommunitySerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_authenticated:
             # Creator is always considered admin
-            if obj.creator and obj.creator.id == user.id:
+            if obj.creator_id == user.id:
                 return 'admin'
-            try:
-                membership = Membership.objects.get(user=user, community=obj)
-                return membership.role
-            except Membership.DoesNotExist:
-                pass
+            membership = self._get_membership(obj, user)
+            if membership:
+                return membership['role']
         return None
 
 
@@ -47,10 +47,20 @@ class PostSerializer(serializers.ModelSerializer):
     
     @extend_schema_field(OpenApiTypes.INT)
     def get_upvote_count(self, obj):
+        viewer_state = self._get_viewer_state()
+        if viewer_state is not None and obj.upvote_count_cache is not None:
+            return obj.upvote_count_cache + viewer_state['upvote_deltas'].get(obj.id, 0)
         return getattr(obj, 'upvote_count', 0)
     
+    def _get_viewer_state(self):
+        """Viewer state preloaded for the whole page by PostService.get_viewer_state, if any"""
+        return self.context.get('viewer_state')
+    
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_has_upvoted(self, obj):
+        viewer_state = self._get_viewer_state()
+        if viewer_state is not None:
+            return obj.id in viewer_state['upvoted_ids']
         request = self.context.get('request')
         if request and hasattr(request, 'user') and request.user.is_authenticated:
             return obj.upvotes.filter(id=request.user.id).exists()
@@ -60,7 +70,7 @@ class PostSerializer(serializers.ModelSerializer):
     def get_participant_count(self, obj):
         """Get number of participants for event posts"""
         if hasattr(obj, 'event_participants') and obj.post_type == 'event':
-            return obj.event_participants.count()
+            return obj.participant_count
         return 0
     
     @extend_schema_field(OpenApiTypes.BOOL)
@@ -71,6 +81,9 @@ class PostSerializer(serializers.ModelSerializer):
             request.user.is_authenticated and 
             obj.post_type == 'event' and
             hasattr(obj, 'event_participants')):
+            viewer_state = self._get_viewer_state()
+            if viewer_state is not None:
+                return obj.id in viewer_state['joined_ids']
             return obj.event_participants.filter(id=request.user.id).exists()
         return False
     
@@ -81,7 +94,7 @@ class PostSerializer(serializers.ModelSerializer):
             hasattr(obj, 'event_participant_limit') and 
             hasattr(obj, 'event_participants') and
             obj.event_participant_limit is not None):
-            return obj.event_participants.count() >= obj.event_participant_limit
+            return self.get_participant_count(obj) >= obj.event_participant_limit
         return False
 
 
@@ -95,7 +108,9 @@ class PostDetailSerializer(PostSerializer):
     @extend_schema_field(serializers.ListField(child=serializers.DictField()))
     def get_comments(self, obj):
         from .comment_serializers import CommentSerializer
+        from ..services.comment_service import CommentService
         # Get top-level comments only
-        comments = obj.comments.filter(parent=None)
-        serializer = CommentSerializer(comments, many=True, context=self.context)
+        comments = list(obj.comments.filter(parent=None))
+        context = {**self.context, 'comment_upvote_deltas': CommentService.get_upvote_deltas(comments)}
+        serializer = CommentSerializer(comments, many=True, context=context)
         return serializer.data
\ No newline at end of file
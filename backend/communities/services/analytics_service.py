@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from ..models import Community, Membership, Post, Comment
+from ..utils.cache import cached_method
+
+
+class AnalyticsService:
+    """
+    Service class for community analytics.
+    
+    All numbers are computed with a fixed number of grouped aggregate queries,
+    independent of the number of posts, comments or members in the community.
+    """
+    
+    RECENT_DAYS = 14
+    
+    @staticmethod
+    @cached_method(timeout=300, models=(Community, Post, Comment))  # Cache for 5 minutes
+    def get_community_analytics(community_id):
+        """
+        Get analytics data for a community: member growth, post activity,
+        engagement totals and top contributors.
+        """
+        since = timezone.now() - timedelta(days=AnalyticsService.RECENT_DAYS)
+        
+        # Approved memberships per day, with the number of those that are recent
+        member_days = list(Membership.objects.filter(
+            community_id=community_id,
+            status='approved'
+        ).annotate(
+            day=TruncDay('joined_at')
+        ).values('day').annotate(
+            count=Count('id'),
+            recent=Count('id', filter=Q(joined_at__gte=since))
+        ).order_by('day'))
+        
+        # Posts per day, with the per-day sums of the cached comment and upvote counters
+        post_days = list(Post.objects.filter(
+            community_id=community_id
+        ).annotate(
+            day=TruncDay('created_at')
+        ).values('day').annotate(
+            count=Count('id'),
+            recent=Count('id', filter=Q(created_at__gte=since)),
+            comments=Sum('comment_count_cache'),
+            upvotes=Sum('upvote_count_cache')
+        ).order_by('day'))
+        
+        member_growth = AnalyticsService._group_by_day_and_month(member_days)
+        post_activity = AnalyticsService._group_by_day_and_month(post_days)
+        
+        total_members = sum(row['count'] for row in member_days)
+        total_posts = sum(row['count'] for row in post_days)
+        total_comments = sum(row['comments'] or 0 for row in post_days)
+        total_upvotes = sum(row['upvotes'] or 0 for row in post_days)
+        
+        # Sum skips the counters that are not computed yet (null),
+        # so count the rows of those posts directly
+        total_comments += Comment.objects.filter(
+            post__community_id=community_id,
+            post__comment_count_cache__isnull=True
+        ).count()
+        total_upvotes += Post.upvotes.through.objects.filter(
+            post__community_id=community_id,
+            post__upvote_count_cache__isnull=True
+        ).count()
+        
+        # Top contributors (members with most posts)
+        top_contributors = Post.objects.filter(
+            community_id=community_id
+        ).values(
+            'author_id',
+            'author__username',
+            'author__first_name',
+            'author__last_name'
+        ).annotate(
+            post_count=Count('id')
+        ).order_by('-post_count')[:10]
+        
+        return {
+            'member_growth': member_growth,
+            'post_activity': post_activity,
+            'engagement_stats': {
+                'total_members': total_members,
+                'total_posts': total_posts,
+                'total_comments': total_comments,
+                'total_upvotes': total_upvotes,
+                'posts_per_member': round(total_posts / total_members, 2) if total_members > 0 else 0,
+                'comments_per_post': round(total_comments / total_posts, 2) if total_posts > 0 else 0,
+                'upvotes_per_post': round(total_upvotes / total_posts, 2) if total_posts > 0 else 0,
+                'avg_upvotes_per_post': round(total_upvotes / total_posts, 2) if total_posts > 0 else 0,
+                'avg_comments_per_post': round(total_comments / total_posts, 2) if total_posts > 0 else 0,
+            },
+            'top_contributors': [
+                {
+                    'author_id': item['author_id'],
+                    'username': item['author__username'],
+                    'full_name': f"{item['author__first_name']} {item['author__last_name']}".strip(),
+                    'post_count': item['post_count']
+                }
+                for item in top_contributors
+            ],
+        }
+    
+    @staticmethod
+    def _group_by_day_and_month(day_rows):
+        """
+        Turn rows of {'day', 'count', 'recent'} into the daily series of the recent
+        days and the monthly series of all time.
+        """
+        daily = []
+        monthly = {}
+        for row in day_rows:
+            day = row['day']
+            if day is None:
+                continue
+            if row['recent']:
+                daily.append({'day': day.isoformat(), 'count': row['recent']})
+            month = day.replace(day=1)
+            monthly[month] = monthly.get(month, 0) + row['count']
+        
+        return {
+            'daily': daily,
+            'monthly': [
+                {'month': month.isoformat(), 'count': count}
+                for month, count in monthly.items()
+            ],
+        }
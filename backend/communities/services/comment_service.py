@@ -3,6 +3,8 @@ from django.db.models import Q, Prefetch
 from rest_framework.exceptions import PermissionDenied
 
 from ..models import Post, Comment, Membership
+from .visibility_service import VisibilityService
+from ..utils.counters import get_upvote_counter_engine
 
 
 class CommentService:
@@ -40,13 +42,7 @@ class CommentService:
             queryset = queryset.filter(parent=None)
         
         # Only show comments the user has access to
-        if not user.is_authenticated:
-            queryset = queryset.filter(post__community__is_private=False)
-        else:
-            queryset = queryset.filter(
-                Q(post__community__is_private=False) | 
-                Q(post__community__members=user)
-            ).distinct()
+        queryset = queryset.filter(VisibilityService.visible_filter(user, prefix='post__community__'))
         
         return queryset
     
@@ -76,6 +72,18 @@ class CommentService:
         
         return parent
     
+    @staticmethod
+    def get_upvote_deltas(comments):
+        """
+        Get the {comment_id: delta} map of upvotes not yet flushed by the counter
+        engine for a page of comments and their loaded replies, in one round trip.
+        """
+        comment_ids = []
+        for comment in comments:
+            comment_ids.append(comment.id)
+            comment_ids.extend(reply.id for reply in getattr(comment, 'nested_replies', ()))
+        return get_upvote_counter_engine().get_pending(Comment, 'upvote_count_cache', comment_ids)
+    
     @staticmethod
     def toggle_comment_upvote(comment, user):
         """
@@ -1,19 +1,20 @@
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.conf import settings
-from django.db.models import Q, Count, Prefetch
-from django.db.models.functions import TruncMonth, TruncDay
+from django.db.models import Q, F, Prefetch
 
-from ..models import Community, Membership, CommunityInvitation
-from ..utils.cache import cache_queryset, cached_method
+from ..models import Community, Membership, CommunityInvitation, Post
+from ..utils.cache import cache_queryset
+from .analytics_service import AnalyticsService
+from .visibility_service import VisibilityService
+from notifications.services import OutboxService
 
 
 class CommunityService:
     """Service class for community operations"""
     
     @staticmethod
-    @cache_queryset(timeout=60)  # Cache for 1 minute
+    @cache_queryset(timeout=60, models=(Community, Post), stampede_protection=True, mode='pks')  # Cache for 1 minute
     def get_community_queryset(user, category=None, search=None, tag=None, member_of=None, order_by='created_at'):
         """
         Get a filtered queryset of communities based on parameters.
@@ -54,28 +55,41 @@ class CommunityService:
         
         # Only show communities the user is a member of
         if member_of and user_id:
-            queryset = queryset.filter(members__id=user_id)
+            queryset = queryset.filter(id__in=VisibilityService.get_member_community_ids(user))
         
         # Only show public communities or communities the user is a member of
-        if not user_id:
-            queryset = queryset.filter(is_private=False)
-        else:
-            queryset = queryset.filter(
-                Q(is_private=False) | 
-                Q(members__id=user_id)
-            ).distinct()
+        queryset = queryset.filter(VisibilityService.visible_filter(user))
         
         # Apply ordering
         if order_by == 'name':
             queryset = queryset.order_by('name')
         elif order_by == 'member_count':
-            # Use cached member count if available, otherwise fallback to annotation
-            queryset = queryset.order_by('-member_count_cache')
+            # Use cached member count, communities not counted yet go last
+            queryset = queryset.order_by(F('member_count_cache').desc(nulls_last=True))
         else:  # Default to most recent
             queryset = queryset.order_by('-created_at')
             
         return queryset
     
+    @staticmethod
+    def get_membership_map(user, community_ids):
+        """
+        Load the user's memberships for a batch of communities in a single query.
+        Returns {community_id: {'status': ..., 'role': ...}}.
+        """
+        if not user or not user.is_authenticated or not community_ids:
+            return {}
+        
+        memberships = Membership.objects.filter(
+            user=user,
+            community_id__in=community_ids
+        ).values_list('community_id', 'status', 'role')
+        
+        return {
+            community_id: {'status': membership_status, 'role': role}
+            for community_id, membership_status, role in memberships
+        }
+    
     @staticmethod
     def join_community(user, community):
         """
@@ -181,20 +195,17 @@ class CommunityService:
             Uni Hub Team
             """
             
-            try:
-                send_mail(
-                    subject,
-                    email_message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [invitation.invitee_email],
-                    fail_silently=False,
-                )
-                invitation.is_sent = True
-                invitation.sent_at = timezone.now()
-                invitation.save()
-                return True, "Invitation sent successfully."
-            except Exception as e:
-                return False, f"Invitation created but email could not be sent: {str(e)}"
+            # Queued in the outbox, the worker delivers it
+            OutboxService.enqueue(
+                subject,
+                email_message,
+                settings.DEFAULT_FROM_EMAIL,
+                [invitation.invitee_email],
+            )
+            invitation.is_sent = True
+            invitation.sent_at = timezone.now()
+            invitation.save()
+            return True, "Invitation sent successfully."
         
         return True, "Invitation created successfully."
     
@@ -254,37 +265,9 @@ class CommunityService:
             return True, "Membership request rejected."
     
     @staticmethod
-    @cached_method(timeout=300)  # Cache for 5 minutes
     def get_community_analytics(community_id):
         """
         Get analytics data for a community.
-        This is a computationally expensive operation, so we cache it.
+        See AnalyticsService.get_community_analytics, which caches the result.
         """
-        community = Community.objects.get(id=community_id)
-        
-        # Member growth analytics
-        member_growth = Membership.objects.filter(
-            community=community, 
-            status='approved'
-        ).annotate(
-            month=TruncMonth('joined_at')
-        ).values('month').annotate(count=Count('id')).order_by('month')
-        
-        # Post activity analytics
-        post_activity = community.posts.annotate(
-            day=TruncDay('created_at')
-        ).values('day').annotate(count=Count('id')).order_by('day')
-        
-        # Top contributors (users with most posts)
-        top_contributors = community.posts.values(
-            'author__id', 'author__username', 'author__first_name', 'author__last_name'
-        ).annotate(post_count=Count('id')).order_by('-post_count')[:10]
-        
-        return {
-            'member_growth': list(member_growth),
-            'post_activity': list(post_activity),
-            'top_contributors': list(top_contributors),
-            'total_members': community.members.filter(membership__status='approved').count(),
-            'total_posts': community.posts.count(),
-            'total_comments': sum(post.comments.count() for post in community.posts.all()),
-        }
\ No newline at end of file
+        return AnalyticsService.get_community_analytics(community_id)
\ No newline at end of file
@@ -0,0 +1,232 @@
+from collections import defaultdict, namedtuple
+
+from django.db.models import Count, F, IntegerField, Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from ..models import Community, Membership, Post, Comment
+from ..utils.counters import get_upvote_counter_engine, get_upvote_counters
+
+
+# A cached counter column and the rows it counts:
+# - name: the counter group used by --only (members, comments, upvotes)
+# - model/field: the model and column holding the counter
+# - counted: a function returning the queryset of counted rows
+# - counted_fk: the field of the counted rows pointing at the counter's model
+# - activity: a function returning a Q of counter rows with counted rows changed since a date
+CounterDefinition = namedtuple('CounterDefinition', ['name', 'model', 'field', 'counted', 'counted_fk', 'activity'])
+
+
+class CounterService:
+    """
+    Service class for recomputing the cached counter columns.
+    
+    Counters are recomputed with set-based UPDATE statements, one per range of
+    primary keys, that set the column from a grouped count subquery and only
+    touch the rows whose stored value is wrong or not computed yet (null).
+    
+    A counter kept by a write-behind engine (upvotes with the Redis engine) is
+    set to its count minus the deltas not flushed yet, since the flush adds
+    them to the row afterwards.
+    """
+    
+    CHUNK_SIZE = 10000
+    
+    COUNTERS = [
+        CounterDefinition(
+            'members', Community, 'member_count_cache',
+            lambda: Membership.objects.filter(status='approved'), 'community',
+            lambda since: Q(created_at__gte=since) | Q(pk__in=Membership.objects.filter(
+                updated_at__gte=since).values('community_id')),
+        ),
+        CounterDefinition(
+            'posts', Community, 'post_count_cache',
+            lambda: Post.objects.all(), 'community',
+            lambda since: Q(created_at__gte=since) | Q(pk__in=Post.objects.filter(
+                created_at__gte=since).values('community_id')),
+        ),
+        CounterDefinition(
+            'comments', Post, 'comment_count_cache',
+            lambda: Comment.objects.all(), 'post',
+            lambda since: Q(created_at__gte=since) | Q(pk__in=Comment.objects.filter(
+                created_at__gte=since).values('post_id')),
+        ),
+        # Upvotes have no timestamps, so --since only covers rows created since
+        CounterDefinition(
+            'upvotes', Post, 'upvote_count_cache',
+            lambda: Post.upvotes.through.objects.all(), 'post',
+            lambda since: Q(created_at__gte=since),
+        ),
+        CounterDefinition(
+            'upvotes', Comment, 'upvote_count_cache',
+            lambda: Comment.upvotes.through.objects.all(), 'comment',
+            lambda since: Q(created_at__gte=since),
+        ),
+        # Event participants have no timestamps either
+        CounterDefinition(
+            'participants', Post, 'participant_count_cache',
+            lambda: Post.event_participants.through.objects.all(), 'post',
+            lambda since: Q(created_at__gte=since),
+        ),
+    ]
+    
+    COUNTER_NAMES = ['members', 'posts', 'comments', 'upvotes', 'participants']
+    
+    @staticmethod
+    def register(counter):
+        """Add the counter of another app (e.g. Event.participant_count_cache)"""
+        CounterService.COUNTERS.append(counter)
+        if counter.name not in CounterService.COUNTER_NAMES:
+            CounterService.COUNTER_NAMES.append(counter.name)
+    
+    @staticmethod
+    def get_counters(only=None):
+        """Get the counter definitions, optionally limited to the given counter names"""
+        return [
+            counter for counter in CounterService.COUNTERS
+            if not only or counter.name in only
+        ]
+    
+    @staticmethod
+    def get_label(counter):
+        return f"{counter.model.__name__}.{counter.field}"
+    
+    @staticmethod
+    def get_count_expression(counter):
+        """Get the correlated grouped count of the counted rows for each counter row"""
+        counts = counter.counted().filter(
+            **{counter.counted_fk: OuterRef('pk')}
+        ).order_by().values(counter.counted_fk).annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+    
+    @staticmethod
+    def get_target_expression(counter, pending_delta=0):
+        """Get the value the counter column should hold, given the delta still pending for the row"""
+        expression = CounterService.get_count_expression(counter)
+        if pending_delta:
+            return Greatest(expression - pending_delta, 0)
+        return expression
+    
+    @staticmethod
+    def split_by_pending(counter, rows, start, end):
+        """
+        Split the counter rows with start <= pk < end into [(pending delta, queryset)]:
+        the rows without a pending delta, then the rows of each pending delta.
+        Only write-behind counters have pending deltas.
+        """
+        if (counter.model, counter.field) not in get_upvote_counters():
+            return [(0, rows)]
+        pending = get_upvote_counter_engine().get_all_pending(counter.model, counter.field)
+        pks_by_delta = defaultdict(list)
+        for pk, delta in pending.items():
+            if delta and start <= pk < end:
+                pks_by_delta[delta].append(pk)
+        if not pks_by_delta:
+            return [(0, rows)]
+        
+        groups = [(0, rows.exclude(pk__in=[pk for pks in pks_by_delta.values() for pk in pks]))]
+        groups += [(delta, rows.filter(pk__in=pks)) for delta, pks in pks_by_delta.items()]
+        return groups
+    
+    @staticmethod
+    def get_queryset(counter, since=None):
+        """Get the counter rows to recompute"""
+        queryset = counter.model.objects.all()
+        if since is not None:
+            queryset = queryset.filter(counter.activity(since))
+        return queryset
+    
+    @staticmethod
+    def get_id_range(counter, since=None):
+        """Get the (min, max) primary key of the rows to recompute, or None if there are none"""
+        bounds = CounterService.get_queryset(counter, since).aggregate(min_id=Min('pk'), max_id=Max('pk'))
+        if bounds['min_id'] is None:
+            return None
+        return bounds['min_id'], bounds['max_id']
+    
+    @staticmethod
+    def recompute_range(counter, start, end, since=None, dry_run=False):
+        """
+        Recompute the counter for the rows with start <= pk < end in one UPDATE.
+        Returns the number of rows whose stored value was wrong (and, unless
+        dry_run, was corrected).
+        """
+        rows = CounterService.get_queryset(counter, since).filter(pk__gte=start, pk__lt=end)
+        changed = 0
+        for pending_delta, queryset in CounterService.split_by_pending(counter, rows, start, end):
+            expression = CounterService.get_target_expression(counter, pending_delta)
+            drifted = queryset.exclude(**{counter.field: expression})
+            if dry_run:
+                changed += drifted.count()
+            else:
+                changed += drifted.update(**{counter.field: expression})
+        return changed
+    
+    @staticmethod
+    def find_drift(counter, start, end, fix=False):
+        """
+        Find the rows with start <= pk < end whose stored counter is wrong.
+        Returns a list of (pk, stored, actual); with fix=True the rows are also corrected.
+        `actual` is the value the counter should hold, without the pending deltas.
+        """
+        rows = counter.model.objects.filter(pk__gte=start, pk__lt=end)
+        drifted = []
+        for pending_delta, queryset in CounterService.split_by_pending(counter, rows, start, end):
+            expression = CounterService.get_target_expression(counter, pending_delta)
+            group = list(queryset.annotate(
+                actual=expression
+            ).exclude(
+                **{counter.field: F('actual')}
+            ).values_list('pk', counter.field, 'actual'))
+            
+            if fix and group:
+                counter.model.objects.filter(
+                    pk__in=[pk for pk, stored, actual in group]
+                ).update(**{counter.field: expression})
+            drifted += group
+        return sorted(drifted)
+    
+    @staticmethod
+    def get_chunks(counter, since=None, chunk_size=None):
+        """Split the primary keys of the rows to recompute into [start, end) ranges"""
+        chunk_size = chunk_size or CounterService.CHUNK_SIZE
+        id_range = CounterService.get_id_range(counter, since)
+        if id_range is None:
+            return []
+        
+        min_id, max_id = id_range
+        return [
+            (start, min(start + chunk_size, max_id + 1))
+            for start in range(min_id, max_id + 1, chunk_size)
+        ]
+    
+    @staticmethod
+    def recompute(counter, since=None, dry_run=False, chunk_size=None, progress=None):
+        """
+        Recompute a counter chunk by chunk.
+        `progress` is called after each chunk with (counter, end, max_id, changed).
+        Returns the number of rows changed.
+        """
+        chunks = CounterService.get_chunks(counter, since=since, chunk_size=chunk_size)
+        if not chunks:
+            return 0
+        
+        max_id = chunks[-1][1] - 1
+        changed = 0
+        for start, end in chunks:
+            changed += CounterService.recompute_range(counter, start, end, since=since, dry_run=dry_run)
+            if progress:
+                progress(counter, end - 1, max_id, changed)
+        return changed
+    
+    @staticmethod
+    def recompute_all(only=None, since=None, dry_run=False, chunk_size=None, progress=None):
+        """
+        Recompute all counters (or the given counter names).
+        Returns {'<Model>.<field>': rows changed}.
+        """
+        return {
+            CounterService.get_label(counter): CounterService.recompute(
+                counter, since=since, dry_run=dry_run, chunk_size=chunk_size, progress=progress
+            )
+            for counter in CounterService.get_counters(only)
+        }
@@ -2,12 +2,25 @@ from django.shortcuts import get_object_or_404
 from django.db.models import Q, Prefetch
 from rest_framework.exceptions import PermissionDenied
 
-from ..models import Community, Membership, Post, Comment
+from ..models import Community, Membership, Post, Comment, PostWaitlistEntry
+from .seat_service import SeatConfig, SeatService
+from .visibility_service import VisibilityService
+from ..utils.counters import get_upvote_counter_engine
 
 
 class PostService:
     """Service class for post operations"""
     
+    # Seats of event posts (see SeatService)
+    EVENT_SEATS = SeatConfig(
+        model=Post,
+        counter_field='participant_count_cache',
+        limit_field='event_participant_limit',
+        participant_model=Post.event_participants.through,
+        waitlist_model=PostWaitlistEntry,
+        fk='post',
+    )
+    
     @staticmethod
     def get_post_queryset(user, community_slug=None, post_type=None, search=None):
         """
@@ -44,17 +57,49 @@ class PostService:
             )
         
         # Only show posts the user has access to
-        if not user.is_authenticated:
-            queryset = queryset.filter(community__is_private=False)
-        else:
-            queryset = queryset.filter(
-                Q(community__is_private=False) | 
-                Q(community__members=user)
-            ).distinct()
+        queryset = queryset.filter(VisibilityService.visible_filter(user, prefix='community__'))
         
         # Default ordering
         return queryset.order_by('-is_pinned', '-created_at')
     
+    @staticmethod
+    def get_viewer_state(user, posts):
+        """
+        Load the requesting user's state for a page of posts in grouped queries.
+        Returns a dict with the set of upvoted post IDs, the set of joined event
+        post IDs and the {post_id: delta} map of upvotes not yet flushed by the
+        counter engine.
+        """
+        post_ids = [post.id for post in posts]
+        event_ids = [post.id for post in posts if post.post_type == 'event']
+        is_authenticated = user is not None and user.is_authenticated
+        
+        viewer_state = {
+            'upvoted_ids': set(),
+            'joined_ids': set(),
+            # Unflushed deltas of a write-behind upvote counter engine, fetched in one round trip
+            'upvote_deltas': get_upvote_counter_engine().get_pending(Post, 'upvote_count_cache', post_ids),
+        }
+        
+        if is_authenticated and post_ids:
+            viewer_state['upvoted_ids'] = set(
+                Post.upvotes.through.objects.filter(
+                    user_id=user.id,
+                    post_id__in=post_ids
+                ).values_list('post_id', flat=True)
+            )
+        
+        if is_authenticated and event_ids:
+            # Participant counts come from Post.participant_count_cache
+            viewer_state['joined_ids'] = set(
+                Post.event_participants.through.objects.filter(
+                    user_id=user.id,
+                    post_id__in=event_ids
+                ).values_list('post_id', flat=True)
+            )
+        
+        return viewer_state
+    
     @staticmethod
     def validate_post_creation(user, community):
         """
@@ -109,6 +154,28 @@ class PostService:
             post.upvotes.add(user)
             return True, "Post upvoted."
     
+    @staticmethod
+    def join_event(post, user):
+        """
+        Join an event post, or its waitlist if it's full (see SeatService).
+        Returns a JoinResult.
+        """
+        return SeatService.join(PostService.EVENT_SEATS, post, user)
+    
+    @staticmethod
+    def leave_event(post, user):
+        """
+        Leave an event post or its waitlist. A freed seat goes to the head of the waitlist.
+        Returns (left, message, participant_count, promoted_user_id); the message
+        tells leaving the event from leaving its waitlist.
+        """
+        result = SeatService.leave(PostService.EVENT_SEATS, post, user)
+        return result.status != 'not_joined', result.message, result.participant_count, result.promoted_user_id
+    
+    @staticmethod
+    def get_waitlist_position(post, user):
+        return SeatService.get_waitlist_position(PostService.EVENT_SEATS, post, user)
+    
     @staticmethod
     def toggle_post_pin(post):
         """
@@ -0,0 +1,162 @@
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+
+from ..utils.counters import apply_counter_deltas, reserve_counter_slot
+
+
+# How a model with a limited number of seats stores them:
+# - model/counter_field/limit_field: the model, its participant counter and its limit
+# - participant_model: the participant rows, with a `user` and a `fk` to the model
+# - waitlist_model: the waitlist rows, with a `user` and a `fk` to the model, served in id order
+SeatConfig = namedtuple('SeatConfig', ['model', 'counter_field', 'limit_field', 'participant_model', 'waitlist_model', 'fk'])
+
+# status is one of 'joined', 'waitlisted', 'already_joined', 'already_waitlisted'
+JoinResult = namedtuple('JoinResult', ['status', 'message', 'participant_count', 'waitlist_position'])
+
+# status is one of 'left', 'left_waitlist', 'not_joined'
+LeaveResult = namedtuple('LeaveResult', ['status', 'message', 'participant_count', 'promoted_user_id'])
+
+
+class SeatService:
+    """
+    Service class for joining limited events, with a waitlist.
+    
+    A seat is reserved with a conditional UPDATE of the participant counter in
+    the same transaction as the participant insert. When the event is full the
+    user is appended to the waitlist instead, and when a participant leaves,
+    the head of the waitlist takes the freed seat in the same transaction.
+    """
+    
+    MESSAGES = {
+        'joined': "You have successfully joined this event.",
+        'waitlisted': "This event is full. You have been added to the waitlist.",
+        'already_joined': "You are already a participant in this event.",
+        'already_waitlisted': "You are already on the waitlist for this event.",
+        'left': "You have successfully left this event.",
+        'left_waitlist': "You have left the waitlist for this event.",
+        'not_joined': "You are not a participant in this event.",
+    }
+    
+    @staticmethod
+    def _result(status, participant_count, waitlist_position=None):
+        return JoinResult(status, SeatService.MESSAGES[status], participant_count, waitlist_position)
+    
+    @staticmethod
+    def _leave_result(status, participant_count, promoted_user_id=None):
+        return LeaveResult(status, SeatService.MESSAGES[status], participant_count, promoted_user_id)
+    
+    @staticmethod
+    def _filter(model, config, obj, **filters):
+        return model.objects.filter(**{f'{config.fk}_id': obj.pk}, **filters)
+    
+    @staticmethod
+    def _get_count(config, obj):
+        return config.model.objects.filter(pk=obj.pk).values_list(config.counter_field, flat=True).first()
+    
+    @staticmethod
+    def _add_participant(config, obj, user_id):
+        participant = config.participant_model(**{f'{config.fk}_id': obj.pk, 'user_id': user_id})
+        # The seat is counted by the caller, counter signals must not count it again
+        participant._counted = True
+        participant.save()
+        return participant
+    
+    @staticmethod
+    def join(config, obj, user):
+        """
+        Join a limited event, or its waitlist if it's full.
+        Returns a JoinResult.
+        """
+        if SeatService._filter(config.participant_model, config, obj, user_id=user.pk).exists():
+            return SeatService._result('already_joined', getattr(obj, config.counter_field))
+        
+        with transaction.atomic():
+            count = reserve_counter_slot(config.model, config.counter_field, obj.pk, getattr(obj, config.limit_field))
+            if count is not None:
+                try:
+                    with transaction.atomic():
+                        SeatService._add_participant(config, obj, user.pk)
+                except IntegrityError:
+                    # Joined concurrently, give the seat back
+                    transaction.set_rollback(True)
+                    return SeatService._result('already_joined', getattr(obj, config.counter_field))
+                
+                # A waiting user can get a seat directly (e.g. the limit was raised)
+                SeatService._filter(config.waitlist_model, config, obj, user_id=user.pk).delete()
+                
+                setattr(obj, config.counter_field, count)
+                return SeatService._result('joined', count)
+            
+            # The event row stays locked until commit, so no seat can be freed
+            # (and given to the waitlist) before this entry is in it
+            try:
+                with transaction.atomic():
+                    config.waitlist_model.objects.create(**{f'{config.fk}_id': obj.pk}, user_id=user.pk)
+            except IntegrityError:
+                status = 'already_waitlisted'
+            else:
+                status = 'waitlisted'
+        
+        return SeatService._result(
+            status,
+            SeatService._get_count(config, obj),
+            SeatService.get_waitlist_position(config, obj, user)
+        )
+    
+    @staticmethod
+    def leave(config, obj, user):
+        """
+        Leave a limited event, or its waitlist. A freed seat is given to the head
+        of the waitlist in the same transaction.
+        Returns a LeaveResult.
+        """
+        promoted_user_id = None
+        with transaction.atomic():
+            # Lock the event row first, so joins finding it full wait for this seat to be handed out
+            current, limit = config.model.objects.select_for_update().filter(
+                pk=obj.pk
+            ).values_list(config.counter_field, config.limit_field).get()
+            
+            participant = SeatService._filter(config.participant_model, config, obj, user_id=user.pk).first()
+            if participant is None:
+                deleted, _ = SeatService._filter(config.waitlist_model, config, obj, user_id=user.pk).delete()
+                return SeatService._leave_result('left_waitlist' if deleted else 'not_joined', current)
+            
+            participant._counted = True
+            participant.delete()
+            
+            # The head is found with the (fk, id) index, the waitlist is never scanned
+            has_room = limit is None or current is None or current - 1 < limit
+            # Entries of users who are participants already are skipped
+            head = SeatService._filter(config.waitlist_model, config, obj).exclude(
+                user_id__in=SeatService._filter(config.participant_model, config, obj).values('user_id')
+            ).order_by('id').first() if has_room else None
+            if head is not None:
+                head.delete()
+                SeatService._add_participant(config, obj, head.user_id)
+                promoted_user_id = head.user_id
+            else:
+                apply_counter_deltas(config.model, config.counter_field, {obj.pk: -1})
+                current = current - 1 if current is not None else None
+        
+        setattr(obj, config.counter_field, current)
+        return SeatService._leave_result('left', current, promoted_user_id)
+    
+    @staticmethod
+    def get_waitlist_position(config, obj, user):
+        """
+        Get the 1-based waitlist position of the user, or None if not waiting.
+        The position counts the entries ahead of the user's on the (fk, id)
+        index, so it costs O(position) rather than O(log n).
+        """
+        entry_id = SeatService._filter(
+            config.waitlist_model, config, obj, user_id=user.pk
+        ).values_list('id', flat=True).first()
+        if entry_id is None:
+            return None
+        return SeatService._filter(config.waitlist_model, config, obj, id__lte=entry_id).count()
+    
+    @staticmethod
+    def get_waitlist_length(config, obj):
+        return SeatService._filter(config.waitlist_model, config, obj).count()
@@ -0,0 +1,61 @@
+from django.core.cache import cache
+from django.db.models import Q
+
+from ..models import Membership
+
+
+class VisibilityService:
+    """
+    Service class for resolving which communities a user can see.
+    
+    A community is visible if it is public or the user has a membership in it.
+    Instead of joining memberships into every list query (which needs a DISTINCT),
+    the user's community IDs are resolved once and cached per user, and list
+    queries filter with "is_private = false OR community_id IN (...)".
+    The cache entry is invalidated from the Membership save/delete signals.
+    """
+    
+    CACHE_TIMEOUT = 300  # 5 minutes
+    
+    @staticmethod
+    def get_cache_key(user_id):
+        return f"visibility:member_community_ids:User:{user_id}"
+    
+    @staticmethod
+    def get_member_community_ids(user):
+        """
+        Get the IDs of all communities the user has a membership in.
+        Returns an empty frozenset for anonymous users.
+        """
+        if not user or not user.is_authenticated:
+            return frozenset()
+        
+        key = VisibilityService.get_cache_key(user.id)
+        community_ids = cache.get(key)
+        if community_ids is None:
+            community_ids = list(
+                Membership.objects.filter(user_id=user.id).values_list('community_id', flat=True)
+            )
+            cache.set(key, community_ids, VisibilityService.CACHE_TIMEOUT)
+        
+        return frozenset(community_ids)
+    
+    @staticmethod
+    def invalidate(user_id):
+        """Drop the cached community IDs for a user"""
+        cache.delete(VisibilityService.get_cache_key(user_id))
+    
+    @staticmethod
+    def visible_filter(user, prefix=''):
+        """
+        Get a Q object matching rows whose community is visible to the user.
+        `prefix` is the lookup path to the community, e.g. 'community__' for posts
+        or 'post__community__' for comments, and '' for communities themselves.
+        """
+        public = Q(**{f'{prefix}is_private': False})
+        
+        community_ids = VisibilityService.get_member_community_ids(user)
+        if not community_ids:
+            return public
+        
+        return public | Q(**{f'{prefix}id__in': sorted(community_ids)})
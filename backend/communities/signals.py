@@ -1,56 +1,169 @@
-from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.db.models.signals import post_init, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.db import models
-from django.db.models import Count
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
 
 from .models import Community, Membership, Post, Comment
+from .services.visibility_service import VisibilityService
+from .services.counter_service import CounterService
+from .utils.cache import bump_generation, invalidate_model_cache
+from .utils.email import send_event_post_join_confirmation
+from .utils.counters import apply_counter_deltas, flush_upvote_counters, get_upvote_counter_engine
+
+
+@receiver(post_init, sender=Membership)
+def remember_membership_status(sender, instance, **kwargs):
+    """Remember the loaded status so saves can tell which transition happened"""
+    # Read from __dict__ so a deferred status field isn't loaded here
+    instance._original_status = instance.__dict__.get('status')
 
 
 @receiver(post_save, sender=Membership)
+def update_community_member_count(sender, instance, created, **kwargs):
+    """Update the member count cache from the membership status transition"""
+    was_approved = not created and instance._original_status == 'approved'
+    is_approved = instance.status == 'approved'
+    instance._original_status = instance.status
+    
+    if is_approved != was_approved:
+        apply_counter_deltas(Community, 'member_count_cache', {
+            instance.community_id: 1 if is_approved else -1
+        })
+
+
 @receiver(post_delete, sender=Membership)
-def update_community_member_count(sender, instance, **kwargs):
-    """Update the member count cache when a membership is created, updated or deleted"""
-    community = instance.community
-    # Use update to avoid triggering other signals
-    Community.objects.filter(id=community.id).update(
-        member_count_cache=Membership.objects.filter(
-            community=community,
-            status='approved'
-        ).count()
-    )
+def decrement_community_member_count(sender, instance, **kwargs):
+    """Update the member count cache when an approved membership is deleted"""
+    if instance._original_status == 'approved':
+        apply_counter_deltas(Community, 'member_count_cache', {instance.community_id: -1})
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def invalidate_member_community_ids(sender, instance, **kwargs):
+    """
+    Drop the user's cached visible community IDs when a membership changes.
+    Dropped again on commit: a concurrent request may have cached the
+    memberships from before the commit in the meantime.
+    """
+    user_id = instance.user_id
+    VisibilityService.invalidate(user_id)
+    transaction.on_commit(lambda: VisibilityService.invalidate(user_id))
 
 
+@receiver(post_save, sender=Community)
+@receiver(post_delete, sender=Community)
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
 @receiver(post_save, sender=Comment)
 @receiver(post_delete, sender=Comment)
-def update_post_comment_count(sender, instance, **kwargs):
-    """Update the comment count cache when a comment is created, updated or deleted"""
-    post = instance.post
-    # Use update to avoid triggering other signals
-    Post.objects.filter(id=post.id).update(
-        comment_count_cache=Comment.objects.filter(post=post).count()
-    )
+def invalidate_cached_entries(sender, instance, **kwargs):
+    """Bump the cache generations of the instance and its model, now and again on commit"""
+    invalidate_model_cache(instance)
+    
+    # The pk is gone from a deleted instance by the time the transaction commits
+    model, pk = sender, instance.pk
+    
+    def invalidate_on_commit():
+        bump_generation(model, pk)
+        bump_generation(model)
+    
+    transaction.on_commit(invalidate_on_commit)
+
+
+@receiver(post_save, sender=Post)
+def increment_community_post_count(sender, instance, created, **kwargs):
+    """Update the post count cache when a post is created"""
+    if created:
+        apply_counter_deltas(Community, 'post_count_cache', {instance.community_id: 1})
+
+
+@receiver(post_delete, sender=Post)
+def decrement_community_post_count(sender, instance, **kwargs):
+    """Update the post count cache when a post is deleted"""
+    apply_counter_deltas(Community, 'post_count_cache', {instance.community_id: -1})
+
+
+@receiver(post_save, sender=Comment)
+def increment_post_comment_count(sender, instance, created, **kwargs):
+    """Update the comment count cache when a comment is created"""
+    if created:
+        apply_counter_deltas(Post, 'comment_count_cache', {instance.post_id: 1})
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_post_comment_count(sender, instance, **kwargs):
+    """Update the comment count cache when a comment is deleted"""
+    apply_counter_deltas(Post, 'comment_count_cache', {instance.post_id: -1})
+
+
+def update_m2m_counter(model, counter_field, instance, action, reverse, pk_set, through, source_field, target_field,
+                       apply=apply_counter_deltas):
+    """
+    Maintain a counter of an M2M relation (e.g. Post.upvote_count_cache for
+    Post.upvotes) from an m2m_changed signal, without recounting the relation.
+    
+    `source_field`/`target_field` are the through model's columns pointing at
+    the model holding the counter and at the related model. For removals and
+    clears, the rows that actually exist are looked up in the pre_* signal
+    (remove reports every given pk, even unrelated ones) and applied in post_*.
+    `apply` applies a {pk: delta} dict, by default directly to the database.
+    """
+    removals_attr = f'_{through._meta.db_table}_counter_removals'
+    
+    if action == 'post_add' and pk_set:
+        # Only the pks that were actually added are reported
+        if reverse:
+            deltas = {pk: 1 for pk in pk_set}
+        else:
+            deltas = {instance.pk: len(pk_set)}
+        apply(model, counter_field, deltas)
+    
+    elif action in ('pre_remove', 'pre_clear'):
+        # The instance is on the source side of the relation, or the target side if reverse
+        own_field, other_field = (target_field, source_field) if reverse else (source_field, target_field)
+        rows = through.objects.filter(**{own_field: instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{f'{other_field}__in': pk_set or ()})
+        
+        if reverse:
+            deltas = {pk: -1 for pk in rows.values_list(source_field, flat=True)}
+        else:
+            deltas = {instance.pk: -rows.count()}
+        setattr(instance, removals_attr, deltas)
+    
+    elif action in ('post_remove', 'post_clear'):
+        deltas = instance.__dict__.pop(removals_attr, None)
+        if deltas:
+            apply(model, counter_field, deltas)
 
 
 @receiver(m2m_changed, sender=Post.upvotes.through)
-def update_post_upvote_count(sender, instance, action, **kwargs):
+def update_post_upvote_count(sender, instance, action, reverse, pk_set, **kwargs):
     """Update the upvote count cache when the post upvotes M2M is changed"""
-    if action in ('post_add', 'post_remove', 'post_clear'):
-        # Only update on changes
-        Post.objects.filter(id=instance.id).update(
-            upvote_count_cache=instance.upvotes.count()
-        )
+    update_m2m_counter(
+        Post, 'upvote_count_cache', instance, action, reverse, pk_set,
+        through=sender, source_field='post_id', target_field='user_id',
+        apply=get_upvote_counter_engine().apply_deltas
+    )
 
 
 @receiver(m2m_changed, sender=Comment.upvotes.through)
-def update_comment_upvote_count(sender, instance, action, **kwargs):
+def update_comment_upvote_count(sender, instance, action, reverse, pk_set, **kwargs):
     """Update the upvote count cache when the comment upvotes M2M is changed"""
-    if action in ('post_add', 'post_remove', 'post_clear'):
-        # Only update on changes
-        Comment.objects.filter(id=instance.id).update(
-            upvote_count_cache=instance.upvotes.count()
-        )
+    update_m2m_counter(
+        Comment, 'upvote_count_cache', instance, action, reverse, pk_set,
+        through=sender, source_field='comment_id', target_field='user_id',
+        apply=get_upvote_counter_engine().apply_deltas
+    )
+
+
+@receiver(m2m_changed, sender=Post.event_participants.through)
+def update_post_participant_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the participant count cache when the event post participants M2M is changed"""
+    update_m2m_counter(
+        Post, 'participant_count_cache', instance, action, reverse, pk_set,
+        through=sender, source_field='post_id', target_field='user_id'
+    )
 
 
 @receiver(m2m_changed, sender=Post.event_participants.through)
@@ -67,86 +180,28 @@ def send_event_join_confirmation_email(sender, instance, action, pk_set, **kwarg
     if instance.post_type != 'event':
         return
     
-    # Skip if no event date
-    if not instance.event_date:
-        return
-    
-    # Get the community
-    community = instance.community
-    
-    # Process each added user
     from django.contrib.auth import get_user_model
     User = get_user_model()
     
-    for user_id in pk_set:
+    for user in User.objects.filter(id__in=pk_set):
         try:
-            user = User.objects.get(id=user_id)
-            
-            # Skip if no email
-            if not user.email:
-                continue
-            
-            # Format date with error handling
-            try:
-                formatted_date = instance.event_date.strftime('%A, %d %B %Y at %I:%M %p')
-            except:
-                formatted_date = "Date not available"
-            
-            # Create email content
-            subject = f"You're Confirmed for {instance.title} 🎉"
-            message = f"""Hi {user.first_name or user.username},
-
-You're confirmed for the event:
-
-📌 {instance.title}  
-📍 Location: {instance.event_location or 'Not specified'}  
-📅 Date & Time: {formatted_date}
-🌐 Community: {community.name}
-
-You can view the event details here:
-{settings.FRONTEND_URL}/communities/{community.slug}/posts/{instance.id}
-
-See you there!
-UniHub Team
-"""
-            # Send the email
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=True
-            )
+            send_event_post_join_confirmation(user, instance)
         except Exception as e:
             # Log but don't break the flow
             print(f"Failed to send confirmation email: {str(e)}")
 
 
 # Batch update function for maintenance or migrations
-def update_all_cache_counts():
-    """Update all cache counters in the database"""
-    
-    # Update community member counts
-    communities = Community.objects.all()
-    for community in communities:
-        Community.objects.filter(id=community.id).update(
-            member_count_cache=Membership.objects.filter(
-                community=community,
-                status='approved'
-            ).count()
-        )
-    
-    # Update post comment counts
-    posts = Post.objects.all()
-    for post in posts:
-        Post.objects.filter(id=post.id).update(
-            comment_count_cache=Comment.objects.filter(post=post).count(),
-            upvote_count_cache=post.upvotes.count()
-        )
+def update_all_cache_counts(only=None, since=None, dry_run=False, chunk_size=None, progress=None):
+    """
+    Update all cache counters in the database.
+    See CounterService.recompute_all for the arguments.
+    """
+    if not dry_run:
+        # Apply pending write-behind deltas first; the ones recorded during the
+        # recount are left out of it (see CounterService.split_by_pending)
+        flush_upvote_counters()
     
-    # Update comment upvote counts
-    comments = Comment.objects.all()
-    for comment in comments:
-        Comment.objects.filter(id=comment.id).update(
-            upvote_count_cache=comment.upvotes.count()
-        )
\ No newline at end of file
+    return CounterService.recompute_all(
+        only=only, since=since, dry_run=dry_run, chunk_size=chunk_size, progress=progress
+    )
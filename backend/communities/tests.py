@@ -1,10 +1,41 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.utils import timezone
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 
-from .models import Community, Membership, Post, Comment
+from .models import Community, Membership, Post, PostWaitlistEntry, Comment
+from .services.post_service import PostService
+from .services.comment_service import CommentService
+from .services.community_service import CommunityService
+from .services.analytics_service import AnalyticsService
+from .services.counter_service import CounterService
+from .services.visibility_service import VisibilityService
+from .signals import update_all_cache_counts
+from .utils.counters import RedisCounterEngine, flush_upvote_counters, get_upvote_counter_engine
+from .utils.local_cache import LocalCache, MISSING, get_local_cache_stats
+from .utils.metrics import MetricsRegistry
+from .utils.cache import (
+    CacheEnvelope, CachedPkList, bump_generation, cache_metrics, cache_queryset, get_cache_stats,
+    get_generation, get_generation_key, get_or_compute_protected, invalidate_model_cache,
+)
 
 
 User = get_user_model()
@@ -344,3 +375,1356 @@ class CommentTests(APITestCase):
         self.assertEqual(Comment.objects.count(), 2)
         self.assertEqual(self.comment.replies.count(), 1)
         self.assertEqual(self.comment.replies.first().content, 'This is a reply to the test comment')
+
+
+class CommunityListQueryTests(APITestCase):
+    """Test that community list pages run a constant number of queries"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='listuser',
+            email='list@example.com',
+            first_name='List',
+            last_name='User',
+            password='testpass123'
+        )
+        self.creator = User.objects.create_user(
+            username='creator',
+            email='creator@example.com',
+            first_name='Community',
+            last_name='Creator',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('communities:community-list')
+    
+    def create_communities(self, count, offset=0):
+        communities = []
+        for i in range(offset, offset + count):
+            community = Community.objects.create(
+                name=f'Community {i}',
+                description='A test community',
+                creator=self.creator
+            )
+            Post.objects.create(
+                title=f'Post {i}',
+                content='Post content',
+                community=community,
+                author=self.creator
+            )
+            communities.append(community)
+        return communities
+    
+    def count_list_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+    
+    def test_query_count_is_independent_of_page_size(self):
+        """Test that adding communities to a page doesn't add queries"""
+        communities = self.create_communities(2)
+        Membership.objects.create(user=self.user, community=communities[0], role='moderator', status='approved')
+        small_page_queries, _ = self.count_list_queries()
+        
+        self.create_communities(5, offset=2)
+        large_page_queries, response = self.count_list_queries()
+        
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(small_page_queries, large_page_queries)
+    
+    def test_membership_fields_use_page_membership_map(self):
+        """Test that membership fields and post counts are correct in bulk mode"""
+        joined, pending, other = self.create_communities(3)
+        Membership.objects.create(user=self.user, community=joined, role='moderator', status='approved')
+        Membership.objects.create(user=self.user, community=pending, role='member', status='pending')
+        
+        _, response = self.count_list_queries()
+        results = {item['slug']: item for item in response.data['results']}
+        
+        self.assertTrue(results[joined.slug]['is_member'])
+        self.assertEqual(results[joined.slug]['membership_role'], 'moderator')
+        self.assertEqual(results[pending.slug]['membership_status'], 'pending')
+        self.assertFalse(results[other.slug]['is_member'])
+        self.assertIsNone(results[other.slug]['membership_status'])
+        self.assertEqual(results[other.slug]['post_count'], 1)
+
+
+class PostFeedQueryTests(APITestCase):
+    """Test that post feeds load viewer state in grouped queries"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='feeduser',
+            email='feed@example.com',
+            first_name='Feed',
+            last_name='User',
+            password='testpass123'
+        )
+        self.community = Community.objects.create(
+            name='Feed Community',
+            slug='feed-community',
+            description='A test community',
+            creator=self.user
+        )
+        Membership.objects.create(user=self.user, community=self.community, role='admin', status='approved')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('communities:community-posts-list', kwargs={'community_slug': self.community.slug})
+    
+    def create_posts(self, count, post_type='event'):
+        posts = []
+        for i in range(count):
+            post = Post.objects.create(
+                title=f'{post_type} {i}',
+                content='Post content',
+                community=self.community,
+                author=self.user,
+                post_type=post_type,
+                event_participant_limit=1 if post_type == 'event' else None
+            )
+            Comment.objects.create(post=post, author=self.user, content='First!')
+            posts.append(post)
+        return posts
+    
+    def count_list_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+    
+    def test_query_count_is_independent_of_page_size(self):
+        """Test that adding posts to a feed page doesn't add queries"""
+        first, _ = self.create_posts(2)
+        first.upvotes.add(self.user)
+        first.event_participants.add(self.user)
+        small_page_queries, _ = self.count_list_queries()
+        
+        self.create_posts(3)
+        self.create_posts(2, post_type='discussion')
+        large_page_queries, _ = self.count_list_queries()
+        
+        self.assertEqual(small_page_queries, large_page_queries)
+    
+    def test_viewer_state_fields(self):
+        """Test has_upvoted, has_joined, participant_count and is_full in bulk mode"""
+        joined, other = self.create_posts(2)
+        joined.upvotes.add(self.user)
+        joined.event_participants.add(self.user)
+        
+        _, response = self.count_list_queries()
+        results = {item['id']: item for item in response.data['results']}
+        
+        self.assertTrue(results[joined.id]['has_upvoted'])
+        self.assertTrue(results[joined.id]['has_joined'])
+        self.assertEqual(results[joined.id]['participant_count'], 1)
+        self.assertTrue(results[joined.id]['is_full'])
+        self.assertFalse(results[other.id]['has_upvoted'])
+        self.assertFalse(results[other.id]['has_joined'])
+        self.assertFalse(results[other.id]['is_full'])
+
+
+class PostKeysetPaginationTests(APITestCase):
+    """Test opt-in keyset pagination for post feeds"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='cursoruser',
+            email='cursor@example.com',
+            first_name='Cursor',
+            last_name='User',
+            password='testpass123'
+        )
+        self.community = Community.objects.create(
+            name='Cursor Community',
+            slug='cursor-community',
+            description='A test community',
+            creator=self.user
+        )
+        Membership.objects.create(user=self.user, community=self.community, role='admin', status='approved')
+        self.posts = [
+            Post.objects.create(
+                title=f'Post {i}',
+                content='Post content',
+                community=self.community,
+                author=self.user,
+                is_pinned=(i == 2)
+            )
+            for i in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('communities:community-posts-list', kwargs={'community_slug': self.community.slug})
+    
+    def test_cursor_pages_follow_feed_order(self):
+        """Test that following next links walks the feed without gaps or duplicates"""
+        seen = []
+        response = self.client.get(self.url, {'pagination': 'cursor', 'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        
+        expected = list(Post.objects.filter(community=self.community).order_by('-is_pinned', '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(seen[0], self.posts[2].id)
+    
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CommentKeysetPaginationTests(APITestCase):
+    """Test opt-in keyset pagination for comments, in both directions"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='commentcursor',
+            email='commentcursor@example.com',
+            first_name='Comment',
+            last_name='Cursor',
+            password='testpass123'
+        )
+        community = Community.objects.create(
+            name='Comment Cursor Community',
+            slug='comment-cursor-community',
+            description='A test community',
+            creator=self.user
+        )
+        post = Post.objects.create(title='Post', content='Content', community=community, author=self.user)
+        for i in range(5):
+            Comment.objects.create(post=post, author=self.user, content=f'Comment {i}')
+        # Ties on created_at are broken by id
+        Comment.objects.filter(post=post).update(created_at=timezone.now())
+        self.expected = list(Comment.objects.filter(post=post).order_by('created_at', 'id').values_list('id', flat=True))
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('communities:post-comments-list', kwargs={
+            'community_slug': community.slug,
+            'post_pk': post.id
+        })
+    
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+    
+    def test_next_and_previous_links_walk_the_comments(self):
+        """Test that next links walk forwards and previous links walk back, without gaps or duplicates"""
+        pages = [self.get_page(self.url, {'pagination': 'cursor', 'page_size': 2})]
+        self.assertIsNone(pages[0]['previous'])
+        while pages[-1]['next']:
+            pages.append(self.get_page(pages[-1]['next']))
+        self.assertEqual([comment['id'] for page in pages for comment in page['results']], self.expected)
+        self.assertEqual(len(pages), 3)
+        
+        backwards = [pages[-1]]
+        while backwards[-1]['previous']:
+            backwards.append(self.get_page(backwards[-1]['previous']))
+        self.assertEqual(
+            [[comment['id'] for comment in page['results']] for page in backwards],
+            [[comment['id'] for comment in page['results']] for page in reversed(pages)]
+        )
+        self.assertIsNotNone(backwards[-1]['next'])
+    
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class VisibilityTests(APITestCase):
+    """Test private community visibility through the cached membership set"""
+    
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username='owner',
+            email='owner@example.com',
+            first_name='Owner',
+            last_name='User',
+            password='testpass123'
+        )
+        self.outsider = User.objects.create_user(
+            username='outsider',
+            email='outsider@example.com',
+            first_name='Outsider',
+            last_name='User',
+            password='testpass123'
+        )
+        self.private = Community.objects.create(
+            name='Private Community',
+            slug='private-community',
+            description='A private community',
+            creator=self.owner,
+            is_private=True
+        )
+        self.public = Community.objects.create(
+            name='Public Community',
+            slug='public-community',
+            description='A public community',
+            creator=self.owner
+        )
+        for community in (self.private, self.public):
+            Membership.objects.create(user=self.owner, community=community, role='admin', status='approved')
+            Post.objects.create(title=f'{community.name} post', content='Content', community=community, author=self.owner)
+        cache.clear()
+    
+    def test_private_posts_hidden_from_non_members(self):
+        """Test that non-members only see posts from public communities"""
+        posts = PostService.get_post_queryset(self.outsider)
+        self.assertEqual([post.community_id for post in posts], [self.public.id])
+        
+        posts = PostService.get_post_queryset(self.owner)
+        self.assertEqual(sorted(post.community_id for post in posts), sorted([self.private.id, self.public.id]))
+    
+    def test_membership_change_invalidates_cached_ids(self):
+        """Test that joining a private community makes it visible immediately"""
+        self.assertFalse(PostService.get_post_queryset(self.outsider).filter(community=self.private).exists())
+        
+        Membership.objects.create(user=self.outsider, community=self.private, role='member', status='approved')
+        self.assertTrue(PostService.get_post_queryset(self.outsider).filter(community=self.private).exists())
+        
+        Membership.objects.filter(user=self.outsider, community=self.private).delete()
+        self.assertFalse(PostService.get_post_queryset(self.outsider).filter(community=self.private).exists())
+    
+    def test_ids_cached_before_the_commit_are_dropped(self):
+        """Test that IDs cached by a concurrent request before the commit don't outlive it"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Membership.objects.create(user=self.outsider, community=self.private, role='member', status='approved')
+            # A concurrent request still sees the memberships from before the commit
+            cache.set(VisibilityService.get_cache_key(self.outsider.id), [], VisibilityService.CACHE_TIMEOUT)
+        
+        self.assertIn(self.private.id, VisibilityService.get_member_community_ids(self.outsider))
+    
+    def test_visibility_queries_do_not_use_distinct(self):
+        """Test that visibility filtering no longer needs DISTINCT"""
+        self.assertFalse(PostService.get_post_queryset(self.owner).query.distinct)
+        self.assertFalse(CommentService.get_comment_queryset(self.owner).query.distinct)
+
+
+class CacheGenerationTests(TestCase):
+    """Test generation-based invalidation of cached querysets and methods"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='genuser',
+            email='gen@example.com',
+            first_name='Gen',
+            last_name='User',
+            password='testpass123'
+        )
+        self.community = Community.objects.create(
+            name='Cached Community',
+            slug='cached-community',
+            description='A cached community',
+            creator=self.user
+        )
+    
+    def test_cached_queryset_is_reused_until_invalidated(self):
+        """Test that saving a community invalidates cached community lists"""
+        CommunityService.get_community_queryset(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            cached = CommunityService.get_community_queryset(self.user)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([c.name for c in cached], ['Cached Community'])
+        
+        self.community.name = 'Renamed Community'
+        self.community.save()
+        
+        refreshed = CommunityService.get_community_queryset(self.user)
+        self.assertEqual([c.name for c in refreshed], ['Renamed Community'])
+    
+    def test_invalidation_bumps_generations(self):
+        """Test that invalidating an instance bumps its own and its model's generation"""
+        instance_generation = get_generation(self.community, self.community.pk)
+        model_generation = get_generation(Community)
+        
+        invalidate_model_cache(self.community)
+        
+        self.assertEqual(get_generation(self.community, self.community.pk), instance_generation + 1)
+        self.assertEqual(get_generation(Community), model_generation + 1)
+    
+    def test_generations_are_bumped_again_on_commit(self):
+        """Test that entries cached from before the commit are invalidated when it commits"""
+        pk = self.community.pk
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.community.delete()
+        instance_generation = get_generation(Community, pk)
+        model_generation = get_generation(Community)
+        
+        for callback in callbacks:
+            callback()
+        
+        self.assertEqual(get_generation(Community, pk), instance_generation + 1)
+        self.assertEqual(get_generation(Community), model_generation + 1)
+    
+    def test_bump_recreates_evicted_generation(self):
+        """Test that an evicted counter restarts above the generations it replaced"""
+        generation = get_generation(Post)
+        cache.delete(get_generation_key(Post))
+        self.assertGreaterEqual(bump_generation(Post), generation)
+
+
+class LocalCacheTests(TestCase):
+    """Test the in-process L1 cache tier"""
+    
+    def test_lru_eviction_and_expiry(self):
+        """Test that the least recently used entry is evicted and expired entries miss"""
+        local = LocalCache(max_entries=2, timeout=30)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+        
+        self.assertEqual(local.get('a'), 1)
+        self.assertIs(local.get('b'), MISSING)
+        self.assertEqual(local.get('c'), 3)
+        
+        local.set('d', 4, timeout=0)
+        self.assertIs(local.get('d'), MISSING)
+        self.assertEqual(local.stats()['hits'], 3)
+    
+    def test_hits_are_copies(self):
+        """Test that changing a value read from the L1 cache doesn't change the cached value"""
+        local = LocalCache(max_entries=2, timeout=30)
+        local.set('a', {'name': 'Original'})
+        local.get('a')['name'] = 'Changed'
+        
+        self.assertEqual(local.get('a'), {'name': 'Original'})
+    
+    @override_settings(COMMUNITIES_L1_CACHE={'ENABLED': True, 'MAX_ENTRIES': 16, 'TIMEOUT': 30})
+    def test_cached_queryset_served_from_process_memory(self):
+        """Test that repeated lookups hit the L1 tier and invalidation still applies"""
+        cache.clear()
+        user = User.objects.create_user(
+            username='l1user',
+            email='l1@example.com',
+            first_name='Local',
+            last_name='User',
+            password='testpass123'
+        )
+        community = Community.objects.create(
+            name='Hot Community',
+            slug='hot-community',
+            description='A hot community',
+            creator=user
+        )
+        
+        CommunityService.get_community_queryset(user)
+        hits = get_local_cache_stats()['hits']
+        CommunityService.get_community_queryset(user)
+        self.assertEqual(get_local_cache_stats()['hits'], hits + 1)
+        
+        community.name = 'Renamed Hot Community'
+        community.save()
+        self.assertEqual(
+            [c.name for c in CommunityService.get_community_queryset(user)],
+            ['Renamed Hot Community']
+        )
+
+
+@override_settings(COMMUNITIES_L1_CACHE={'ENABLED': False})
+class StampedeProtectionTests(TestCase):
+    """Test single-flight recomputation of stampede protected cache entries"""
+    
+    def setUp(self):
+        cache.clear()
+        self.key = 'stampede-test'
+        self.calls = []
+    
+    def compute(self):
+        self.calls.append(1)
+        return len(self.calls)
+    
+    def test_fresh_entry_is_served_without_recomputing(self):
+        """Test that an entry far from expiry is served from the cache"""
+        self.assertEqual(get_or_compute_protected(self.key, self.compute, 60), 1)
+        self.assertEqual(get_or_compute_protected(self.key, self.compute, 60), 1)
+        self.assertEqual(len(self.calls), 1)
+    
+    def test_stale_entry_served_while_another_worker_refreshes(self):
+        """Test that the stale value is returned when the refresh lock is taken"""
+        cache.set(self.key, CacheEnvelope('stale', time.time() - 1, 0.1), 60)
+        cache.add(f'{self.key}:lock', 1, 10)
+        
+        self.assertEqual(get_or_compute_protected(self.key, self.compute, 60), 'stale')
+        self.assertEqual(self.calls, [])
+    
+    def test_expired_entry_refreshed_by_lock_holder(self):
+        """Test that the worker getting the lock recomputes and releases it"""
+        cache.set(self.key, CacheEnvelope('stale', time.time() - 1, 0.1), 60)
+        
+        self.assertEqual(get_or_compute_protected(self.key, self.compute, 60), 1)
+        self.assertEqual(cache.get(self.key).value, 1)
+        self.assertIsNone(cache.get(f'{self.key}:lock'))
+    
+    def test_waiters_compute_when_the_lock_holder_fails(self):
+        """Test that waiters stop waiting when the lock is released without a value"""
+        def fail():
+            time.sleep(0.2)
+            raise ValueError('compute failed')
+        
+        def hold_lock():
+            with self.assertRaises(ValueError):
+                get_or_compute_protected(self.key, fail, 60)
+        
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        while cache.get(f'{self.key}:lock') is None:
+            time.sleep(0.01)
+        
+        start = time.monotonic()
+        self.assertEqual(get_or_compute_protected(self.key, self.compute, 60), 1)
+        holder.join()
+        self.assertLess(time.monotonic() - start, 2)
+    
+    def test_waiters_compute_when_the_value_is_too_large(self):
+        """Test that waiters don't wait out the lock for a value that is never stored"""
+        def compute_large():
+            time.sleep(0.2)
+            return 'x' * 1000
+        
+        holder = threading.Thread(target=get_or_compute_protected, args=(self.key, compute_large, 60), kwargs={'max_bytes': 100})
+        holder.start()
+        while cache.get(f'{self.key}:lock') is None:
+            time.sleep(0.01)
+        
+        start = time.monotonic()
+        self.assertEqual(get_or_compute_protected(self.key, compute_large, 60, max_bytes=100), 'x' * 1000)
+        holder.join()
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertIsNone(cache.get(self.key))
+
+
+class CachedPkListTests(TestCase):
+    """Test the compact primary key mode of cache_queryset"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='pkuser',
+            email='pk@example.com',
+            first_name='Pk',
+            last_name='User',
+            password='testpass123'
+        )
+        for i in range(5):
+            Community.objects.create(
+                name=f'Community {i}',
+                slug=f'community-{i}',
+                description='A community',
+                creator=self.user
+            )
+    
+    def test_only_primary_keys_are_cached(self):
+        """Test that the cache holds the ordered primary keys and records their size"""
+        cache_metrics.reset()
+        communities = CommunityService.get_community_queryset(self.user)
+        self.assertIsInstance(communities, CachedPkList)
+        
+        ordered_ids = list(Community.objects.order_by('-created_at').values_list('id', flat=True))
+        self.assertEqual(communities.pks, ordered_ids)
+        self.assertEqual([community.id for community in communities], ordered_ids)
+        
+        stats = get_cache_stats()['cache_queryset:CommunityService.get_community_queryset']
+        self.assertGreater(stats['avg_bytes'], 0)
+    
+    def test_slice_rehydrates_only_requested_rows(self):
+        """Test that slicing loads just the page, in cached order"""
+        communities = CommunityService.get_community_queryset(self.user)
+        page = communities[1:3]
+        self.assertEqual([community.id for community in page], communities.pks[1:3])
+        
+        Community.objects.filter(id=communities.pks[1]).delete()
+        self.assertEqual([community.id for community in communities[1:3]], communities.pks[2:3])
+    
+    def test_oversized_entries_are_not_cached(self):
+        """Test that entries over max_bytes are computed but not stored"""
+        cache_metrics.reset()
+        
+        @cache_queryset(timeout=60, mode='pks', max_bytes=1)
+        def all_communities():
+            return Community.objects.order_by('id')
+        
+        self.assertEqual(len(all_communities()), 5)
+        self.assertEqual(get_cache_stats()[f'cache_queryset:{all_communities.__qualname__}']['oversized'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            all_communities()
+        self.assertEqual(len(queries), 1)
+
+
+class CacheMetricsTests(APITestCase):
+    """Test the cache metrics registry and its admin endpoint"""
+    
+    def setUp(self):
+        cache.clear()
+        cache_metrics.reset()
+        self.user = User.objects.create_user(
+            username='metricsuser',
+            email='metrics@example.com',
+            first_name='Metrics',
+            last_name='User',
+            password='testpass123'
+        )
+        self.admin = User.objects.create_user(
+            username='metricsadmin',
+            email='metricsadmin@example.com',
+            first_name='Metrics',
+            last_name='Admin',
+            password='testpass123',
+            is_staff=True
+        )
+        self.url = reverse('communities:cache-metrics')
+    
+    def test_hits_and_misses_are_recorded(self):
+        """Test that a miss followed by a hit is counted per function"""
+        CommunityService.get_community_queryset(self.user)
+        CommunityService.get_community_queryset(self.user)
+        
+        stats = get_cache_stats()['cache_queryset:CommunityService.get_community_queryset']
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+        self.assertEqual(stats['stored'], 1)
+    
+    def test_endpoint_is_admin_only(self):
+        """Test that only staff users can read the metrics"""
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        
+        CommunityService.get_community_queryset(self.user)
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('cache_queryset:CommunityService.get_community_queryset', response.data['functions'])
+        self.assertIn('local_cache', response.data)
+    
+    def test_names_of_all_processes_are_indexed(self):
+        """Test that registries flushing in separate processes add their names to one index"""
+        first, second = (MetricsRegistry('test-processes', fields=('hits',)) for _ in range(2))
+        self.addCleanup(first.reset)
+        first.incr('shared', 'hits')
+        second.incr('shared', 'hits')
+        second.incr('second-only', 'hits')
+        first.flush()
+        second.flush()
+        
+        self.assertEqual(
+            MetricsRegistry('test-processes', fields=('hits',)).snapshot(),
+            {'second-only': {'hits': 1}, 'shared': {'hits': 2}}
+        )
+    
+    def test_async_increments_flush_off_the_event_loop(self):
+        """Test that a flush due in aincr runs in a worker thread"""
+        registry = MetricsRegistry('test-async', fields=('hits',), flush_interval=0)
+        self.addCleanup(registry.reset)
+        flush = registry.flush
+        loop_threads, flush_threads = [], []
+        
+        def record_thread():
+            flush_threads.append(threading.get_ident())
+            flush()
+        
+        async def increment():
+            loop_threads.append(threading.get_ident())
+            await registry.aincr('async', 'hits')
+        
+        with mock.patch.object(registry, 'flush', record_thread):
+            async_to_sync(increment)()
+        
+        self.assertEqual(len(flush_threads), 1)
+        self.assertNotEqual(flush_threads[0], loop_threads[0])
+        self.assertEqual(registry.snapshot(), {'async': {'hits': 1}})
+
+
+class AnalyticsServiceTests(APITestCase):
+    """Test community analytics aggregation and caching"""
+    
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='analyst',
+            email='analyst@example.com',
+            first_name='Ana',
+            last_name='Lyst',
+            password='testpass123'
+        )
+        self.community = Community.objects.create(
+            name='Analytics Community',
+            slug='analytics-community',
+            description='A community with activity',
+            creator=self.user
+        )
+        self.other = Community.objects.create(
+            name='Quiet Community',
+            slug='quiet-community',
+            description='A community without activity',
+            creator=self.user
+        )
+        Membership.objects.create(user=self.user, community=self.community, role='admin', status='approved')
+    
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(
+                title=f'Post {i}',
+                content='Content',
+                community=self.community,
+                author=self.user
+            )
+            Comment.objects.create(post=post, author=self.user, content='One')
+            Comment.objects.create(post=post, author=self.user, content='Two')
+            post.upvotes.add(self.user)
+    
+    def analytics_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            analytics = AnalyticsService.get_community_analytics(self.community.id)
+        return len(queries), analytics
+    
+    def test_query_count_is_independent_of_post_count(self):
+        """Test that totals come from grouped aggregates, not per-post queries"""
+        self.create_posts(2)
+        few_queries, analytics = self.analytics_queries()
+        self.assertEqual(analytics['engagement_stats']['total_comments'], 4)
+        
+        self.create_posts(8)
+        many_queries, analytics = self.analytics_queries()
+        self.assertEqual(few_queries, many_queries)
+        
+        stats = analytics['engagement_stats']
+        self.assertEqual(stats['total_members'], 1)
+        self.assertEqual(stats['total_posts'], 10)
+        self.assertEqual(stats['total_comments'], 20)
+        self.assertEqual(stats['total_upvotes'], 10)
+        self.assertEqual(analytics['top_contributors'][0]['post_count'], 10)
+        self.assertEqual(sum(day['count'] for day in analytics['post_activity']['daily']), 10)
+    
+    def test_uninitialized_counters_are_counted(self):
+        """Test that posts whose counters are not computed yet are counted from the rows"""
+        self.create_posts(3)
+        Post.objects.filter(community=self.community).update(comment_count_cache=None, upvote_count_cache=None)
+        
+        _, analytics = self.analytics_queries()
+        self.assertEqual(analytics['engagement_stats']['total_comments'], 6)
+        self.assertEqual(analytics['engagement_stats']['total_upvotes'], 3)
+    
+    def test_results_are_cached_per_community(self):
+        """Test that the cache is keyed on the community id"""
+        self.create_posts(1)
+        busy = AnalyticsService.get_community_analytics(self.community.id)
+        quiet = AnalyticsService.get_community_analytics(self.other.id)
+        
+        self.assertEqual(busy['engagement_stats']['total_posts'], 1)
+        self.assertEqual(quiet['engagement_stats']['total_posts'], 0)
+        with CaptureQueriesContext(connection) as queries:
+            AnalyticsService.get_community_analytics(self.community.id)
+        self.assertEqual(len(queries), 0)
+    
+    def test_analytics_endpoint(self):
+        """Test that the analytics endpoint returns the service's totals"""
+        self.create_posts(2)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('communities:community-analytics', kwargs={'slug': self.community.slug}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['engagement_stats']['total_upvotes'], 2)
+
+
+class CounterSignalTests(TestCase):
+    """Test delta-based maintenance of the cached counters"""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'counter{i}',
+                email=f'counter{i}@example.com',
+                first_name='Counter',
+                last_name=f'User{i}',
+                password='testpass123'
+            )
+            for i in range(3)
+        ]
+        self.community = Community.objects.create(
+            name='Counter Community',
+            slug='counter-community',
+            description='A community with counters',
+            creator=self.users[0]
+        )
+        self.post = Post.objects.create(
+            title='Counted post',
+            content='Content',
+            community=self.community,
+            author=self.users[0]
+        )
+    
+    def counter(self, obj, field):
+        return obj.__class__.objects.values_list(field, flat=True).get(pk=obj.pk)
+    
+    def test_member_count_follows_status_transitions(self):
+        """Test that only transitions to and from 'approved' change the member count"""
+        pending = Membership.objects.create(user=self.users[1], community=self.community, status='pending')
+        self.assertEqual(self.counter(self.community, 'member_count_cache'), 0)
+        
+        pending.status = 'approved'
+        pending.save()
+        Membership.objects.create(user=self.users[2], community=self.community, status='approved')
+        self.assertEqual(self.counter(self.community, 'member_count_cache'), 2)
+        
+        pending.save()
+        self.assertEqual(self.counter(self.community, 'member_count_cache'), 2)
+        
+        pending.status = 'rejected'
+        pending.save()
+        self.assertEqual(self.counter(self.community, 'member_count_cache'), 1)
+        
+        Membership.objects.filter(user=self.users[2]).delete()
+        pending.delete()
+        self.assertEqual(self.counter(self.community, 'member_count_cache'), 0)
+    
+    def test_comment_count_uses_deltas(self):
+        """Test that adding a comment doesn't recount the post's comments"""
+        Comment.objects.create(post=self.post, author=self.users[1], content='First')
+        with CaptureQueriesContext(connection) as queries:
+            comment = Comment.objects.create(post=self.post, author=self.users[1], content='Second')
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(self.counter(self.post, 'comment_count_cache'), 2)
+        
+        comment.delete()
+        self.assertEqual(self.counter(self.post, 'comment_count_cache'), 1)
+    
+    def test_upvote_counts_forward_and_reverse(self):
+        """Test upvote counters for add/remove/clear from both sides of the relation"""
+        other = Post.objects.create(title='Other', content='Content', community=self.community, author=self.users[0])
+        
+        self.post.upvotes.add(self.users[0], self.users[1])
+        self.post.upvotes.add(self.users[1])
+        self.assertEqual(self.counter(self.post, 'upvote_count_cache'), 2)
+        
+        # Removing a user that never upvoted must not decrement
+        self.post.upvotes.remove(self.users[1], self.users[2])
+        self.assertEqual(self.counter(self.post, 'upvote_count_cache'), 1)
+        
+        self.users[2].upvoted_posts.add(self.post, other)
+        self.assertEqual(self.counter(self.post, 'upvote_count_cache'), 2)
+        self.assertEqual(self.counter(other, 'upvote_count_cache'), 1)
+        
+        self.users[2].upvoted_posts.clear()
+        self.assertEqual(self.counter(self.post, 'upvote_count_cache'), 1)
+        self.assertEqual(self.counter(other, 'upvote_count_cache'), 0)
+        
+        self.post.upvotes.clear()
+        self.assertEqual(self.counter(self.post, 'upvote_count_cache'), 0)
+        
+        comment = Comment.objects.create(post=self.post, author=self.users[1], content='Upvote me')
+        comment.upvotes.add(self.users[0])
+        self.users[1].upvoted_comments.add(comment)
+        self.users[0].upvoted_comments.remove(comment)
+        self.assertEqual(self.counter(comment, 'upvote_count_cache'), 1)
+    
+    def test_reconciliation_corrects_drift(self):
+        """Test that the periodic recount fixes counters changed without signals"""
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.users[1], content='Bulk')
+            for _ in range(3)
+        ])
+        self.assertEqual(self.counter(self.post, 'comment_count_cache'), 0)
+        
+        update_all_cache_counts()
+        self.assertEqual(self.counter(self.post, 'comment_count_cache'), 3)
+    
+    def test_zero_counts_need_no_queries(self):
+        """Test that a computed zero is trusted instead of recounted"""
+        post = Post.objects.get(pk=self.post.pk)
+        community = Community.objects.get(pk=self.community.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(post.comment_count, 0)
+            self.assertEqual(post.upvote_count, 0)
+            self.assertEqual(community.member_count, 0)
+    
+    def test_uninitialized_counter(self):
+        """Test that a counter that is not computed yet is recounted and ignores deltas"""
+        Post.objects.filter(pk=self.post.pk).update(comment_count_cache=None)
+        Comment.objects.create(post=self.post, author=self.users[1], content='Not counted')
+        self.assertIsNone(self.counter(self.post, 'comment_count_cache'))
+        
+        post = Post.objects.get(pk=self.post.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(post.comment_count, 1)
+        
+        self.assertEqual(update_all_cache_counts(only=['comments'])['Post.comment_count_cache'], 1)
+        self.assertEqual(self.counter(self.post, 'comment_count_cache'), 1)
+    
+    def test_post_count_follows_creates_and_deletes(self):
+        """Test that creating and deleting posts keeps the community post count"""
+        self.assertEqual(self.counter(self.community, 'post_count_cache'), 1)
+        extra = Post.objects.create(title='Extra', content='Content', community=self.community, author=self.users[1])
+        self.assertEqual(self.counter(self.community, 'post_count_cache'), 2)
+        
+        extra.delete()
+        community = Community.objects.get(pk=self.community.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(community.post_count, 1)
+    
+    def test_event_post_participant_count(self):
+        """Test that the event post participant count follows the participants M2M"""
+        self.post.event_participants.add(self.users[1], self.users[2])
+        self.assertEqual(self.counter(self.post, 'participant_count_cache'), 2)
+        
+        self.users[1].participated_events.remove(self.post)
+        self.post.event_participants.clear()
+        self.assertEqual(self.counter(self.post, 'participant_count_cache'), 0)
+
+
+def redis_available():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default').ping()
+    except Exception:
+        return False
+
+
+@skipUnless(redis_available(), 'The default cache is not a reachable Redis server')
+class RedisUpvoteCounterTests(TestCase):
+    """Test the write-behind upvote counter engine"""
+    
+    def setUp(self):
+        self.engine = RedisCounterEngine()
+        self.engine.key_prefix = 'test_counter_deltas'
+        self.user = User.objects.create_user(
+            username='voter',
+            email='voter@example.com',
+            first_name='Vo',
+            last_name='Ter',
+            password='testpass123'
+        )
+        community = Community.objects.create(
+            name='Voting Community',
+            slug='voting-community',
+            description='A community for votes',
+            creator=self.user
+        )
+        self.post = Post.objects.create(title='Hot', content='Content', community=community, author=self.user)
+        Post.objects.filter(pk=self.post.pk).update(upvote_count_cache=10)
+    
+    def tearDown(self):
+        key = self.engine.get_key(Post, 'upvote_count_cache')
+        self.engine.connection.delete(key, f'{key}:flushing')
+    
+    def test_deltas_are_pending_until_flushed(self):
+        """Test that deltas are kept in Redis and applied to the row by a flush"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.engine.apply_deltas(Post, 'upvote_count_cache', {self.post.pk: 3})
+            self.engine.apply_deltas(Post, 'upvote_count_cache', {self.post.pk: -1})
+        
+        self.assertEqual(self.engine.get_pending(Post, 'upvote_count_cache', [self.post.pk]), {self.post.pk: 2})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.upvote_count_cache, 10)
+        
+        self.assertEqual(self.engine.flush(Post, 'upvote_count_cache'), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.upvote_count_cache, 12)
+        self.assertEqual(self.engine.get_pending(Post, 'upvote_count_cache', [self.post.pk]), {})
+        self.assertEqual(self.engine.flush(Post, 'upvote_count_cache'), 0)
+    
+    def test_rolled_back_deltas_are_not_recorded(self):
+        """Test that deltas are only recorded when the transaction commits"""
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.engine.apply_deltas(Post, 'upvote_count_cache', {self.post.pk: 1})
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        
+        self.assertEqual(self.engine.get_pending(Post, 'upvote_count_cache', [self.post.pk]), {})
+    
+    def test_pending_includes_the_hash_being_flushed(self):
+        """Test that the deltas a flush has renamed away are still read as pending"""
+        key = self.engine.get_key(Post, 'upvote_count_cache')
+        self.engine.record_deltas(Post, 'upvote_count_cache', {self.post.pk: 3})
+        self.engine.connection.rename(key, f'{key}:flushing')
+        self.engine.record_deltas(Post, 'upvote_count_cache', {self.post.pk: 2})
+        
+        self.assertEqual(self.engine.get_pending(Post, 'upvote_count_cache', [self.post.pk]), {self.post.pk: 5})
+    
+    def test_interrupted_flush_is_not_applied_twice(self):
+        """Test that a batch whose deltas could not be removed is rolled back and applied once by the next flush"""
+        self.engine.record_deltas(Post, 'upvote_count_cache', {self.post.pk: 3})
+        connection = self.engine.connection
+        with mock.patch.object(connection, 'hdel', side_effect=ConnectionError):
+            with self.assertRaises(ConnectionError):
+                self.engine.flush(Post, 'upvote_count_cache')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.upvote_count_cache, 10)
+        
+        self.assertEqual(self.engine.flush(Post, 'upvote_count_cache'), 1)
+        self.assertEqual(self.engine.flush(Post, 'upvote_count_cache'), 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.upvote_count_cache, 13)
+
+
+class DatabaseUpvoteCounterTests(TestCase):
+    """Test that the default counter engine writes upvotes through to the row"""
+    
+    def test_upvotes_are_written_through(self):
+        user = User.objects.create_user(
+            username='dbvoter',
+            email='dbvoter@example.com',
+            first_name='Db',
+            last_name='Voter',
+            password='testpass123'
+        )
+        community = Community.objects.create(
+            name='Database Votes',
+            slug='database-votes',
+            description='A community for votes',
+            creator=user
+        )
+        post = Post.objects.create(title='Post', content='Content', community=community, author=user)
+        
+        self.assertFalse(get_upvote_counter_engine().write_behind)
+        post.upvotes.add(user)
+        post.refresh_from_db()
+        self.assertEqual(post.upvote_count_cache, 1)
+        self.assertEqual(PostService.get_viewer_state(user, [post])['upvote_deltas'], {})
+        self.assertEqual(flush_upvote_counters(), 0)
+
+
+class CommentUpvoteDeltaTests(APITestCase):
+    """Test that the unflushed comment upvotes are loaded per page"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='commenter',
+            email='commenter@example.com',
+            first_name='Com',
+            last_name='Menter',
+            password='testpass123'
+        )
+        community = Community.objects.create(
+            name='Comment Votes',
+            slug='comment-votes',
+            description='A community for comment votes',
+            creator=self.user
+        )
+        self.post = Post.objects.create(title='Post', content='Content', community=community, author=self.user)
+        for content in ('First', 'Second'):
+            Comment.objects.create(post=self.post, author=self.user, content=content)
+        self.client.force_authenticate(user=self.user)
+    
+    def get_upvote_counts(self, url):
+        engine = mock.Mock()
+        engine.get_pending.side_effect = lambda model, counter_field, pks: {pk: 2 for pk in pks}
+        with mock.patch('communities.services.comment_service.get_upvote_counter_engine', return_value=engine):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(engine.get_pending.call_count, 1)
+        return response.data
+    
+    def test_comment_list_reads_pending_upvotes_once(self):
+        """Test that a page of comments asks the counter engine once"""
+        data = self.get_upvote_counts(reverse('communities:post-comments-list', kwargs={
+            'community_slug': 'comment-votes',
+            'post_pk': self.post.id
+        }))
+        self.assertEqual([comment['upvote_count'] for comment in data['results']], [2, 2])
+    
+    def test_post_detail_reads_pending_comment_upvotes_once(self):
+        """Test that the comments of a post detail ask the counter engine once"""
+        data = self.get_upvote_counts(reverse('communities:community-posts-detail', kwargs={
+            'community_slug': 'comment-votes',
+            'pk': self.post.id
+        }))
+        self.assertEqual([comment['upvote_count'] for comment in data['comments']], [2, 2])
+
+
+class CounterServiceTests(TestCase):
+    """Test the set-based counter recompute"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='recount',
+            email='recount@example.com',
+            first_name='Re',
+            last_name='Count',
+            password='testpass123'
+        )
+        self.community = Community.objects.create(
+            name='Recount Community',
+            slug='recount-community',
+            description='A community to recount',
+            creator=self.user
+        )
+        Membership.objects.create(user=self.user, community=self.community, role='admin', status='approved')
+        self.posts = [
+            Post.objects.create(title=f'Post {i}', content='Content', community=self.community, author=self.user)
+            for i in range(5)
+        ]
+        for post in self.posts:
+            Comment.objects.create(post=post, author=self.user, content='Comment')
+            post.upvotes.add(self.user)
+        
+        # Drift every counter
+        Community.objects.update(member_count_cache=7)
+        Post.objects.update(comment_count_cache=0, upvote_count_cache=3)
+    
+    def post_counters(self):
+        return list(Post.objects.order_by('id').values_list('comment_count_cache', 'upvote_count_cache'))
+    
+    def test_recompute_fixes_drift_in_chunks(self):
+        """Test that chunked set-based updates fix every counter with few queries"""
+        # One range query and one UPDATE per chunk of each counter, however many rows there are
+        expected_queries = sum(
+            1 + len(CounterService.get_chunks(counter, chunk_size=2))
+            for counter in CounterService.COUNTERS
+        )
+        with CaptureQueriesContext(connection) as queries:
+            results = update_all_cache_counts(chunk_size=2)
+        
+        self.assertEqual(results['Post.comment_count_cache'], 5)
+        self.assertEqual(results['Post.upvote_count_cache'], 5)
+        self.assertEqual(results['Community.member_count_cache'], 1)
+        self.assertEqual(self.post_counters(), [(1, 1)] * 5)
+        self.assertEqual(Community.objects.get().member_count_cache, 1)
+        self.assertEqual(len(queries), expected_queries)
+        
+        self.assertEqual(update_all_cache_counts()['Post.comment_count_cache'], 0)
+    
+    def test_dry_run_and_only(self):
+        """Test that --dry-run reports drift without fixing it and --only limits the counters"""
+        results = update_all_cache_counts(only=['comments'], dry_run=True)
+        self.assertEqual(results, {'Post.comment_count_cache': 5})
+        self.assertEqual(self.post_counters(), [(0, 3)] * 5)
+        
+        update_all_cache_counts(only=['upvotes'])
+        self.assertEqual(self.post_counters(), [(0, 1)] * 5)
+    
+    def test_since_limits_rows(self):
+        """Test that --since only recomputes rows with recent activity"""
+        Post.objects.filter(id=self.posts[0].id).update(created_at=timezone.now() - timedelta(days=30))
+        Comment.objects.filter(post=self.posts[0]).update(created_at=timezone.now() - timedelta(days=30))
+        
+        results = update_all_cache_counts(only=['comments'], since=timezone.now() - timedelta(days=1))
+        self.assertEqual(results['Post.comment_count_cache'], 4)
+        self.assertEqual(Post.objects.get(id=self.posts[0].id).comment_count_cache, 0)
+    
+    def test_recompute_leaves_out_pending_deltas(self):
+        """Test that upvotes recorded by a write-behind engine during a recount are not counted twice"""
+        engine = mock.Mock()
+        engine.get_all_pending.side_effect = lambda model, counter_field: (
+            {self.posts[0].pk: 1, self.posts[1].pk: -1} if model is Post else {}
+        )
+        with mock.patch('communities.services.counter_service.get_upvote_counter_engine', return_value=engine), \
+                mock.patch('communities.signals.flush_upvote_counters'):
+            results = update_all_cache_counts(only=['upvotes'])
+        
+        self.assertEqual(results['Post.upvote_count_cache'], 5)
+        self.assertEqual([upvotes for comments, upvotes in self.post_counters()], [0, 2, 1, 1, 1])
+    
+    def test_command_options(self):
+        """Test the management command's --only/--dry-run output"""
+        out = StringIO()
+        call_command('update_cache_counters', only=['members'], dry_run=True, stdout=out)
+        self.assertIn('Would update 1 Community.member_count_cache counters', out.getvalue())
+        self.assertEqual(Community.objects.get().member_count_cache, 7)
+
+
+class ReconcileCountersCommandTests(CounterServiceTests):
+    """Test the resumable counter reconciliation and its drift report"""
+    
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.checkpoint = os.path.join(self.tmpdir, 'checkpoint.json')
+        self.report = os.path.join(self.tmpdir, 'report.json')
+    
+    def reconcile(self, **options):
+        out = StringIO()
+        call_command(
+            'reconcile_counters',
+            workers=1,
+            chunk_size=2,
+            checkpoint=self.checkpoint,
+            report=self.report,
+            stdout=out,
+            **options
+        )
+        with open(self.report) as f:
+            return json.load(f)
+    
+    def test_drift_report(self):
+        """Test that the report lists the drifted rows per model and fixes them"""
+        report = self.reconcile()
+        
+        comments = report['Post']['comment_count_cache']
+        self.assertEqual(comments['rows_checked'], 5)
+        self.assertEqual(comments['rows_drifted'], 5)
+        self.assertEqual(comments['under_counted'], 5)
+        self.assertEqual(comments['net_drift'], -5)
+        self.assertEqual(report['Post']['upvote_count_cache']['absolute_drift'], 10)
+        self.assertEqual(
+            report['Community']['member_count_cache']['rows'],
+            [{'id': self.community.id, 'cached': 7, 'actual': 1, 'difference': 6}]
+        )
+        self.assertEqual(self.post_counters(), [(1, 1)] * 5)
+        self.assertFalse(os.path.exists(self.checkpoint))
+    
+    def test_pending_deltas_are_not_drift(self):
+        """Test that a counter short by its pending deltas is not reported or changed"""
+        Post.objects.filter(pk=self.posts[0].pk).update(upvote_count_cache=0)
+        engine = mock.Mock()
+        engine.get_all_pending.side_effect = lambda model, counter_field: (
+            {self.posts[0].pk: 1} if model is Post else {}
+        )
+        with mock.patch('communities.services.counter_service.get_upvote_counter_engine', return_value=engine), \
+                mock.patch('communities.management.commands.reconcile_counters.flush_upvote_counters'):
+            report = self.reconcile(only=['upvotes'])
+        
+        upvotes = report['Post']['upvote_count_cache']
+        self.assertEqual(upvotes['rows_drifted'], 4)
+        self.assertNotIn(self.posts[0].pk, [row['id'] for row in upvotes['rows']])
+        self.assertEqual([upvotes for comments, upvotes in self.post_counters()], [0, 1, 1, 1, 1])
+    
+    def test_resume_from_checkpoint(self):
+        """Test that chunks recorded in the checkpoint are not processed again"""
+        self.reconcile(only=['comments'], dry_run=True)
+        
+        # Simulate a run interrupted after its first chunk
+        first, *rest = CounterService.get_chunks(CounterService.get_counters(['comments'])[0], chunk_size=2)
+        with open(self.checkpoint, 'w') as f:
+            json.dump({
+                'params': {'counters': ['Post.comment_count_cache'], 'chunk_size': 2, 'fix': True},
+                'counters': {
+                    'Post.comment_count_cache': {
+                        'rows': 5,
+                        'chunks': [first] + rest,
+                        'pending': rest,
+                        'drift': {'rows': 2, 'uninitialized': 0, 'over': 0, 'under': 2, 'net': -2, 'absolute': 2, 'max': 1, 'samples': []},
+                    },
+                },
+            }, f)
+        
+        report = self.reconcile(only=['comments'])
+        self.assertEqual(report['Post']['comment_count_cache']['rows_drifted'], 5)
+        # The posts of the first chunk were left to the interrupted run
+        self.assertEqual(self.post_counters()[:2], [(0, 3)] * 2)
+        self.assertEqual(self.post_counters()[2:], [(1, 3)] * 3)
+    
+    def test_checkpoint_with_other_options_is_rejected(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'params': {'counters': [], 'chunk_size': 10, 'fix': True}, 'counters': {}}, f)
+        with self.assertRaises(CommandError):
+            self.reconcile()
+
+
+class EventPostJoinTests(TestCase):
+    """Test the seat-reserving event post join"""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'joiner{i}',
+                email=f'joiner{i}@example.com',
+                first_name='Joiner',
+                last_name=f'User{i}',
+                password='testpass123'
+            )
+            for i in range(3)
+        ]
+        self.community = Community.objects.create(
+            name='Join Community',
+            slug='join-community',
+            description='A community with events',
+            creator=self.users[0]
+        )
+        self.post = Post.objects.create(
+            title='Limited event',
+            content='Two seats',
+            community=self.community,
+            author=self.users[0],
+            post_type='event',
+            event_participant_limit=2
+        )
+    
+    def test_join_up_to_the_limit(self):
+        """Test that joins stop at the limit, report the new count and then fill the waitlist"""
+        result = PostService.join_event(self.post, self.users[1])
+        self.assertEqual((result.status, result.participant_count), ('joined', 1))
+        self.assertEqual(PostService.join_event(self.post, self.users[1]).status, 'already_joined')
+        
+        self.assertEqual(PostService.join_event(self.post, self.users[2]).status, 'joined')
+        result = PostService.join_event(self.post, self.users[0])
+        self.assertEqual((result.status, result.participant_count, result.waitlist_position), ('waitlisted', 2, 1))
+        
+        self.assertEqual(self.post.event_participants.count(), 2)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).participant_count_cache, 2)
+    
+    def test_leave_frees_the_seat(self):
+        """Test that leaving decrements the count and lets someone else join"""
+        PostService.join_event(self.post, self.users[1])
+        PostService.join_event(self.post, self.users[2])
+        
+        left, message, count, promoted = PostService.leave_event(self.post, self.users[1])
+        self.assertEqual((left, count, promoted), (True, 1, None))
+        self.assertFalse(PostService.leave_event(self.post, self.users[1])[0])
+        self.assertEqual(PostService.join_event(self.post, self.users[0]).status, 'joined')
+        self.assertEqual(Post.objects.get(pk=self.post.pk).participant_count_cache, 2)
+    
+    def test_leave_promotes_the_head_of_the_waitlist(self):
+        """Test that the freed seat goes to the first waiting user in the same request"""
+        PostService.join_event(self.post, self.users[0])
+        PostService.join_event(self.post, self.users[1])
+        PostService.join_event(self.post, self.users[2])
+        self.assertEqual(PostService.get_waitlist_position(self.post, self.users[2]), 1)
+        
+        with CaptureQueriesContext(connection) as queries:
+            left, message, count, promoted = PostService.leave_event(self.post, self.users[0])
+        self.assertEqual((left, count, promoted), (True, 2, self.users[2].id))
+        # Lock, find and delete the participant, pop the head, insert it; no recount or list scan
+        self.assertLessEqual(len(queries), 8)
+        
+        self.assertTrue(self.post.event_participants.filter(id=self.users[2].id).exists())
+        self.assertIsNone(PostService.get_waitlist_position(self.post, self.users[2]))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).participant_count_cache, 2)
+    
+    def test_leaving_the_waitlist(self):
+        """Test that leaving the waitlist is told apart from leaving the event"""
+        PostService.join_event(self.post, self.users[0])
+        PostService.join_event(self.post, self.users[1])
+        PostService.join_event(self.post, self.users[2])
+        
+        left, message, count, promoted = PostService.leave_event(self.post, self.users[2])
+        self.assertEqual((left, message, count, promoted), (True, "You have left the waitlist for this event.", 2, None))
+        left, message, count, promoted = PostService.leave_event(self.post, self.users[2])
+        self.assertEqual((left, message), (False, "You are not a participant in this event."))
+    
+    def test_taking_a_seat_removes_the_waitlist_entry(self):
+        """Test that a waiting user who gets a seat directly is no longer on the waitlist"""
+        PostService.join_event(self.post, self.users[0])
+        PostService.join_event(self.post, self.users[1])
+        PostService.join_event(self.post, self.users[2])
+        Post.objects.filter(pk=self.post.pk).update(event_participant_limit=3)
+        self.post.refresh_from_db()
+        
+        self.assertEqual(PostService.join_event(self.post, self.users[2]).status, 'joined')
+        self.assertFalse(PostWaitlistEntry.objects.filter(post=self.post).exists())
+    
+    def test_leave_skips_heads_that_are_participants(self):
+        """Test that a freed seat skips waitlist entries of users who already have a seat"""
+        PostService.join_event(self.post, self.users[0])
+        PostService.join_event(self.post, self.users[1])
+        PostWaitlistEntry.objects.create(post=self.post, user=self.users[1])
+        PostService.join_event(self.post, self.users[2])
+        
+        left, message, count, promoted = PostService.leave_event(self.post, self.users[0])
+        self.assertEqual((count, promoted), (2, self.users[2].id))
+        self.assertEqual(self.post.event_participants.filter(id=self.users[1].id).count(), 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).participant_count_cache, 2)
+
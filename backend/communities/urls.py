@@ -5,6 +5,7 @@ from rest_framework_nested.routers import NestedDefaultRouter
 # Import viewsets directly from views top-level package instead of from sub-modules
 from .views import CommunityViewSet, PostViewSet, CommentViewSet, CommunityInvitationViewSet
 from .views.event_post_views import join_event_post, leave_event_post
+from .views.metrics_views import cache_metrics
 
 # Create a router with trailing slashes matching Django's preference
 router = DefaultRouter(trailing_slash=True)
@@ -45,4 +46,6 @@ urlpatterns = [
     path('', include(community_actions)),
     # Add event post actions
     path('', include(event_post_actions)),
+    # Cache metrics for administrators
+    path('cache-metrics/', cache_metrics, name='cache-metrics'),
 ]
\ No newline at end of file
@@ -3,7 +3,9 @@
 
 # Communities app utilities
 from .exception_handler import custom_exception_handler
-from .cache import cached_property, cached_method, cache_queryset, invalidate_model_cache
+from .cache import cached_property, cached_method, cache_queryset, invalidate_model_cache, bump_generation
+from .metrics import MetricsRegistry
+from .pagination import KeysetPagination, OptionalKeysetPaginationMixin
 
 __all__ = [
     'custom_exception_handler',
@@ -11,4 +13,8 @@ __all__ = [
     'cached_method',
     'cache_queryset',
     'invalidate_model_cache',
+    'bump_generation',
+    'MetricsRegistry',
+    'KeysetPagination',
+    'OptionalKeysetPaginationMixin',
 ] 
\ No newline at end of file
@@ -2,8 +2,17 @@ from functools import wraps
 from django.core.cache import cache
 import hashlib
 import json
+import math
+import pickle
+import random
+import time
+from collections import namedtuple
+from collections.abc import Sequence
 from django.contrib.auth.models import AnonymousUser
 
+from .local_cache import MISSING, get_two_tier_state
+from .metrics import MetricsRegistry
+
 """
 Cache Utilities for Communities App
 
@@ -13,6 +22,16 @@ Key features:
 - Cached method decorator for expensive method calls
 - Cached queryset decorator for optimizing database queries
 - Cache key generation with support for non-serializable objects (Users, etc.)
+- Generation-based invalidation (no key scans)
+- An optional in-process L1 tier in front of the shared cache (see local_cache)
+- Optional cache stampede protection for expensive entries
+- Compact primary key list entries for cached querysets, with entry size limits
+- Hit/miss, compute time and payload size metrics per cached function
+
+Invalidation works by embedding a generation counter in every key: one per
+model instance for cached properties/methods, and one per model for cached
+querysets. Invalidating bumps the counter with a single INCR, so new lookups
+miss and the old entries simply age out through their TTL.
 
 Important: When dealing with User objects in caching, the system converts them
 to a string representation with their ID to avoid JSON serialization issues.
@@ -62,6 +81,271 @@ def generate_cache_key(prefix, *args, **kwargs):
     return f"{prefix}:{key_suffix}"
 
 
+GENERATION_KEY_PREFIX = "cache_gen"
+
+
+def _model_name(model):
+    """Get the name used in cache keys for a model class, instance or name"""
+    if isinstance(model, str):
+        return model
+    if isinstance(model, type):
+        return model.__name__
+    return model.__class__.__name__
+
+
+def get_generation_key(model, pk=None):
+    """Get the key of the generation counter for a model, or for one instance if pk is given"""
+    if pk is None:
+        return f"{GENERATION_KEY_PREFIX}:{_model_name(model)}"
+    return f"{GENERATION_KEY_PREFIX}:{_model_name(model)}:{pk}"
+
+
+def _initial_generation():
+    # Seed counters from the clock so a counter that was evicted never starts
+    # again at a generation that stale entries may still be stored under
+    return int(time.time() * 1000)
+
+
+def get_generations(keys):
+    """
+    Get the current values of several generation counters in one round trip.
+    Missing counters are created.
+    """
+    state = get_two_tier_state()
+    cacheable = state is not None and state.generations_cacheable
+    
+    generations = {}
+    if cacheable:
+        for key in keys:
+            generation = state.local_cache.get(key)
+            if generation is not MISSING:
+                generations[key] = generation
+    
+    missing = [key for key in keys if key not in generations]
+    if missing:
+        fetched = cache.get_many(missing)
+        for key in missing:
+            if key not in fetched:
+                cache.add(key, _initial_generation(), None)
+                fetched[key] = cache.get(key, 0)
+            if cacheable:
+                state.local_cache.set(key, fetched[key], state.config['GENERATION_TIMEOUT'])
+        generations.update(fetched)
+    
+    return [generations[key] for key in keys]
+
+
+def get_generation(model, pk=None):
+    """Get the current generation of a model, or of one instance if pk is given"""
+    return get_generations([get_generation_key(model, pk)])[0]
+
+
+def bump_generation(model, pk=None):
+    """
+    Increment the generation of a model (or instance), which makes all cache
+    entries keyed on the previous generation unreachable.
+    """
+    key = get_generation_key(model, pk)
+    try:
+        generation = cache.incr(key)
+    except ValueError:
+        # The counter doesn't exist yet (or was evicted), start a new one
+        generation = _initial_generation()
+        if not cache.add(key, generation, None):
+            generation = cache.incr(key)
+    
+    # Drop the local copies of the old generation in this and all other workers
+    state = get_two_tier_state()
+    if state is not None:
+        state.local_cache.delete(key)
+        state.channel.publish(key)
+    
+    return generation
+
+
+def tiered_get(key, label=None):
+    """
+    Get a value from the L1 cache, falling back to the shared cache.
+    If `label` is given, L1 hits are counted under it.
+    """
+    state = get_two_tier_state()
+    if state is None:
+        return cache.get(key)
+    
+    result = state.local_cache.get(key)
+    if result is MISSING:
+        result = cache.get(key)
+        if result is not None:
+            state.local_cache.set(key, result)
+    elif label is not None:
+        cache_metrics.incr(label, 'l1_hits')
+    return result
+
+
+# Largest entry stored by size-checked writes (the default item size limit of memcached)
+MAX_ENTRY_BYTES = 1024 * 1024
+
+# Counters per cached function, labelled "<decorator>:<function>", e.g.
+# "cache_queryset:CommunityService.get_community_queryset"
+cache_metrics = MetricsRegistry('cache', fields=(
+    'hits',  # Served from the cache
+    'l1_hits',  # Served from the in-process tier (included in hits)
+    'stale_hits',  # Stale values served while another worker refreshed (included in hits)
+    'misses',  # Values computed
+    'compute_us',  # Total compute time, in microseconds
+    'stored',  # Entries written
+    'bytes',  # Total pickled size of the entries written
+    'oversized',  # Entries not written because they exceeded max_bytes
+))
+
+
+def record_entry_size(label, size, stored=True):
+    """Record the pickled size of an entry written for the given label"""
+    if stored:
+        cache_metrics.incr(label, 'stored')
+        cache_metrics.incr(label, 'bytes', size)
+    else:
+        cache_metrics.incr(label, 'oversized')
+
+
+def timed_compute(label, compute):
+    """Compute a value, recording a miss and the compute time under the given label"""
+    start = time.perf_counter()
+    try:
+        return compute()
+    finally:
+        cache_metrics.incr(label, 'misses')
+        cache_metrics.incr(label, 'compute_us', int((time.perf_counter() - start) * 1000000))
+
+
+def get_cache_stats():
+    """Get the cache metrics of all processes per cached function, with derived rates"""
+    stats = {}
+    for label, values in sorted(cache_metrics.snapshot().items()):
+        lookups = values['hits'] + values['misses']
+        stats[label] = {
+            **values,
+            'hit_rate': round(values['hits'] / lookups, 4) if lookups else 0.0,
+            'avg_compute_ms': round(values['compute_us'] / values['misses'] / 1000, 3) if values['misses'] else 0.0,
+            'avg_bytes': values['bytes'] // values['stored'] if values['stored'] else 0,
+        }
+    return stats
+
+
+def tiered_set(key, value, timeout, max_bytes=None, label=None):
+    """
+    Store a value in the shared cache and the L1 cache.
+    If `max_bytes` is given, larger values are not stored (and False is returned);
+    if `label` is given, the entry size is recorded under it.
+    """
+    if max_bytes is not None or label is not None:
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        stored = max_bytes is None or size <= max_bytes
+        record_entry_size(label or key, size, stored)
+        if not stored:
+            return False
+    
+    cache.set(key, value, timeout)
+    state = get_two_tier_state()
+    if state is not None:
+        state.local_cache.set(key, value, timeout)
+    return True
+
+
+# Cache entry stored by stampede protected lookups: the value, the time after which
+# it should be recomputed, and how long the last computation took (in seconds)
+CacheEnvelope = namedtuple('CacheEnvelope', ['value', 'expires_at', 'delta'])
+
+STAMPEDE_LOCK_TIMEOUT = 10  # Lease of the recompute lock, in seconds
+STAMPEDE_WAIT_INTERVAL = 0.05  # Polling interval while another worker computes a missing value
+
+
+def _should_refresh(envelope, beta=1.0):
+    """
+    Probabilistic early expiration (XFetch): the closer the entry gets to its
+    expiry, and the longer it takes to compute, the more likely a reader is to
+    refresh it before it expires.
+    """
+    return time.time() - envelope.delta * beta * math.log(random.random() or 1e-12) >= envelope.expires_at
+
+
+def get_or_compute_protected(key, compute, timeout, lock_timeout=STAMPEDE_LOCK_TIMEOUT, label=None, max_bytes=None):
+    """
+    Get a cached value, recomputing it with stampede protection:
+    - entries are refreshed early with XFetch instead of all expiring at once,
+    - only the worker holding a short lock lease recomputes (single flight),
+    - everybody else keeps serving the stale value until the new one is stored.
+    Entries are kept for an extra `timeout` seconds after their soft expiry so a
+    stale value is available while the refresh runs.
+    If `label` is given, metrics are recorded under it.
+    """
+    envelope = tiered_get(key, label)
+    if envelope is not None and _should_refresh(envelope):
+        # The local copy may be behind a refresh done by another worker
+        shared = cache.get(key)
+        if shared is not None and shared.expires_at > envelope.expires_at:
+            envelope = shared
+            state = get_two_tier_state()
+            if state is not None:
+                state.local_cache.set(key, envelope)
+    
+    if envelope is not None and not _should_refresh(envelope):
+        if label is not None:
+            cache_metrics.incr(label, 'hits')
+        return envelope.value
+    
+    lock_key = f"{key}:lock"
+    locked = cache.add(lock_key, 1, lock_timeout)
+    if not locked:
+        if envelope is not None:
+            # Someone else is refreshing, serve the stale value meanwhile
+            if label is not None:
+                cache_metrics.incr(label, 'hits')
+                cache_metrics.incr(label, 'stale_hits')
+            return envelope.value
+        
+        # Nothing to serve yet, wait for the worker holding the lock
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(STAMPEDE_WAIT_INTERVAL)
+            envelope = cache.get(key)
+            if envelope is not None:
+                if label is not None:
+                    cache_metrics.incr(label, 'hits')
+                return envelope.value
+            if cache.get(lock_key) is None:
+                # Released without storing a value (the computation failed or
+                # the value was too large to cache), compute it here
+                break
+    
+    try:
+        start = time.time()
+        value = timed_compute(label, compute) if label is not None else compute()
+        now = time.time()
+        tiered_set(key, CacheEnvelope(value, now + timeout, now - start), timeout * 2, max_bytes, label)
+        return value
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def get_or_compute(key, compute, timeout, label, max_bytes=None, stampede_protection=False):
+    """Get a cached value or compute and store it, recording metrics under `label`"""
+    if stampede_protection:
+        return get_or_compute_protected(key, compute, timeout, label=label, max_bytes=max_bytes)
+    
+    # Try to get from cache
+    result = tiered_get(key, label)
+    if result is not None:
+        cache_metrics.incr(label, 'hits')
+        return result
+    
+    # If not in cache, compute and store
+    result = timed_compute(label, compute)
+    tiered_set(key, result, timeout, max_bytes, label)
+    return result
+
+
 def cached_property(timeout=300):
     """
     Decorator to cache expensive property methods.
@@ -78,26 +362,26 @@ def cached_property(timeout=300):
         @wraps(func)
         def wrapper(self, *args, **kwargs):
             # Generate a unique key for this property on this instance
+            generation = get_generation(self, self.pk)
             key = generate_cache_key(
-                f"cached_property:{self.__class__.__name__}:{self.pk}:{func.__name__}",
+                f"cached_property:{self.__class__.__name__}:{self.pk}:g{generation}:{func.__name__}",
                 *args, **kwargs
             )
             
-            # Try to get from cache
-            result = cache.get(key)
-            if result is None:
-                # If not in cache, compute and store
-                result = func(self, *args, **kwargs)
-                cache.set(key, result, timeout)
-            
-            return result
+            return get_or_compute(
+                key, lambda: func(self, *args, **kwargs), timeout,
+                label=f"cached_property:{func.__qualname__}"
+            )
         return wrapper
     return decorator
 
 
-def cached_method(timeout=300):
+def cached_method(timeout=300, models=(), stampede_protection=False):
     """
     Decorator to cache results of instance or class methods.
+    Instance method results are invalidated with the instance's generation,
+    other results with the generations of the given `models`.
+    With `stampede_protection`, see get_or_compute_protected.
     
     Usage:
         @cached_method(timeout=3600)
@@ -107,44 +391,95 @@ def cached_method(timeout=300):
     """
     def decorator(func):
         @wraps(func)
-        def wrapper(self, *args, **kwargs):
+        def wrapper(*args, **kwargs):
+            instance = args[0] if args else None
             # For instance methods, include the instance's class and id in the key
-            if hasattr(self, '__class__') and hasattr(self, 'pk'):
-                key_prefix = f"cached_method:{self.__class__.__name__}:{self.pk}:{func.__name__}"
+            if instance is not None and not isinstance(instance, type) and hasattr(instance, 'pk'):
+                generation = get_generation(instance, instance.pk)
+                key_prefix = f"cached_method:{instance.__class__.__name__}:{instance.pk}:g{generation}:{func.__name__}"
+                key_args = args[1:]
             else:
-                # For class methods or functions
-                key_prefix = f"cached_method:{func.__module__}:{func.__name__}"
+                # For static methods, class methods or functions all arguments are part of the key
+                key_prefix = f"cached_method:{func.__module__}:{func.__qualname__}{_generation_suffix(models)}"
+                key_args = args
             
             # Generate a unique key for this method call
-            key = generate_cache_key(key_prefix, *args, **kwargs)
-            
-            # Try to get from cache
-            result = cache.get(key)
-            if result is None:
-                # If not in cache, compute and store
-                result = func(self, *args, **kwargs)
-                cache.set(key, result, timeout)
+            key = generate_cache_key(key_prefix, *key_args, **kwargs)
             
-            return result
+            return get_or_compute(
+                key, lambda: func(*args, **kwargs), timeout,
+                label=f"cached_method:{func.__qualname__}",
+                stampede_protection=stampede_protection
+            )
         return wrapper
     return decorator
 
 
+def _generation_suffix(models):
+    """Get a key suffix holding the current generations of the given models"""
+    if not models:
+        return ""
+    generations = get_generations([get_generation_key(model) for model in models])
+    return ":g" + "-".join(str(generation) for generation in generations)
+
+
 def invalidate_model_cache(instance):
     """
-    Invalidate all cached properties/methods for a specific model instance.
+    Invalidate all cached properties/methods for a specific model instance,
+    and all cached querysets/methods that depend on its model.
     Call this when an instance is updated/saved.
     """
-    pattern = f"cached_*:{instance.__class__.__name__}:{instance.pk}:*"
-    cache.delete_pattern(pattern)
+    bump_generation(instance, instance.pk)
+    bump_generation(instance)
 
 
-def cache_queryset(timeout=300):
+class CachedPkList(Sequence):
+    """
+    The cached, ordered primary keys of a queryset. Rows are rehydrated lazily:
+    slicing it (as paginators do) loads only the requested rows with a single
+    in_bulk query. Rows deleted since the keys were cached are skipped.
+    """
+    
+    def __init__(self, queryset, pks):
+        self.queryset = queryset
+        self.pks = pks
+    
+    def __len__(self):
+        return len(self.pks)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._rehydrate(self.pks[index])
+        return self._rehydrate([self.pks[index]])[0]
+    
+    def __iter__(self):
+        return iter(self._rehydrate(self.pks))
+    
+    def _rehydrate(self, pks):
+        objects = self.queryset.in_bulk(pks)
+        return [objects[pk] for pk in pks if pk in objects]
+
+
+def cache_queryset(timeout=300, models=(), stampede_protection=False, mode='objects', max_bytes=MAX_ENTRY_BYTES):
     """
     Decorator to cache results of a queryset-returning method.
+    The cached result is invalidated when any instance of one of the given
+    `models` is invalidated.
+    With `stampede_protection`, see get_or_compute_protected.
+    
+    Modes:
+    - 'objects': cache the list of model instances (including prefetched relations)
+    - 'pks': cache only the ordered primary keys and return a CachedPkList,
+      which rehydrates rows from the (uncached) queryset on access
+    
+    Entries larger than `max_bytes` are not cached. Hits, misses, compute time
+    and entry sizes are recorded, see get_cache_stats.
     Note: This is only appropriate for read-only operations where
     stale data for a short time is acceptable.
     """
+    if mode not in ('objects', 'pks'):
+        raise ValueError(f"Unknown cache_queryset mode: {mode}")
+    
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
@@ -154,16 +489,27 @@ def cache_queryset(timeout=300):
                 key_prefix = f"cache_queryset:{cls_name}:{func.__name__}"
             else:
                 key_prefix = f"cache_queryset:{func.__module__}:{func.__name__}"
+            key_prefix += _generation_suffix(models)
+            if mode == 'pks':
+                key_prefix += ":pks"
             
             key = generate_cache_key(key_prefix, *args, **kwargs)
             
-            # Try to get from cache
-            result = cache.get(key)
-            if result is None:
-                # If not in cache, compute and store
-                result = list(func(*args, **kwargs))  # Convert queryset to list
-                cache.set(key, result, timeout)
+            if mode == 'pks':
+                queryset = func(*args, **kwargs)
+                compute = lambda: list(queryset.values_list('pk', flat=True))
+            else:
+                compute = lambda: list(func(*args, **kwargs))  # Convert queryset to list
             
+            result = get_or_compute(
+                key, compute, timeout,
+                label=f"cache_queryset:{func.__qualname__}",
+                max_bytes=max_bytes,
+                stampede_protection=stampede_protection
+            )
+            
+            if mode == 'pks':
+                return CachedPkList(queryset, result)
             return result
         return wrapper
-    return decorator 
\ No newline at end of file
+    return decorator
@@ -0,0 +1,233 @@
+"""
+Counter maintenance for the cached counter fields (member_count_cache,
+comment_count_cache, upvote_count_cache, ...).
+
+Counters are null until they are first computed (see CounterService), and
+after that are changed by deltas rather than by recounting. Deltas are either
+applied to the database right away, or - for counters that take write bursts,
+like upvotes - recorded in Redis hashes and flushed to the database in
+batches by a background task (write-behind):
+
+    COMMUNITIES_UPVOTE_COUNTER_ENGINE = 'database'  # or 'redis'
+
+With the Redis engine, the hot post/comment row is no longer updated (and
+locked) for every upvote. Reads add the pending deltas to the stored counter.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+
+def apply_counter_deltas(model, counter_field, deltas, batch_size=None):
+    """
+    Atomically add deltas to a counter field, given a {pk: delta} dict.
+    Rows with the same delta are updated in one query. Counters never go below 0.
+    Counters that are not computed yet (null) are left alone, a delta on an
+    unknown count is meaningless. Uses update to avoid triggering other signals.
+    """
+    pks_by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            pks_by_delta[delta].append(pk)
+    
+    for delta, pks in pks_by_delta.items():
+        if delta > 0:
+            value = F(counter_field) + delta
+        else:
+            value = Greatest(F(counter_field) - abs(delta), 0)
+        
+        step = batch_size or len(pks)
+        for i in range(0, len(pks), step):
+            model.objects.filter(
+                pk__in=pks[i:i + step],
+                **{f'{counter_field}__isnull': False}
+            ).update(**{counter_field: value})
+
+
+def reserve_counter_slot(model, counter_field, pk, limit=None):
+    """
+    Add 1 to a row's counter unless it has reached `limit`, with one conditional
+    UPDATE. The UPDATE locks the row until the end of the transaction, so
+    concurrent reservations can't overbook. Must run inside transaction.atomic.
+    
+    Returns the new count, or None if the limit is reached (or the row is gone).
+    When the limit is reached the row is locked as well, so the caller can act on
+    "full" (e.g. join a waitlist) before anyone frees a seat. A counter that is
+    not computed yet (null) is recounted under the row lock first.
+    """
+    rows = model.objects.filter(pk=pk, **{f'{counter_field}__isnull': False})
+    if limit is not None:
+        rows = rows.filter(**{f'{counter_field}__lt': limit})
+    
+    if not rows.update(**{counter_field: F(counter_field) + 1}):
+        locked = model.objects.select_for_update().filter(pk=pk).values_list(counter_field, flat=True).first()
+        if locked is not None:
+            # The row exists and its counter is known, so it's full
+            return None
+        
+        from ..services.counter_service import CounterService
+        counter = next(
+            (counter for counter in CounterService.COUNTERS if counter.model is model and counter.field == counter_field),
+            None
+        )
+        if counter is None or not model.objects.filter(pk=pk).exists():
+            return None
+        CounterService.recompute_range(counter, pk, pk + 1)
+        if not rows.update(**{counter_field: F(counter_field) + 1}):
+            return None
+    
+    # Read back under the lock taken by the UPDATE
+    return model.objects.filter(pk=pk).values_list(counter_field, flat=True).get()
+
+
+class DatabaseCounterEngine:
+    """Applies counter deltas to the database immediately"""
+    
+    write_behind = False
+    
+    def apply_deltas(self, model, counter_field, deltas):
+        apply_counter_deltas(model, counter_field, deltas)
+    
+    def get_pending(self, model, counter_field, pks):
+        return {}
+    
+    def get_all_pending(self, model, counter_field):
+        return {}
+    
+    def flush(self, model, counter_field, batch_size=500):
+        return 0
+
+
+class RedisCounterEngine:
+    """
+    Records counter deltas in a Redis hash per counter (HINCRBY) and applies
+    them to the database when flushed.
+    """
+    
+    write_behind = True
+    key_prefix = 'counter_deltas'
+    
+    def __init__(self, connection=None):
+        self._connection = connection
+    
+    @property
+    def connection(self):
+        if self._connection is None:
+            from django_redis import get_redis_connection
+            self._connection = get_redis_connection('default')
+        return self._connection
+    
+    def get_key(self, model, counter_field):
+        return f"{self.key_prefix}:{model._meta.label}:{counter_field}"
+    
+    def apply_deltas(self, model, counter_field, deltas):
+        """Record the deltas once the current transaction commits, a rolled back upvote records nothing"""
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if deltas:
+            transaction.on_commit(lambda: self.record_deltas(model, counter_field, deltas))
+    
+    def record_deltas(self, model, counter_field, deltas):
+        key = self.get_key(model, counter_field)
+        pipeline = self.connection.pipeline(transaction=False)
+        for pk, delta in deltas.items():
+            pipeline.hincrby(key, pk, delta)
+        pipeline.execute()
+    
+    def get_pending(self, model, counter_field, pks):
+        """
+        Get the unflushed deltas of the given rows as {pk: delta}, from both the
+        hash being recorded to and the one a running flush has not applied yet
+        """
+        pks = list(pks)
+        if not pks:
+            return {}
+        key = self.get_key(model, counter_field)
+        pipeline = self.connection.pipeline(transaction=True)
+        pipeline.hmget(key, pks)
+        pipeline.hmget(f"{key}:flushing", pks)
+        pending = defaultdict(int)
+        for values in pipeline.execute():
+            for pk, value in zip(pks, values):
+                if value is not None:
+                    pending[pk] += int(value)
+        return dict(pending)
+    
+    def get_all_pending(self, model, counter_field):
+        """Get every unflushed delta of the counter as {pk: delta}"""
+        key = self.get_key(model, counter_field)
+        pipeline = self.connection.pipeline(transaction=True)
+        pipeline.hgetall(key)
+        pipeline.hgetall(f"{key}:flushing")
+        pending = defaultdict(int)
+        for values in pipeline.execute():
+            for pk, value in values.items():
+                pending[int(pk)] += int(value)
+        return dict(pending)
+    
+    def flush(self, model, counter_field, batch_size=500):
+        """
+        Apply the recorded deltas to the database. Returns the number of rows updated.
+        
+        The hash is renamed before it is read, so deltas recorded during the flush
+        go to a new hash. A hash left over by an interrupted flush is applied first.
+        Only one flush per counter should run at a time.
+        
+        Each batch is applied in a transaction that removes its rows from the hash
+        before committing, so an interrupted flush doesn't apply a batch twice:
+        either the batch is rolled back and still in the hash, or it is gone.
+        """
+        key = self.get_key(model, counter_field)
+        flushing_key = f"{key}:flushing"
+        
+        if not self.connection.exists(flushing_key):
+            if not self.connection.exists(key):
+                # Nothing recorded since the last flush
+                return 0
+            self.connection.rename(key, flushing_key)
+        
+        deltas = {
+            int(pk): int(delta)
+            for pk, delta in self.connection.hgetall(flushing_key).items()
+        }
+        pks = list(deltas)
+        for i in range(0, len(pks), batch_size):
+            batch = pks[i:i + batch_size]
+            with transaction.atomic():
+                apply_counter_deltas(model, counter_field, {pk: deltas[pk] for pk in batch})
+                self.connection.hdel(flushing_key, *batch)
+        # The hash is gone once its last field is removed
+        return len([delta for delta in deltas.values() if delta])
+
+
+_engines = {}
+
+
+def get_upvote_counter_engine():
+    """Get the counter engine configured for the upvote counters"""
+    name = getattr(settings, 'COMMUNITIES_UPVOTE_COUNTER_ENGINE', 'database')
+    if name not in _engines:
+        if name == 'redis':
+            _engines[name] = RedisCounterEngine()
+        elif name == 'database':
+            _engines[name] = DatabaseCounterEngine()
+        else:
+            raise ValueError(f"Unknown upvote counter engine: {name}")
+    return _engines[name]
+
+
+def get_upvote_counters():
+    """Get the (model, counter field) pairs maintained by the upvote counter engine"""
+    from ..models import Post, Comment
+    return [(Post, 'upvote_count_cache'), (Comment, 'upvote_count_cache')]
+
+
+def flush_upvote_counters(batch_size=500):
+    """Flush the pending upvote deltas to the database. Returns the number of rows updated."""
+    engine = get_upvote_counter_engine()
+    return sum(
+        engine.flush(model, counter_field, batch_size=batch_size)
+        for model, counter_field in get_upvote_counters()
+    )
@@ -0,0 +1,43 @@
+from django.conf import settings
+
+from notifications.services import OutboxService
+
+
+def send_event_post_join_confirmation(user, post):
+    """Queue the confirmation email to a user who joined an event post"""
+    # Skip if no email or no event date
+    if not user.email or not post.event_date:
+        return
+    
+    # Format date with error handling
+    try:
+        formatted_date = post.event_date.strftime('%A, %d %B %Y at %I:%M %p')
+    except Exception:
+        formatted_date = "Date not available"
+    
+    community = post.community
+    
+    # Create email content
+    subject = f"You're Confirmed for {post.title} 🎉"
+    message = f"""Hi {user.first_name or user.username},
+
+You're confirmed for the event:
+
+📌 {post.title}  
+📍 Location: {post.event_location or 'Not specified'}  
+📅 Date & Time: {formatted_date}
+🌐 Community: {community.name}
+
+You can view the event details here:
+{settings.FRONTEND_URL}/communities/{community.slug}/posts/{post.id}
+
+See you there!
+UniHub Team
+"""
+    # Queue the email, the outbox worker sends it
+    OutboxService.enqueue(
+        subject=subject,
+        message=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[user.email],
+    )
@@ -0,0 +1,241 @@
+"""
+In-process (L1) cache tier for the communities app.
+
+Every lookup in the shared cache is a network round trip to Redis, even when
+the same key is read several times while serving one request. The L1 tier is
+a small LRU dictionary held in each worker process that sits in front of the
+shared cache:
+
+- Entries live for a short TTL and the number of entries is bounded.
+- Values are held pickled and unpickled on every hit, so like with the shared
+  cache each reader gets its own copy (e.g. of cached model instances) and
+  can't change what other requests are served.
+- Cached values are keyed by generation (see utils.cache), so a stale value is
+  never served after an invalidation as long as the generation itself is fresh.
+- Generation counters are only held in L1 while the worker is subscribed to the
+  invalidation channel on Redis; every bump is published so all workers drop
+  their local copy. Without pub/sub, generations are always read from the
+  shared cache and only the (generation-keyed) values are held locally.
+
+Configured through settings.COMMUNITIES_L1_CACHE.
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 2048,
+    'TIMEOUT': 30,
+    'GENERATION_TIMEOUT': 5,
+    'CHANNEL': 'communities:l1-invalidate',
+}
+
+# Returned by LocalCache.get on a miss, since None is a valid cached value
+MISSING = object()
+
+
+class LocalCache:
+    """Thread-safe LRU cache of pickled values with per-entry expiry and hit/miss counters"""
+    
+    def __init__(self, max_entries=2048, timeout=30):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return MISSING
+            
+            self._data.move_to_end(key)
+            self.hits += 1
+        return pickle.loads(value)
+    
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if timeout <= 0:
+            return
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class InvalidationChannel:
+    """
+    Redis pub/sub channel used to drop L1 entries in all worker processes.
+    A background thread listens for published keys and deletes them locally.
+    """
+    
+    def __init__(self, local_cache, channel):
+        self.local_cache = local_cache
+        self.channel = channel
+        self.connection = None
+        self.subscribed = False
+        self._thread = None
+    
+    def start(self):
+        """Subscribe to the channel. Returns False if Redis pub/sub isn't available."""
+        try:
+            from django_redis import get_redis_connection
+            self.connection = get_redis_connection('default')
+            pubsub = self._subscribe()
+        except (ImportError, NotImplementedError):
+            # The default cache isn't a django-redis cache
+            return False
+        except Exception as e:
+            logger.warning("L1 cache invalidation channel unavailable: %s", e)
+            return False
+        
+        self._thread = threading.Thread(
+            target=self._listen,
+            args=(pubsub,),
+            name='communities-l1-invalidation',
+            daemon=True,
+        )
+        self._thread.start()
+        return True
+    
+    def _subscribe(self):
+        pubsub = self.connection.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        self.subscribed = True
+        return pubsub
+    
+    def _listen(self, pubsub):
+        while True:
+            try:
+                for message in pubsub.listen():
+                    key = message.get('data')
+                    if isinstance(key, bytes):
+                        key = key.decode('utf-8')
+                    self.local_cache.delete(key)
+            except Exception as e:
+                logger.warning("L1 cache invalidation channel lost: %s", e)
+            
+            # Invalidations may have been missed while disconnected
+            self.subscribed = False
+            self.local_cache.clear()
+            time.sleep(1)
+            try:
+                pubsub = self._subscribe()
+            except Exception:
+                pass
+    
+    def publish(self, key):
+        if self.connection is None:
+            return
+        try:
+            self.connection.publish(self.channel, key)
+        except Exception as e:
+            logger.warning("Failed to publish L1 cache invalidation: %s", e)
+
+
+class TwoTierState:
+    """The L1 cache and invalidation channel of the current process"""
+    
+    def __init__(self, config):
+        self.config = config
+        self.pid = os.getpid()
+        self.local_cache = LocalCache(
+            max_entries=config['MAX_ENTRIES'],
+            timeout=config['TIMEOUT'],
+        )
+        self.channel = InvalidationChannel(self.local_cache, config['CHANNEL'])
+        self.channel.start()
+    
+    @property
+    def generations_cacheable(self):
+        """Generations may only be held locally while invalidations are received"""
+        return self.channel.subscribed
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'COMMUNITIES_L1_CACHE', {})}
+
+
+def get_two_tier_state():
+    """
+    Get the L1 state of this process, or None if the L1 tier is disabled.
+    The state is created lazily (and again after a fork) so that the
+    subscriber thread runs in the worker process itself.
+    """
+    global _state
+    state = _state
+    if state is False:
+        return None
+    if state is not None and state.pid == os.getpid():
+        return state
+    
+    with _state_lock:
+        if _state is None or (_state is not False and _state.pid != os.getpid()):
+            config = get_config()
+            _state = TwoTierState(config) if config['ENABLED'] else False
+        return _state or None
+
+
+def get_local_cache_stats():
+    """Get hit/miss statistics of this process's L1 cache"""
+    state = get_two_tier_state()
+    if state is None:
+        return {'enabled': False}
+    return {
+        'enabled': True,
+        'pubsub': state.channel.subscribed,
+        **state.local_cache.stats(),
+    }
+
+
+@receiver(setting_changed)
+def reset_two_tier_state(setting, **kwargs):
+    """Rebuild the L1 state when the settings change (e.g. in tests)"""
+    global _state
+    if setting in ('COMMUNITIES_L1_CACHE', 'CACHES'):
+        with _state_lock:
+            _state = None
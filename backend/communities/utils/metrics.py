@@ -0,0 +1,124 @@
+"""
+Lightweight metrics registry.
+
+Counters are accumulated in process memory and periodically flushed into the
+shared cache with INCR, so the numbers of all worker processes add up and can
+be read from any process (management command, admin endpoint).
+
+The metric names are indexed so they can be read back without a key scan:
+the first process to flush a name claims it with cache.add and writes it to
+the next slot of the index, numbered with INCR. Concurrent flushes never
+overwrite each other's names.
+
+Usage:
+    cache_metrics = MetricsRegistry('cache', fields=('hits', 'misses'))
+    cache_metrics.incr('cache_queryset:CommunityService.get_community_queryset', 'hits')
+    await chat_metrics.aincr('typing', 'received')  # from async code
+    cache_metrics.snapshot()
+"""
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+
+class MetricsRegistry:
+    """Named groups of counters, shared across processes through the cache"""
+    
+    def __init__(self, namespace, fields, flush_interval=10):
+        self.namespace = namespace
+        self.fields = tuple(fields)
+        self.flush_interval = flush_interval
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+    
+    def _key(self, *parts):
+        return ":".join(("metrics", self.namespace) + parts)
+    
+    @staticmethod
+    def _incr(key, amount=1):
+        """Atomically add to a cache counter, creating it if needed. Returns the new value."""
+        try:
+            return cache.incr(key, amount)
+        except ValueError:
+            if cache.add(key, amount, None):
+                return amount
+            return cache.incr(key, amount)
+    
+    def _get_names(self):
+        count = cache.get(self._key("names", "count")) or 0
+        slots = cache.get_many([self._key("names", str(slot)) for slot in range(1, count + 1)])
+        return sorted(set(slots.values()))
+    
+    def _add(self, name, field, amount):
+        """Add to the pending counters. Returns whether this call should flush them."""
+        if field not in self.fields:
+            raise ValueError(f"Unknown metrics field: {field}")
+        with self._lock:
+            self._pending[name][field] += amount
+            now = time.monotonic()
+            due = now - self._last_flush >= self.flush_interval
+            if due:
+                # Only one caller flushes
+                self._last_flush = now
+        return due
+    
+    def incr(self, name, field, amount=1):
+        """Add `amount` to a counter of the metric group `name`"""
+        if self._add(name, field, amount):
+            self.flush()
+    
+    async def aincr(self, name, field, amount=1):
+        """Like incr, for async code: the flush (cache I/O) runs in a worker thread"""
+        if self._add(name, field, amount):
+            await sync_to_async(self.flush, thread_sensitive=False)()
+    
+    def flush(self):
+        """Write the counters accumulated by this process to the shared cache"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        
+        for name, fields in pending.items():
+            # Only the process that claims a new name adds it to the index
+            if cache.add(self._key("indexed", name), True, None):
+                slot = self._incr(self._key("names", "count"))
+                cache.set(self._key("names", str(slot)), name, None)
+            
+            for field, amount in fields.items():
+                self._incr(self._key(name, field), amount)
+    
+    def snapshot(self):
+        """Get all counters as {name: {field: value}}, including this process's unflushed ones"""
+        self.flush()
+        
+        snapshot = {}
+        for name in self._get_names():
+            prefix = self._key(name) + ":"
+            values = cache.get_many([prefix + field for field in self.fields])
+            snapshot[name] = {
+                field: values.get(prefix + field, 0)
+                for field in self.fields
+            }
+        return snapshot
+    
+    def reset(self):
+        """Delete all counters of this registry"""
+        with self._lock:
+            self._pending = defaultdict(lambda: defaultdict(int))
+        names = self._get_names()
+        count = cache.get(self._key("names", "count")) or 0
+        cache.delete_many([
+            self._key(name, field)
+            for name in names
+            for field in self.fields
+        ] + [
+            self._key("indexed", name) for name in names
+        ] + [
+            self._key("names", str(slot)) for slot in range(1, count + 1)
+        ] + [self._key("names", "count")])
@@ -0,0 +1,206 @@
+"""
+Keyset (cursor) pagination for feeds.
+
+Page-number pagination costs an OFFSET scan plus a COUNT(*) over the whole
+filtered queryset, both of which grow with the depth of the page. Keyset
+pagination instead seeks past the last row of the previous page using the
+ordering key, so every page costs the same and no total count is computed.
+
+Unlike DRF's CursorPagination, which positions on the first ordering field
+only, the cursor here encodes the full ordering key of the last row. This
+matters for feeds ordered by a low-cardinality leading field such as
+``is_pinned``. A cursor can also point backwards (the 'previous' link), to
+the rows before the first row of a page.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on a tuple of ordering fields.
+    The last ordering field must be unique (normally 'id' or '-id').
+    """
+    ordering = ('-id',)
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor.'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        
+        key, self.reverse = self.decode_cursor(request, queryset.model)
+        ordering = self.get_reversed_ordering() if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if key is not None:
+            queryset = queryset.filter(self.get_seek_filter(key, ordering))
+        
+        # Fetch one extra row to find out whether there are more rows in the
+        # direction of the cursor
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            # Walking backwards: the page was read in reverse, and came from a later page
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, key is not None
+        return self.page
+    
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+    
+    def get_field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+    
+    def get_reversed_ordering(self):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering)
+    
+    def get_seek_filter(self, key, ordering=None):
+        """
+        Build the row-value comparison "key > cursor" in ordering direction, i.e.
+        (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+        """
+        seek_filter = Q()
+        equal_prefix = {}
+        for field, value in zip(ordering or self.ordering, key):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            seek_filter |= Q(**equal_prefix, **{f'{name}__{lookup}': value})
+            equal_prefix[name] = value
+        return seek_filter
+    
+    def encode_cursor(self, row, reverse=False):
+        key = []
+        for name in self.get_field_names():
+            value = getattr(row, name)
+            # Keep full microsecond precision, which DjangoJSONEncoder would truncate
+            key.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        # A forward cursor is the bare key, a backward one is tagged
+        data = json.dumps({'key': key, 'reverse': True} if reverse else key)
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+    
+    def decode_cursor(self, request, model):
+        """Get (key, reverse) from the request's cursor, or (None, False) without one"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            reverse = isinstance(values, dict) and values.get('reverse') is True
+            if reverse:
+                values = values.get('key')
+            names = self.get_field_names()
+            if not isinstance(values, list) or len(values) != len(names):
+                raise ValueError('Cursor does not match ordering')
+            return [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(names, values)
+            ], reverse
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+    
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+    
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[0], reverse=True))
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'previous': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+    
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class PostKeysetPagination(KeysetPagination):
+    """Keyset pagination matching the (community, -is_pinned, -created_at) post index"""
+    ordering = ('-is_pinned', '-created_at', '-id')
+
+
+class CommentKeysetPagination(KeysetPagination):
+    """Keyset pagination matching the (post, created_at) comment index"""
+    ordering = ('created_at', 'id')
+
+
+class OptionalKeysetPaginationMixin:
+    """
+    View mixin that switches a list endpoint to keyset pagination when the client
+    opts in with ?pagination=cursor (first page) or sends a ?cursor= value.
+    Other requests keep the default page-number pagination.
+    """
+    keyset_pagination_class = None
+    
+    def use_keyset_pagination(self):
+        request = getattr(self, 'request', None)
+        if request is None or self.keyset_pagination_class is None:
+            return False
+        params = request.query_params
+        return params.get('pagination') == 'cursor' or self.keyset_pagination_class.cursor_query_param in params
+    
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.use_keyset_pagination():
+            self._paginator = self.keyset_pagination_class()
+        return super().paginator
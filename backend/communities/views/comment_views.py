@@ -10,6 +10,7 @@ from ..models import Post, Comment
 from ..serializers import CommentSerializer
 from ..permissions import IsCommentAuthorOrCommunityAdminOrReadOnly
 from ..services.comment_service import CommentService
+from ..utils.pagination import OptionalKeysetPaginationMixin, CommentKeysetPagination
 
 
 @extend_schema_view(
@@ -36,6 +37,8 @@ from ..services.comment_service import CommentService
                 description="Filter for replies to a specific comment. If not provided, returns only top-level comments.", 
                 type=OpenApiTypes.INT
             ),
+            OpenApiParameter(name="pagination", description="Set to 'cursor' to use keyset pagination (no total count) instead of page numbers", type=OpenApiTypes.STR, enum=["cursor"]),
+            OpenApiParameter(name="cursor", description="Cursor returned in the 'next' link of a keyset-paginated page", type=OpenApiTypes.STR),
         ],
         responses={200: CommentSerializer(many=True)}
     ),
@@ -176,17 +179,19 @@ from ..services.comment_service import CommentService
         responses={204: None}
     ),
 )
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(OptionalKeysetPaginationMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing comments on posts.
     
     Allows listing, creating, retrieving, updating, and deleting comments on posts.
     Supports nested comments (replies) and upvoting functionality.
     Filter top-level comments with no 'parent' parameter, or view replies by setting the 'parent' parameter.
+    Pass ?pagination=cursor for keyset pagination suited to infinite scroll.
     """
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsCommentAuthorOrCommunityAdminOrReadOnly]
+    keyset_pagination_class = CommentKeysetPagination
     
     def get_queryset(self):
         """Get filtered queryset using the service layer"""
@@ -196,6 +201,23 @@ class CommentViewSet(viewsets.ModelViewSet):
             parent_id=self.request.query_params.get('parent')
         )
     
+    def list(self, request, *args, **kwargs):
+        """
+        List comments, loading the unflushed upvotes of the whole page up front
+        so the serializer doesn't ask the counter engine per comment.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        comments = page if page is not None else list(queryset)
+        
+        context = self.get_serializer_context()
+        context['comment_upvote_deltas'] = CommentService.get_upvote_deltas(comments)
+        
+        serializer = self.get_serializer(comments, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
     def perform_create(self, serializer):
         """Use service layer to validate and create a comment"""
         post_id = self.kwargs.get('post_pk')
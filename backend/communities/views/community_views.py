@@ -186,7 +186,27 @@ class CommunityViewSet(
             member_of=self.request.query_params.get('member_of'),
             order_by=self.request.query_params.get('order_by', 'created_at')
         )
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List communities, loading the requesting user's memberships for the whole
+        page in one query so the serializer doesn't query per community.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        communities = page if page is not None else list(queryset)
+        
+        context = self.get_serializer_context()
+        context['membership_map'] = CommunityService.get_membership_map(
+            request.user,
+            [community.id for community in communities]
+        )
         
+        serializer = self.get_serializer(communities, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
     @extend_schema(
         summary="Invite User",
         description="Invite a user to join the community via email.",
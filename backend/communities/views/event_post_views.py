@@ -8,12 +8,12 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
-from django.core.mail import send_mail
-from django.conf import settings
+from django.contrib.auth import get_user_model
 import logging
-import traceback
 
 from ..models import Post, Community
+from ..services.post_service import PostService
+from ..utils.email import send_event_post_join_confirmation
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -59,21 +59,6 @@ def join_event_post(request, community_slug, post_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Check if the user is already a participant
-    if post.event_participants.filter(id=request.user.id).exists():
-        return Response(
-            {"detail": "You are already a participant of this event."},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    # Check if the event is full
-    if post.event_participant_limit is not None:
-        if post.event_participants.count() >= post.event_participant_limit:
-            return Response(
-                {"detail": "This event is already full."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-    
     # For private communities, check if user is a member
     if community.is_private and not community.members.filter(id=request.user.id).exists():
         return Response(
@@ -81,67 +66,36 @@ def join_event_post(request, community_slug, post_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    # Add user to event participants
-    post.event_participants.add(request.user)
-    
-    # Send a direct email, bypassing the events app utility for maximum control
-    email_status = "Not attempted"
+    # Reserve a seat and add the user to the event participants
+    result = PostService.join_event(post, request.user)
+    if result.status == 'waitlisted':
+        return Response(
+            {
+                "detail": result.message,
+                "participant_count": result.participant_count,
+                "waitlist_position": result.waitlist_position
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+    if result.status != 'joined':
+        return Response(
+            {"detail": result.message, "waitlist_position": result.waitlist_position},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    try:
-        # Only proceed if we have the necessary data
-        if not request.user.email:
-            email_status = "No user email available"
-        elif not post.event_date:
-            email_status = "No event date available"
-        else:
-            # Format date with error handling
-            try:
-                formatted_date = post.event_date.strftime('%A, %d %B %Y at %I:%M %p')
-            except Exception as date_error:
-                formatted_date = "Date not available"
-                logger.error(f"Date formatting error: {str(date_error)}")
-                email_status = f"Date formatting error: {str(date_error)}"
-            
-            # Create email content
-            subject = f"You're Confirmed for {post.title} 🎉"
-            message = f"""Hi {request.user.first_name or request.user.username},
-
-You're confirmed for the event:
-
-📌 {post.title}  
-📍 Location: {post.event_location or 'Not specified'}  
-📅 Date & Time: {formatted_date}
-🌐 Community: {community.name}
-
-You can view the event details here:
-{settings.FRONTEND_URL}/communities/{community.slug}/posts/{post.id}
-
-See you there!
-UniHub Team
-"""
-            # Send the email
-            try:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[request.user.email],
-                    fail_silently=False
-                )
-                email_status = "Sent successfully"
-            except Exception as mail_error:
-                logger.error(f"Email sending error: {str(mail_error)}")
-                traceback.print_exc()
-                email_status = f"Failed to send: {str(mail_error)}"
-    except Exception as e:
-        logger.error(f"Unexpected error in email processing: {str(e)}")
-        traceback.print_exc()
-        email_status = f"Unexpected error: {str(e)}"
+    # The confirmation email goes through the outbox, it's sent after the response
+    if not request.user.email:
+        email_status = "No user email available"
+    elif not post.event_date:
+        email_status = "No event date available"
+    else:
+        send_event_post_join_confirmation(request.user, post)
+        email_status = "Queued"
     
     return Response(
         {
-            "detail": "You have successfully joined this event.",
-            "participant_count": post.event_participants.count(),
+            "detail": result.message,
+            "participant_count": result.participant_count,
             "email_status": email_status
         },
         status=status.HTTP_200_OK
@@ -187,20 +141,22 @@ def leave_event_post(request, community_slug, post_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Check if the user is a participant
-    if not post.event_participants.filter(id=request.user.id).exists():
+    # Remove user from event participants
+    left, message, participant_count, promoted_user_id = PostService.leave_event(post, request.user)
+    if not left:
         return Response(
-            {"detail": "You are not a participant of this event."},
+            {"detail": message},
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # Remove user from event participants
-    post.event_participants.remove(request.user)
+    # The freed seat went to the head of the waitlist
+    if promoted_user_id is not None:
+        send_event_post_join_confirmation(get_user_model().objects.get(pk=promoted_user_id), post)
     
     return Response(
         {
-            "detail": "You have successfully left this event.",
-            "participant_count": post.event_participants.count()
+            "detail": message,
+            "participant_count": participant_count
         },
         status=status.HTTP_200_OK
     )
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""
+Cache metrics for administrators
+"""
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from drf_spectacular.utils import extend_schema
+
+from ..utils.cache import get_cache_stats
+from ..utils.local_cache import get_local_cache_stats
+
+
+@extend_schema(
+    summary="Cache metrics",
+    description="Hits, misses, compute time and payload sizes of the cached functions, summed over all "
+                "worker processes, plus the in-process cache statistics of the worker serving the request. "
+                "Only available to staff users.",
+    responses={200: {'type': 'object', 'properties': {
+        'functions': {'type': 'object', 'description': 'Metrics per cached function'},
+        'local_cache': {'type': 'object', 'description': 'In-process cache statistics of this worker'},
+    }}},
+)
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_metrics(request):
+    """Get the cache metrics"""
+    return Response({
+        'functions': get_cache_stats(),
+        'local_cache': get_local_cache_stats(),
+    })
@@ -1,4 +1,5 @@
 from django.shortcuts import get_object_or_404
+from django.contrib.auth import get_user_model
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
@@ -13,6 +14,8 @@ from ..models import Community, Post
 from ..serializers import PostSerializer, PostDetailSerializer
 from ..permissions import IsCommunityAdminOrReadOnly, IsPostAuthorOrCommunityAdminOrReadOnly
 from ..services.post_service import PostService
+from ..utils.pagination import OptionalKeysetPaginationMixin, PostKeysetPagination
+from ..utils.email import send_event_post_join_confirmation
 
 
 @extend_schema_view(
@@ -29,6 +32,8 @@ from ..services.post_service import PostService
             ),
             OpenApiParameter(name="type", description="Filter by post type (announcement, event, question, discussion, resource)", type=OpenApiTypes.STR),
             OpenApiParameter(name="search", description="Search term to filter posts by title or content", type=OpenApiTypes.STR),
+            OpenApiParameter(name="pagination", description="Set to 'cursor' to use keyset pagination (no total count) instead of page numbers", type=OpenApiTypes.STR, enum=["cursor"]),
+            OpenApiParameter(name="cursor", description="Cursor returned in the 'next' link of a keyset-paginated page", type=OpenApiTypes.STR),
         ],
         responses={200: PostSerializer(many=True)}
     ),
@@ -134,16 +139,18 @@ from ..services.post_service import PostService
         responses={204: None}
     ),
 )
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(OptionalKeysetPaginationMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing community posts.
     
     Allows listing, creating, retrieving, updating, and deleting posts within a community.
     Includes special actions for upvoting and pinning posts.
+    Pass ?pagination=cursor for keyset pagination suited to infinite scroll.
     """
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     permission_classes = [IsAuthenticatedOrReadOnly, IsPostAuthorOrCommunityAdminOrReadOnly]
+    keyset_pagination_class = PostKeysetPagination
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -159,6 +166,23 @@ class PostViewSet(viewsets.ModelViewSet):
             search=self.request.query_params.get('search')
         )
     
+    def list(self, request, *args, **kwargs):
+        """
+        List posts, loading the requesting user's upvotes and event participation
+        for the whole page up front so the serializer doesn't query per post.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        posts = page if page is not None else list(queryset)
+        
+        context = self.get_serializer_context()
+        context['viewer_state'] = PostService.get_viewer_state(request.user, posts)
+        
+        serializer = self.get_serializer(posts, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
     def create(self, request, *args, **kwargs):
         """Override create to add detailed debugging and error handling"""
         try:
@@ -372,25 +396,27 @@ class PostViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if user is already a participant
-        if post.event_participants.filter(id=user.id).exists():
+        # Reserve a seat and add the user to the participants
+        result = PostService.join_event(post, user)
+        if result.status == 'waitlisted':
             return Response(
-                {"detail": "You are already a participant in this event."},
-                status=status.HTTP_400_BAD_REQUEST
+                {
+                    "detail": result.message,
+                    "participant_count": result.participant_count,
+                    "waitlist_position": result.waitlist_position
+                },
+                status=status.HTTP_202_ACCEPTED
             )
-        
-        # Check if event is full
-        if post.event_participant_limit and post.event_participants.count() >= post.event_participant_limit:
+        if result.status != 'joined':
             return Response(
-                {"detail": "This event is full."},
+                {"detail": result.message, "waitlist_position": result.waitlist_position},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Add user to participants
-        post.event_participants.add(user)
+        send_event_post_join_confirmation(user, post)
         
         return Response(
-            {"detail": "You have successfully joined this event."},
+            {"detail": result.message, "participant_count": result.participant_count},
             status=status.HTTP_200_OK
         )
     
@@ -432,17 +458,60 @@ class PostViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Check if user is a participant
-        if not post.event_participants.filter(id=user.id).exists():
+        # Remove user from participants
+        left, message, participant_count, promoted_user_id = PostService.leave_event(post, user)
+        if not left:
             return Response(
-                {"detail": "You are not a participant in this event."},
+                {"detail": message},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Remove user from participants
-        post.event_participants.remove(user)
+        # The freed seat went to the head of the waitlist
+        if promoted_user_id is not None:
+            send_event_post_join_confirmation(get_user_model().objects.get(pk=promoted_user_id), post)
         
         return Response(
-            {"detail": "You have successfully left this event."},
+            {"detail": message, "participant_count": participant_count},
             status=status.HTTP_200_OK
-        )
\ No newline at end of file
+        )
+    
+    @extend_schema(
+        summary="Event post waitlist position",
+        description="Get your position on the waitlist of a full event post (null if you're not waiting)",
+        parameters=[
+            OpenApiParameter(
+                name="community_slug",
+                description="The unique slug of the community the post belongs to",
+                required=True,
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.PATH
+            ),
+            OpenApiParameter(
+                name="id",
+                description="The ID of the event post",
+                required=True,
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.PATH
+            ),
+        ],
+        responses={
+            200: OpenApiTypes.OBJECT,
+            400: OpenApiTypes.OBJECT
+        }
+    )
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated], url_path='waitlist')
+    def waitlist(self, request, pk=None, community_slug=None):
+        """Get the user's position on an event post's waitlist"""
+        post = self.get_object()
+        
+        if post.post_type != 'event':
+            return Response(
+                {"detail": "This post is not an event."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            "waitlist_position": PostService.get_waitlist_position(post, request.user),
+            "participant_count": post.participant_count,
+            "participant_limit": post.event_participant_limit
+        })
\ No newline at end of file
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'api',
     'communities',
     'events',
+    'notifications',
 ]
 
 MIDDLEWARE = [
@@ -168,6 +169,44 @@ CACHES = {
     }
 }
 
+# In-process cache tier in front of the default cache for hot community/post reads.
+# Entries are invalidated across workers through Redis pub/sub (see communities.utils.local_cache).
+COMMUNITIES_L1_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 2048,
+    'TIMEOUT': 30,  # seconds
+    'GENERATION_TIMEOUT': 5,  # seconds
+    'CHANNEL': 'communities:l1-invalidate',
+}
+
+# Upvote counters: 'database' updates the post/comment row on every upvote, 'redis' records
+# the deltas in Redis and flushes them in batches. With 'redis', something must run
+# manage.py flush_upvote_counters --loop (the counter-worker service in docker-compose.yml),
+# otherwise the deltas pile up in Redis and never reach the database.
+COMMUNITIES_UPVOTE_COUNTER_ENGINE = 'database'
+
+# Chat messages: 'sync' saves each WebSocket message before broadcasting it, 'write_behind'
+# broadcasts first and saves the messages in batches (see api.chat_persistence)
+CHAT_MESSAGE_PERSISTENCE = {
+    'MODE': 'sync',
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 0.05,  # seconds
+}
+
+# Typing indicators: a user starts typing at most once per INTERVAL in a room, and the
+# typing state ends on the server after EXPIRY without a refresh (see api.typing_indicator)
+CHAT_TYPING_INDICATOR = {
+    'INTERVAL': 3,  # seconds
+    'EXPIRY': 6,  # seconds
+}
+
+# Chat presence: who is online in a group, kept in a Redis sorted set per group scored by the
+# last heartbeat (in memory without the Redis channel layer, see api.presence)
+CHAT_PRESENCE = {
+    'TIMEOUT': 60,  # seconds without a heartbeat before a user is offline
+    'HEARTBEAT_INTERVAL': 20,  # seconds
+}
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
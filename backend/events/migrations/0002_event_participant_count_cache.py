@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:55
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(counted, fk):
+    counts = counted.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def backfill_participant_count_cache(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    EventParticipant = apps.get_model('events', 'EventParticipant')
+
+    Event.objects.update(participant_count_cache=count_of(EventParticipant.objects.all(), 'event'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='participant_count_cache',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Cached participant count for performance (null until computed)', null=True),
+        ),
+        migrations.RunPython(backfill_participant_count_cache, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0002_event_participant_count_cache'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventWaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='events.event')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_waitlist_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Event Waitlist Entry',
+                'verbose_name_plural': 'Event Waitlist Entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['event', 'id'], name='events_even_event_i_2c0973_idx')],
+                'unique_together': {('event', 'user')},
+            },
+        ),
+    ]
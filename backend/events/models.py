@@ -35,6 +35,14 @@ class Event(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Performance cache fields
+    participant_count_cache = models.PositiveIntegerField(
+        default=0,
+        null=True,
+        editable=False,
+        help_text="Cached participant count for performance (null until computed)"
+    )
+
     class Meta:
         ordering = ['-date_time']
         indexes = [
@@ -50,6 +58,8 @@ class Event(models.Model):
 
     @property
     def participant_count(self):
+        if self.participant_count_cache is not None:
+            return self.participant_count_cache
         return self.participants.count()
 
     @property
@@ -97,3 +107,34 @@ class EventParticipant(models.Model):
 
     def __repr__(self):
         return f"<EventParticipant user={self.user_id}, event={self.event_id}>"
+
+
+class EventWaitlistEntry(models.Model):
+    """
+    Model representing a user waiting for a seat at a full event.
+    Entries are served in id order.
+    """
+    event = models.ForeignKey(
+        Event,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='event_waitlist_entries'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        unique_together = ('event', 'user')
+        verbose_name = 'Event Waitlist Entry'
+        verbose_name_plural = 'Event Waitlist Entries'
+        indexes = [
+            # Finds the head of the waitlist and counts positions
+            models.Index(fields=['event', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} waiting for {self.event.title}"
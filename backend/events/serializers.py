@@ -4,8 +4,7 @@ from users.models import User
 from communities.models import Community, Membership
 from .models import Event, EventParticipant
 from users.serializers import UserSerializer 
-from django.core.mail import send_mail
-from django.conf import settings
+from .utils.email import send_event_updated_emails
 
 
 class EventSerializer(serializers.ModelSerializer):
@@ -104,37 +103,13 @@ class EventSerializer(serializers.ModelSerializer):
         return updated_instance
 
     def send_update_emails(self, event):
-        participants = EventParticipant.objects.filter(event=event).select_related("user")
-        subject = f"📢 Event Updated: {event.title}"
-
-        for participant in participants:
-            user = participant.user
-            if not user.email:
-                continue
-
-            message = (
-                f"Hi {user.first_name or user.username},\n\n"
-                f"The event you joined has been updated. Here are the new details:\n\n"
-                f"🗓 Title: {event.title}\n"
-                f"📅 Date & Time: {event.date_time.strftime('%Y-%m-%d %H:%M')}\n"
-                f"📍 Location: {event.location}\n\n"
-                f"📖 Description:\n{event.description}\n\n"
-                f"You can view this event at: {settings.FRONTEND_URL}/events/{event.id}\n\n"
-                f"Thank you,\nUniHub Team"
-            )
-
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=True,
-            )
+        send_event_updated_emails(event)
 
 
 class JoinEventSerializer(serializers.ModelSerializer):
     """
-    Serializer for joining an event.
+    Serializer validating a request to join an event.
+    The join itself is done by EventJoinService.join (see JoinEventView).
     """
 
     class Meta:
@@ -147,8 +122,7 @@ class JoinEventSerializer(serializers.ModelSerializer):
 
         if event.is_canceled:
             raise serializers.ValidationError("This event has been canceled.")
-        if event.is_full:
-            raise serializers.ValidationError("This event has reached its participant limit.")
+        # A full event isn't an error, the user joins its waitlist (see EventJoinService)
 
         if event.is_private:
             if not event.community:
@@ -168,12 +142,6 @@ class JoinEventSerializer(serializers.ModelSerializer):
 
         return attrs
 
-    def create(self, validated_data):
-        return EventParticipant.objects.create(
-            user=self.context.get('request').user,
-            **validated_data
-        )
-
 
 class MyEventSerializer(serializers.ModelSerializer):
     """
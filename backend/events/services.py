@@ -0,0 +1,42 @@
+from communities.services.seat_service import SeatConfig, SeatService
+from .models import Event, EventParticipant, EventWaitlistEntry
+
+
+class EventJoinService:
+    """
+    Joins and leaves events.
+
+    A seat is reserved with a conditional UPDATE of Event.participant_count_cache
+    and the participant is inserted in the same transaction, so a limited event
+    can't be overbooked by concurrent joins. Users joining a full event are put
+    on its waitlist, and promoted when a participant leaves (see SeatService).
+    """
+
+    SEATS = SeatConfig(
+        model=Event,
+        counter_field='participant_count_cache',
+        limit_field='participant_limit',
+        participant_model=EventParticipant,
+        waitlist_model=EventWaitlistEntry,
+        fk='event',
+    )
+
+    @staticmethod
+    def join(event, user):
+        """
+        Add the user to the event's participants, or to its waitlist if it's full.
+        Returns a JoinResult; event.participant_count_cache holds the new count.
+        """
+        return SeatService.join(EventJoinService.SEATS, event, user)
+
+    @staticmethod
+    def leave(event, user):
+        """
+        Remove the user from the event's participants or waitlist.
+        Returns a LeaveResult.
+        """
+        return SeatService.leave(EventJoinService.SEATS, event, user)
+
+    @staticmethod
+    def get_waitlist_position(event, user):
+        return SeatService.get_waitlist_position(EventJoinService.SEATS, event, user)
@@ -1,10 +1,39 @@
+from django.db.models import Q
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from communities.services.counter_service import CounterDefinition, CounterService
+from communities.utils.counters import apply_counter_deltas
 from .models import EventParticipant, Event
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Let update_cache_counters/reconcile_counters rebuild the participant counts too
+CounterService.register(CounterDefinition(
+    'participants', Event, 'participant_count_cache',
+    lambda: EventParticipant.objects.all(), 'event',
+    lambda since: Q(created_at__gte=since) | Q(pk__in=EventParticipant.objects.filter(
+        joined_at__gte=since).values('event_id')),
+))
+
+
+@receiver(post_save, sender=EventParticipant)
+def increment_event_participant_count(sender, instance, created, **kwargs):
+    """
+    Updates the participant count cache when a user joins an event.
+    """
+    if created and not getattr(instance, '_counted', False):
+        apply_counter_deltas(Event, 'participant_count_cache', {instance.event_id: 1})
+
+
+@receiver(post_delete, sender=EventParticipant)
+def decrement_event_participant_count(sender, instance, **kwargs):
+    """
+    Updates the participant count cache when a user leaves an event.
+    """
+    if not getattr(instance, '_counted', False):
+        apply_counter_deltas(Event, 'participant_count_cache', {instance.event_id: -1})
+
 
 @receiver(post_save, sender=EventParticipant)
 def log_event_join(sender, instance, created, **kwargs):
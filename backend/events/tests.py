@@ -1,13 +1,26 @@
-from django.test import TestCase
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections
 from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.urls import reverse
 from datetime import timedelta
 from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
 
 from communities.models import Community, Membership
-from events.models import Event, EventParticipant
+from communities.services.seat_service import SeatService
+from events.models import Event, EventParticipant, EventWaitlistEntry
+from events.services import EventJoinService
+from events.utils.email import send_event_cancelled_emails
+from notifications.models import OutboundEmail
+from notifications.services import OutboxService
 
 User = get_user_model()
 
@@ -179,3 +192,268 @@ class EventTestCase(TestCase):
         self.authenticate(self.member.email, 'memberpass')
         response = self.client.post(reverse('events:leave', args=[event.id]))
         self.assertEqual(response.status_code, 400)
+
+    def test_participant_count_cache_follows_joins(self):
+        """Joining and leaving keep the cached participant count up to date"""
+        event = Event.objects.create(
+            title="Counted",
+            description="Counted seats",
+            date_time=timezone.now() + timedelta(days=1),
+            location="Hall",
+            participant_limit=2,
+            created_by=self.admin
+        )
+        EventParticipant.objects.create(user=self.member, event=event)
+        participant = EventParticipant.objects.create(user=self.stranger, event=event)
+
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual(event.participant_count_cache, 2)
+        with self.assertNumQueries(0):
+            self.assertTrue(event.is_full)
+
+        participant.delete()
+        event.refresh_from_db()
+        self.assertEqual(event.participant_count, 1)
+        self.assertFalse(event.is_full)
+
+    def test_event_list_has_no_per_row_counts(self):
+        """The event list renders participant counts without a query per event"""
+        def count_list_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('events:list-create'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        def create_event(i):
+            event = Event.objects.create(
+                title=f"Event {i}",
+                description="Listed",
+                date_time=timezone.now() + timedelta(days=1),
+                location="Hall",
+                participant_limit=10,
+                created_by=self.admin
+            )
+            EventParticipant.objects.create(user=self.member, event=event)
+
+        create_event(0)
+        baseline = count_list_queries()
+        for i in range(1, 4):
+            create_event(i)
+        self.assertEqual(count_list_queries(), baseline)
+
+    def test_join_reserves_seats_up_to_the_limit(self):
+        """Joins beyond the participant limit go to the waitlist and leave the count intact"""
+        event = Event.objects.create(
+            title="Two Seats",
+            description="Limited",
+            date_time=timezone.now() + timedelta(days=1),
+            location="Hall",
+            participant_limit=2,
+            created_by=self.admin
+        )
+        result = EventJoinService.join(event, self.member)
+        self.assertEqual((result.status, result.participant_count), ('joined', 1))
+        self.assertEqual(event.participant_count_cache, 1)
+        self.assertEqual(EventJoinService.join(event, self.member).status, 'already_joined')
+
+        EventJoinService.join(event, self.stranger)
+        self.authenticate(self.admin.email, 'adminpass')
+        response = self.client.post(reverse('events:join', args=[event.id]))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['waitlist_position'], 1)
+
+        event.refresh_from_db()
+        self.assertEqual(event.participant_count_cache, 2)
+        self.assertEqual(EventParticipant.objects.filter(event=event).count(), 2)
+        self.assertEqual(EventJoinService.join(event, self.admin).status, 'already_waitlisted')
+
+    def test_leave_promotes_the_head_of_the_waitlist(self):
+        """A freed seat goes to the first user on the waitlist, in order"""
+        late = User.objects.create_user(
+            email='late@example.com', username='late',
+            first_name='Late', last_name='Four', password='latepass'
+        )
+        event = Event.objects.create(
+            title="One Seat",
+            description="Very limited",
+            date_time=timezone.now() + timedelta(days=1),
+            location="Booth",
+            participant_limit=1,
+            created_by=self.admin
+        )
+        EventJoinService.join(event, self.member)
+        self.assertEqual(EventJoinService.join(event, self.stranger).waitlist_position, 1)
+        self.assertEqual(EventJoinService.join(event, late).waitlist_position, 2)
+
+        self.authenticate(self.member.email, 'memberpass')
+        response = self.client.post(reverse('events:leave', args=[event.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['participant_count'], 1)
+
+        self.assertTrue(EventParticipant.objects.filter(event=event, user=self.stranger).exists())
+        self.assertEqual(EventJoinService.get_waitlist_position(event, late), 1)
+        self.assertIsNone(EventJoinService.get_waitlist_position(event, self.stranger))
+        event.refresh_from_db()
+        self.assertEqual(event.participant_count_cache, 1)
+
+        # Leaving the waitlist frees no seat
+        self.authenticate('late@example.com', 'latepass')
+        response = self.client.get(reverse('events:waitlist', args=[event.id]))
+        self.assertEqual(response.data['waitlist_position'], 1)
+        response = self.client.post(reverse('events:leave', args=[event.id]))
+        self.assertEqual(response.data['detail'], "You have left the waitlist for this event.")
+        self.assertFalse(EventWaitlistEntry.objects.filter(event=event).exists())
+        event.refresh_from_db()
+        self.assertEqual(event.participant_count_cache, 1)
+
+    def test_join_initializes_uncomputed_count(self):
+        """A join recounts a participant count that is not computed yet"""
+        event = Event.objects.create(
+            title="Uncounted",
+            description="Counted on join",
+            date_time=timezone.now() + timedelta(days=1),
+            location="Hall",
+            created_by=self.admin
+        )
+        EventParticipant.objects.create(user=self.member, event=event)
+        Event.objects.filter(pk=event.pk).update(participant_count_cache=None)
+
+        EventJoinService.join(event, self.stranger)
+        self.assertEqual(event.participant_count_cache, 2)
+
+    def test_interleaved_joins_do_not_overbook(self):
+        """
+        A join decides from the reserved seat count, not from the event it was
+        given: both joins load the event while the seat is free, and the one
+        that runs after the seat is reserved goes to the waitlist. This runs
+        on one connection, so it does not race two transactions; that is
+        ConcurrentEventJoinTestCase, run on PostgreSQL in CI.
+        """
+        event = Event.objects.create(
+            title="Last Seat",
+            description="One seat left",
+            date_time=timezone.now() + timedelta(days=1),
+            location="Hall",
+            participant_limit=1,
+            created_by=self.admin
+        )
+        first_view = Event.objects.get(pk=event.pk)
+        second_view = Event.objects.get(pk=event.pk)
+        add_participant = SeatService._add_participant
+        results = []
+
+        def add_participant_then_join(config, obj, user_id):
+            # The first join has reserved the seat and not added its
+            # participant yet; the second join still holds the stale event
+            if not results:
+                results.append(EventJoinService.join(second_view, self.stranger))
+            return add_participant(config, obj, user_id)
+
+        with mock.patch.object(SeatService, '_add_participant', add_participant_then_join):
+            first = EventJoinService.join(first_view, self.member)
+
+        self.assertEqual(first.status, 'joined')
+        self.assertEqual(results[0].status, 'waitlisted')
+        event.refresh_from_db()
+        self.assertEqual(event.participant_count_cache, 1)
+        self.assertEqual(list(EventParticipant.objects.filter(event=event).values_list('user_id', flat=True)), [self.member.id])
+        self.assertEqual(EventJoinService.get_waitlist_position(event, self.stranger), 1)
+
+    def test_cancel_queues_notices_in_bulk(self):
+        """Cancelling an event queues one notice per participant in a few bulk inserts"""
+        event = Event.objects.create(
+            title="Crowded",
+            description="Many people",
+            date_time=timezone.now() + timedelta(days=1),
+            location="Stadium",
+            created_by=self.admin
+        )
+        for i in range(25):
+            user = User.objects.create_user(
+                email=f'fan{i}@example.com', username=f'fan{i}',
+                first_name=f'Fan{i}', last_name='Five', password='fanpass'
+            )
+            EventParticipant.objects.create(user=user, event=event)
+
+        # One streamed select, then one insert per batch of 10
+        with mock.patch.object(OutboxService, 'BATCH_SIZE', 10), self.assertNumQueries(4):
+            self.assertEqual(send_event_cancelled_emails(event), 25)
+        OutboundEmail.objects.all().delete()
+
+        response = self.client.delete(reverse('events:detail', args=[event.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.count(), 25)
+
+        call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 25)
+        message = next(message for message in mail.outbox if message.to == ['fan3@example.com'])
+        self.assertTrue(message.body.startswith('Hi Fan3,'))
+        self.assertIn('Stadium', message.body)
+
+    def test_update_queues_notices(self):
+        """Changing the details of an event queues the new details to the participants"""
+        event = Event.objects.create(
+            title="Moving",
+            description="Changes place",
+            date_time=timezone.now() + timedelta(days=1),
+            location="Old Hall",
+            created_by=self.admin
+        )
+        EventParticipant.objects.create(user=self.member, event=event)
+
+        response = self.client.patch(reverse('events:detail', args=[event.id]), {'location': 'New Hall'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.to, [self.member.email])
+        self.assertIn('New Hall', email.body)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentEventJoinTestCase(TransactionTestCase):
+    """Joins racing for the last seats of an event must not overbook it"""
+
+    def test_concurrent_joins_do_not_overbook(self):
+        admin = User.objects.create_user(
+            email='host@example.com', username='host',
+            first_name='Host', last_name='User', password='hostpass'
+        )
+        users = [
+            User.objects.create_user(
+                email=f'racer{i}@example.com', username=f'racer{i}',
+                first_name='Racer', last_name=str(i), password='racerpass'
+            )
+            for i in range(12)
+        ]
+        event = Event.objects.create(
+            title="Sell Out",
+            description="Few seats",
+            date_time=timezone.now() + timedelta(days=1),
+            location="Arena",
+            participant_limit=5,
+            created_by=admin
+        )
+
+        barrier = threading.Barrier(len(users))
+        results = []
+
+        def join(user):
+            try:
+                barrier.wait()
+                results.append(EventJoinService.join(Event.objects.get(pk=event.pk), user).status)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=join, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        event.refresh_from_db()
+        self.assertEqual(results.count('joined'), 5)
+        self.assertEqual(results.count('waitlisted'), 7)
+        self.assertEqual(EventParticipant.objects.filter(event=event).count(), 5)
+        self.assertEqual(EventWaitlistEntry.objects.filter(event=event).count(), 7)
+        self.assertEqual(event.participant_count_cache, 5)
@@ -4,6 +4,7 @@ from .views import (
     EventDetailView,
     JoinEventView,
     LeaveEventView,
+    EventWaitlistView,
     MyEventsView,
 )
 
@@ -22,6 +23,9 @@ urlpatterns = [
     # 🔹 Leave a specific event
     path('<int:pk>/leave/', LeaveEventView.as_view(), name='leave'),
 
+    # 🔹 Current user's position on an event's waitlist
+    path('<int:pk>/waitlist/', EventWaitlistView.as_view(), name='waitlist'),
+
     # 🔹 List current user's joined events
     path('my/', MyEventsView.as_view(), name='my'),
 ]
@@ -1,6 +1,7 @@
-from django.core.mail import send_mail
 from django.conf import settings
 
+from notifications.services import OutboxService
+
 def send_event_join_confirmation(user, event):
     subject = f"You're Confirmed for {event.title} 🎉"
     message = f"""Hi {user.first_name},
@@ -14,10 +15,53 @@ You're confirmed for the event:
 See you there!
 UniHub Team
 """
-    send_mail(
+    OutboxService.enqueue(
         subject,
         message,
         settings.DEFAULT_FROM_EMAIL,
         [user.email],
-        fail_silently=False,
+    )
+
+
+def get_participant_recipients(event):
+    """Stream the (email, name) of an event's participants, without loading them all"""
+    participants = event.participants.exclude(user__email='').order_by('pk').values_list(
+        'user__email', 'user__first_name', 'user__username'
+    ).iterator(chunk_size=OutboxService.BATCH_SIZE)
+    return (
+        (email, first_name or username)
+        for email, first_name, username in participants
+    )
+
+
+def send_event_cancelled_emails(event):
+    """Queue the cancellation notice to every participant. Returns the number queued."""
+    subject = f"❌ Event Cancelled: {event.title}"
+    message = (
+        f"We regret to inform you that the event you joined has been cancelled:\n\n"
+        f"🗓 Title: {event.title}\n"
+        f"📅 Date & Time: {event.date_time.strftime('%Y-%m-%d %H:%M')}\n"
+        f"📍 Location: {event.location}\n\n"
+        f"We apologize for any inconvenience caused.\n\n"
+        f"Best regards,\nUniHub Team"
+    )
+    return OutboxService.enqueue_many(
+        subject, message, settings.DEFAULT_FROM_EMAIL, get_participant_recipients(event)
+    )
+
+
+def send_event_updated_emails(event):
+    """Queue the new details of an updated event to every participant. Returns the number queued."""
+    subject = f"📢 Event Updated: {event.title}"
+    message = (
+        f"The event you joined has been updated. Here are the new details:\n\n"
+        f"🗓 Title: {event.title}\n"
+        f"📅 Date & Time: {event.date_time.strftime('%Y-%m-%d %H:%M')}\n"
+        f"📍 Location: {event.location}\n\n"
+        f"📖 Description:\n{event.description}\n\n"
+        f"You can view this event at: {settings.FRONTEND_URL}/events/{event.id}\n\n"
+        f"Thank you,\nUniHub Team"
+    )
+    return OutboxService.enqueue_many(
+        subject, message, settings.DEFAULT_FROM_EMAIL, get_participant_recipients(event)
     )
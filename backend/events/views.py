@@ -2,11 +2,11 @@ from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, NotFound
 from rest_framework.views import APIView
-from .utils.email import send_event_join_confirmation
-from django.core.mail import send_mail
-from django.conf import settings
+from .utils.email import send_event_join_confirmation, send_event_cancelled_emails
+from django.contrib.auth import get_user_model
 
 from .models import Event, EventParticipant
+from .services import EventJoinService
 from .serializers import (
     EventSerializer,
     JoinEventSerializer,
@@ -66,32 +66,8 @@ class EventDetailView(generics.RetrieveUpdateDestroyAPIView):
         return [permissions.IsAuthenticated(), IsEventCreator()]  # Only creator can edit/delete
 
     def perform_destroy(self, instance):
-        # Fetch participants before deletion
-        participants = EventParticipant.objects.filter(event=instance).select_related("user")
-        subject = f"❌ Event Cancelled: {instance.title}"
-
-        for participant in participants:
-            user = participant.user
-            if not user.email:
-                continue
-
-            message = (
-                f"Hi {user.first_name or user.username},\n\n"
-                f"We regret to inform you that the event you joined has been cancelled:\n\n"
-                f"🗓 Title: {instance.title}\n"
-                f"📅 Date & Time: {instance.date_time.strftime('%Y-%m-%d %H:%M')}\n"
-                f"📍 Location: {instance.location}\n\n"
-                f"We apologize for any inconvenience caused.\n\n"
-                f"Best regards,\nUniHub Team"
-            )
-
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=True,
-            )
+        # Queue the notices before deletion, while the participants still exist
+        send_event_cancelled_emails(instance)
 
         # Now delete the event
         super().perform_destroy(instance)
@@ -114,12 +90,30 @@ class JoinEventView(APIView):
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        result = EventJoinService.join(event, request.user)
+
+        if result.status == 'waitlisted':
+            return Response(
+                {
+                    "detail": result.message,
+                    "participant_count": result.participant_count,
+                    "waitlist_position": result.waitlist_position,
+                },
+                status=status.HTTP_202_ACCEPTED
+            )
+        if result.status != 'joined':
+            return Response(
+                {"detail": result.message, "waitlist_position": result.waitlist_position},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         # ✅ Send confirmation email
         send_event_join_confirmation(request.user, event)
 
-        return Response({"detail": "Successfully joined the event."}, status=status.HTTP_201_CREATED)
+        return Response(
+            {"detail": "Successfully joined the event.", "participant_count": result.participant_count},
+            status=status.HTTP_201_CREATED
+        )
 
 
 class LeaveEventView(APIView):
@@ -134,19 +128,45 @@ class LeaveEventView(APIView):
         except Event.DoesNotExist:
             raise NotFound("Event not found.")
 
-        participation = EventParticipant.objects.filter(
-            event=event,
-            user=request.user
-        ).first()
-
-        if not participation:
+        result = EventJoinService.leave(event, request.user)
+        if result.status == 'not_joined':
             return Response(
                 {"detail": "You are not a participant of this event."},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if result.status == 'left_waitlist':
+            return Response(
+                {"detail": result.message, "participant_count": result.participant_count},
+                status=status.HTTP_200_OK
+            )
+
+        # The freed seat went to the head of the waitlist
+        if result.promoted_user_id is not None:
+            send_event_join_confirmation(get_user_model().objects.get(pk=result.promoted_user_id), event)
+
+        return Response(
+            {"detail": "You have left the event.", "participant_count": result.participant_count},
+            status=status.HTTP_200_OK
+        )
+
+
+class EventWaitlistView(APIView):
+    """
+    GET: The current user's position on the event's waitlist.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            event = Event.objects.get(pk=pk)
+        except Event.DoesNotExist:
+            raise NotFound("Event not found.")
 
-        participation.delete()
-        return Response({"detail": "You have left the event."}, status=status.HTTP_200_OK)
+        return Response({
+            "waitlist_position": EventJoinService.get_waitlist_position(event, request.user),
+            "participant_count": event.participant_count,
+            "participant_limit": event.participant_limit,
+        })
 
 
 class MyEventsView(generics.ListAPIView):
@@ -0,0 +1,17 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import OutboundEmail
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'to')
+    readonly_fields = ('created_at', 'sent_at', 'claimed_at', 'last_error')
+    date_hierarchy = 'created_at'
+    actions = ['retry']
+    
+    @admin.action(description="Retry the selected emails")
+    def retry(self, request, queryset):
+        queryset.exclude(status='sent').update(status='pending', attempts=0, next_attempt_at=timezone.now())
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.services import OutboxService
+
+
+class Command(BaseCommand):
+    help = 'Delivers the emails queued in the outbox, one SMTP connection per batch'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=OutboxService.BATCH_SIZE,
+            help='Number of emails sent over one connection'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, polling the outbox for new emails'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to wait between polls when the outbox is empty (with --loop)'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            sent, failed = OutboxService.send_queued(
+                batch_size=options['batch_size'],
+                progress=self.report_batch
+            )
+            if sent or failed or not options['loop']:
+                style = self.style.WARNING if failed else self.style.SUCCESS
+                self.stdout.write(style(
+                    f'Sent {sent} email(s), {failed} failed '
+                    f'({self.get_rate(sent + failed, time.monotonic() - started)}).'
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+    
+    def report_batch(self, batch, sent, failed, seconds):
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f'  batch {batch}: {sent} sent, {failed} failed in {seconds:.2f}s '
+            f'({self.get_rate(sent + failed, seconds)})'
+        ))
+    
+    def get_rate(self, emails, seconds):
+        return f'{emails / seconds:.1f} emails/s' if seconds > 0 else 'n/a'
@@ -0,0 +1,39 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting in the outbox. Rows are written in the transaction of the
+    request that sends the email and delivered by the send_queued_emails worker.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),
+    )
+    
+    subject = models.CharField(max_length=998)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(help_text="List of recipient addresses")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="Not delivered before this time (retry backoff)")
+    claimed_at = models.DateTimeField(null=True, blank=True, help_text="When a worker started sending it")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Outbound Email"
+        verbose_name_plural = "Outbound Emails"
+        indexes = [
+            # The worker picks the due pending emails
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
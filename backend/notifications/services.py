@@ -0,0 +1,179 @@
+import logging
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxService:
+    """
+    Service class for the transactional email outbox.
+    
+    Request code queues emails with `enqueue`, which only inserts a row, so the
+    email is sent if and only if the request's transaction commits. The
+    send_queued_emails worker claims due emails in batches and delivers each
+    batch over one SMTP connection. A failed email is retried with exponential
+    backoff, and moved to the dead status after MAX_ATTEMPTS.
+    """
+    
+    BATCH_SIZE = 100
+    MAX_ATTEMPTS = 5
+    RETRY_DELAY = 60  # seconds, doubled after each failed attempt
+    MAX_RETRY_DELAY = 3600
+    # An email claimed longer ago than this belongs to a worker that died mid-batch
+    CLAIM_TIMEOUT = 600
+    
+    @staticmethod
+    def enqueue(subject, message, from_email, recipient_list):
+        """Queue an email, with the arguments of send_mail. Returns the OutboundEmail."""
+        return OutboundEmail.objects.create(
+            subject=subject,
+            body=message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=list(recipient_list),
+        )
+    
+    @staticmethod
+    def enqueue_many(subject, message, from_email, recipients, greeting="Hi {name},\n\n", batch_size=None):
+        """
+        Queue one email per recipient for a notification sent to many users.
+        `recipients` is an iterable of (email, name), consumed batch_size at a time,
+        so it can stream from a queryset .iterator(). The message is rendered once;
+        only the greeting is added per recipient. Returns the number of emails queued.
+        """
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        batch_size = batch_size or OutboxService.BATCH_SIZE
+        recipients = iter(recipients)
+        queued = 0
+        while True:
+            emails = [
+                OutboundEmail(
+                    subject=subject,
+                    body=greeting.format(name=name) + message,
+                    from_email=from_email,
+                    to=[email],
+                )
+                for email, name in islice(recipients, batch_size)
+            ]
+            if not emails:
+                return queued
+            OutboundEmail.objects.bulk_create(emails)
+            queued += len(emails)
+    
+    @staticmethod
+    def get_retry_delay(attempts):
+        """Get the delay before the next attempt of an email that failed `attempts` times"""
+        delay = OutboxService.RETRY_DELAY * 2 ** (attempts - 1)
+        return timedelta(seconds=min(delay, OutboxService.MAX_RETRY_DELAY))
+    
+    @staticmethod
+    def claim_batch(batch_size=None):
+        """
+        Claim up to batch_size due emails by moving them to the sending status.
+        Rows locked by another worker are skipped, so workers can run side by side.
+        """
+        now = timezone.now()
+        stale = now - timedelta(seconds=OutboxService.CLAIM_TIMEOUT)
+        with transaction.atomic():
+            emails = list(OutboundEmail.objects.select_for_update(skip_locked=True).filter(
+                Q(status='pending', next_attempt_at__lte=now) |
+                Q(status='sending', claimed_at__lt=stale)
+            ).order_by('next_attempt_at', 'id')[:batch_size or OutboxService.BATCH_SIZE])
+            
+            OutboundEmail.objects.filter(
+                pk__in=[email.pk for email in emails]
+            ).update(status='sending', claimed_at=now)
+        return emails
+    
+    @staticmethod
+    def deliver(emails, connection=None):
+        """
+        Send the given emails over one connection and record the status of each.
+        Returns (sent, failed).
+        """
+        connection = connection or get_connection(fail_silently=False)
+        sent = failed = 0
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f"Could not connect to the email server: {str(e)}")
+            for email in emails:
+                OutboxService._record_failure(email, e)
+            return 0, len(emails)
+        
+        try:
+            for email in emails:
+                message = EmailMessage(
+                    email.subject, email.body, email.from_email, email.to,
+                    connection=connection,
+                )
+                try:
+                    message.send()
+                except Exception as e:
+                    logger.warning(f"Email {email.pk} failed: {str(e)}")
+                    OutboxService._record_failure(email, e)
+                    failed += 1
+                    # The server may have dropped the connection, start a new one
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        # The next send tries to connect again
+                        pass
+                    continue
+                
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status='sent',
+                    attempts=email.attempts + 1,
+                    sent_at=timezone.now(),
+                    last_error='',
+                )
+                sent += 1
+        finally:
+            connection.close()
+        return sent, failed
+    
+    @staticmethod
+    def _record_failure(email, error):
+        attempts = email.attempts + 1
+        if attempts >= OutboxService.MAX_ATTEMPTS:
+            status, next_attempt_at = 'dead', timezone.now()
+        else:
+            status, next_attempt_at = 'pending', timezone.now() + OutboxService.get_retry_delay(attempts)
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=status,
+            attempts=attempts,
+            next_attempt_at=next_attempt_at,
+            last_error=f"{type(error).__name__}: {error}",
+        )
+    
+    @staticmethod
+    def send_queued(batch_size=None, max_batches=None, progress=None):
+        """
+        Deliver the due emails batch by batch until none are left.
+        `progress` is called after each batch with (batch, sent, failed, seconds).
+        Returns (sent, failed).
+        """
+        sent = failed = batches = 0
+        while max_batches is None or batches < max_batches:
+            started = time.monotonic()
+            emails = OutboxService.claim_batch(batch_size)
+            if not emails:
+                break
+            batch_sent, batch_failed = OutboxService.deliver(emails)
+            sent += batch_sent
+            failed += batch_failed
+            batches += 1
+            if progress:
+                progress(batches, batch_sent, batch_failed, time.monotonic() - started)
+        return sent, failed
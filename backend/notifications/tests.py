@@ -0,0 +1,116 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from users.utils import send_otp_email
+from .models import OutboundEmail
+from .services import OutboxService
+
+
+class FlakyEmailBackend(EmailBackend):
+    """locmem backend that counts connections and rejects @fail.example.com recipients"""
+    
+    opened = 0
+    
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return super().open()
+    
+    def send_messages(self, messages):
+        for message in messages:
+            if any(address.endswith('@fail.example.com') for address in message.to):
+                raise ConnectionError('Recipient refused')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='notifications.tests.FlakyEmailBackend')
+class OutboxTests(TestCase):
+    """Tests for the email outbox and the send_queued_emails worker"""
+    
+    def setUp(self):
+        FlakyEmailBackend.opened = 0
+    
+    def send_queued(self, *args):
+        out = StringIO()
+        call_command('send_queued_emails', *args, stdout=out)
+        return out.getvalue()
+    
+    def test_emails_are_queued_not_sent(self):
+        send_otp_email('otp@example.com', '123456')
+        
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, 'pending')
+        self.assertEqual(email.to, ['otp@example.com'])
+        self.assertIn('123456', email.body)
+    
+    def test_worker_sends_a_batch_over_one_connection(self):
+        for i in range(5):
+            OutboxService.enqueue(f'Subject {i}', 'Body', None, [f'user{i}@example.com'])
+        
+        output = self.send_queued('--batch-size', '3')
+        
+        self.assertIn('Sent 5 email(s), 0 failed', output)
+        self.assertEqual([message.to for message in mail.outbox], [[f'user{i}@example.com'] for i in range(5)])
+        # Two batches, one connection each
+        self.assertEqual(FlakyEmailBackend.opened, 2)
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+        self.assertFalse(OutboundEmail.objects.filter(sent_at__isnull=True).exists())
+        
+        # Nothing is sent twice
+        self.send_queued()
+        self.assertEqual(len(mail.outbox), 5)
+    
+    def test_failed_email_is_retried_with_backoff(self):
+        OutboxService.enqueue('Hello', 'Body', None, ['user@fail.example.com'])
+        OutboxService.enqueue('Hello', 'Body', None, ['user@example.com'])
+        
+        self.assertIn('Sent 1 email(s), 1 failed', self.send_queued())
+        
+        failed = OutboundEmail.objects.get(to=['user@fail.example.com'])
+        self.assertEqual(failed.status, 'pending')
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('Recipient refused', failed.last_error)
+        self.assertGreater(failed.next_attempt_at, timezone.now())
+        self.assertEqual(OutboundEmail.objects.get(to=['user@example.com']).status, 'sent')
+        
+        # Not retried before its backoff is over
+        self.assertIn('Sent 0 email(s), 0 failed', self.send_queued())
+        
+        OutboundEmail.objects.filter(pk=failed.pk).update(next_attempt_at=timezone.now())
+        self.send_queued()
+        failed.refresh_from_db()
+        self.assertEqual(failed.attempts, 2)
+        self.assertEqual(
+            OutboxService.get_retry_delay(2),
+            2 * OutboxService.get_retry_delay(1)
+        )
+    
+    def test_email_is_dead_after_max_attempts(self):
+        email = OutboxService.enqueue('Hello', 'Body', None, ['user@fail.example.com'])
+        OutboundEmail.objects.filter(pk=email.pk).update(attempts=OutboxService.MAX_ATTEMPTS - 1)
+        
+        self.send_queued()
+        
+        email.refresh_from_db()
+        self.assertEqual(email.status, 'dead')
+        self.assertEqual(email.attempts, OutboxService.MAX_ATTEMPTS)
+        self.assertEqual(OutboxService.claim_batch(), [])
+    
+    def test_stale_claim_is_reclaimed(self):
+        email = OutboxService.enqueue('Hello', 'Body', None, ['user@example.com'])
+        self.assertEqual(OutboxService.claim_batch(), [email])
+        
+        # Claimed by a worker that is still sending
+        self.assertEqual(OutboxService.claim_batch(), [])
+        
+        # The worker died
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            claimed_at=timezone.now() - timedelta(seconds=OutboxService.CLAIM_TIMEOUT + 1)
+        )
+        self.assertEqual(OutboxService.claim_batch(), [email])
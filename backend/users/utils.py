@@ -1,12 +1,13 @@
 import random
 import string
 from django.core.cache import cache
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 
+from notifications.services import OutboxService
+
 
 def generate_otp(length=6):
     """Generate a random OTP of specified length"""
@@ -38,16 +39,15 @@ def verify_otp(email, otp):
 
 
 def send_otp_email(email, otp):
-    """Send OTP to user's email"""
+    """Queue the OTP email to the user"""
     subject = 'Uni Hub - Email Verification OTP'
     message = f'Your OTP for email verification is: {otp}\nThis OTP is valid for 5 minutes.'
     
-    return send_mail(
+    return OutboxService.enqueue(
         subject=subject,
         message=message,
         from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[email],
-        fail_silently=False,
     )
 
 
@@ -59,14 +59,13 @@ def generate_password_reset_token(user):
 
 
 def send_password_reset_email(user, reset_url):
-    """Send password reset link to user's email"""
+    """Queue the password reset link email to the user"""
     subject = 'Uni Hub - Reset Your Password'
     message = f'Click the link below to reset your password:\n\n{reset_url}\n\nThis link is valid for 24 hours.'
     
-    return send_mail(
+    return OutboxService.enqueue(
         subject=subject,
         message=message,
         from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[user.email],
-        fail_silently=False,
     )
\ No newline at end of file
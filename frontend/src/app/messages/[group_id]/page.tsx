@@ -6,7 +6,8 @@ import { useAuth } from "@/contexts/AuthContext";
 import { useUser } from "@/contexts/UserContext";
 
 interface Message {
-  id: number;
+  id: number | null;
+  client_id?: string;
   sender: { id: number; username: string; full_name: string };
   content: string;
   created_at: string;
@@ -23,12 +24,15 @@ const GroupMessagesPage = () => {
   const { isAuthenticated } = useAuth();
   const { user } = useUser();
   const [messages, setMessages] = useState<Message[]>([]);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const [groupInfo, setGroupInfo] = useState<GroupInfo | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [input, setInput] = useState("");
   const [sending, setSending] = useState(false);
   const [isTyping, setIsTyping] = useState(false);
+  const [onlineIds, setOnlineIds] = useState<number[]>([]);
   const [connectionStatus, setConnectionStatus] = useState<
     "connecting" | "connected" | "disconnected"
   >("connecting");
@@ -69,7 +73,9 @@ const GroupMessagesPage = () => {
           baseApi.get(`/api/messages/`, { params: { group: group_id } }),
           baseApi.get(`/api/message-groups/${group_id}/`),
         ]);
-        setMessages(messagesRes.data);
+        // The history is paged: the latest messages, oldest first
+        setMessages(messagesRes.data.results);
+        setHasOlder(messagesRes.data.has_more);
         setGroupInfo(groupInfoRes.data);
       } catch (err: any) {
         setError("Failed to load chat data.");
@@ -89,6 +95,7 @@ const GroupMessagesPage = () => {
     const maxRetries = 5;
     let ws: WebSocket | null = null;
     let reconnectTimer: NodeJS.Timeout | null = null;
+    let heartbeatTimer: NodeJS.Timeout | null = null;
 
     // Get token from different sources
     const getToken = (): string | null => {
@@ -169,6 +176,11 @@ const GroupMessagesPage = () => {
           setError(null);
           setConnectionStatus("connected");
           retryCount = 0; // Reset retry count on successful connection
+
+          // Join the group's presence and get who is online; the heartbeat
+          // interval comes with the list
+          ws?.send(JSON.stringify({ type: "heartbeat" }));
+          ws?.send(JSON.stringify({ type: "presence" }));
         };
 
         ws.onmessage = (event) => {
@@ -178,9 +190,27 @@ const GroupMessagesPage = () => {
             // Handle different message types
             if (data.type === "typing") {
               setIsTyping(data.user_id !== user?.id && data.typing);
+            } else if (data.type === "presence.online") {
+              setOnlineIds(data.user_ids);
+              if (heartbeatTimer) clearInterval(heartbeatTimer);
+              heartbeatTimer = setInterval(() => {
+                if (ws && ws.readyState === WebSocket.OPEN) {
+                  ws.send(JSON.stringify({ type: "heartbeat" }));
+                }
+              }, data.heartbeat_interval * 1000);
+            } else if (data.type === "presence") {
+              setOnlineIds((prev) =>
+                data.online
+                  ? [data.user_id, ...prev.filter((id) => id !== data.user_id)]
+                  : prev.filter((id) => id !== data.user_id)
+              );
             } else if (data.content) {
-              // Regular message
-              setMessages((prev) => [...prev, data]);
+              // Regular message, ignoring a copy of one already shown (resent by its sender)
+              setMessages((prev) =>
+                data.client_id && prev.some((m) => m.client_id === data.client_id)
+                  ? prev
+                  : [...prev, data]
+              );
               setIsTyping(false);
             }
           } catch (err) {
@@ -195,10 +225,20 @@ const GroupMessagesPage = () => {
         ws.onclose = (event) => {
           console.log(`WebSocket closed with code ${event.code}`);
           setConnectionStatus("disconnected");
+          if (heartbeatTimer) {
+            clearInterval(heartbeatTimer);
+            heartbeatTimer = null;
+          }
 
           // Don't retry for normal closure
           if (event.code === 1000) return;
 
+          // Not (or no longer) a member of this group, or not logged in
+          if (event.code === 4003 || event.code === 4001) {
+            setError("You don't have access to this conversation.");
+            return;
+          }
+
           // Retry with exponential backoff
           const retryDelay = Math.min(1000 * 2 ** retryCount, 10000);
           retryCount++;
@@ -235,6 +275,9 @@ const GroupMessagesPage = () => {
       if (reconnectTimer) {
         clearTimeout(reconnectTimer);
       }
+      if (heartbeatTimer) {
+        clearInterval(heartbeatTimer);
+      }
       if (socketRef.current) {
         // Use proper close code for intentional closure
         socketRef.current.close(1000, "Component unmounting");
@@ -297,12 +340,30 @@ const GroupMessagesPage = () => {
     }, 300); // Debounce typing events by 300ms
   }, [group_id, user]);
 
-  // Scroll to latest message with improved handling
+  // Load the page of messages before the oldest one shown
+  const loadOlderMessages = useCallback(async () => {
+    if (!messages.length || loadingOlder) return;
+    setLoadingOlder(true);
+    try {
+      const res = await baseApi.get(`/api/messages/`, {
+        params: { group: group_id, before: messages[0].id },
+      });
+      setMessages((prev) => [...res.data.results, ...prev]);
+      setHasOlder(res.data.has_more);
+    } catch (err) {
+      console.error("Error fetching older messages:", err);
+    } finally {
+      setLoadingOlder(false);
+    }
+  }, [messages, loadingOlder, group_id]);
+
+  // Scroll to latest message with improved handling (not when older ones are prepended)
+  const lastMessageId = messages[messages.length - 1]?.id;
   useEffect(() => {
     if (messagesEndRef.current) {
       messagesEndRef.current.scrollIntoView({ behavior: "smooth" });
     }
-  }, [messages]);
+  }, [lastMessageId]);
 
   // Auto-focus input on mount
   useEffect(() => {
@@ -333,6 +394,7 @@ const GroupMessagesPage = () => {
         const msg = {
           content: input.trim(), // Ensure content is properly set and trimmed
           group_id: group_id,
+          client_id: crypto.randomUUID(), // Lets the server save a resent message once
         };
 
         console.log("Sending message:", JSON.stringify(msg));
@@ -475,6 +537,7 @@ const GroupMessagesPage = () => {
               {groupInfo?.members?.length
                 ? `${groupInfo.members.length} members`
                 : "Loading members..."}
+              {onlineIds.length > 0 && ` · ${onlineIds.length} online`}
             </p>
           </div>
         </div>
@@ -541,6 +604,17 @@ const GroupMessagesPage = () => {
           </div>
         ) : (
           <>
+            {hasOlder && (
+              <div className="flex justify-center">
+                <button
+                  onClick={loadOlderMessages}
+                  disabled={loadingOlder}
+                  className="text-sm text-blue-600 hover:underline disabled:text-gray-400"
+                >
+                  {loadingOlder ? "Loading..." : "Load earlier messages"}
+                </button>
+              </div>
+            )}
             {Object.entries(groupedMessages).map(([date, dateMessages]) => (
               <div key={date} className="space-y-4">
                 <div className="flex items-center">
@@ -559,7 +633,7 @@ const GroupMessagesPage = () => {
 
                   return (
                     <div
-                      key={msg.id || msg.created_at}
+                      key={msg.id || msg.client_id || msg.created_at}
                       className={`flex ${
                         isMe ? "justify-end" : "justify-start"
                       } ${showAvatar ? "mt-3" : "mt-1"}`}